@@ -356,7 +356,13 @@ __ebd_process_metadata() {
 		unset __mode
 		local __data
 		local __ret
-		__ebd_read_size "$1" __data
+		if [[ $1 == batch ]]; then
+			# batched request; the env was already read off the fd.
+			__data=${PKGCORE_METADATA_BATCH[$3]}
+			unset PKGCORE_METADATA_BATCH
+		else
+			__ebd_read_size "$1" __data
+		fi
 		local IFS=$'\0'
 		eval "$__data"
 		__ret=$?
@@ -423,6 +429,14 @@ __ebd_main_loop() {
 				__ebd_write_line "preload_eclass ${success}"
 				unset e x success
 				;;
+			preload_eclass_snapshot\ *)
+				# snapshots are syntax checked when written.
+				if source "${com#preload_eclass_snapshot }" >&2; then
+					__ebd_write_line "preload_eclass_snapshot succeeded"
+				else
+					__ebd_write_line "preload_eclass_snapshot failed"
+				fi
+				;;
 			clear_preloaded_eclasses)
 				unset PKGCORE_PRELOADED_ECLASSES
 				declare -A PKGCORE_PRELOADED_ECLASSES
@@ -443,6 +457,24 @@ __ebd_main_loop() {
 					__ebd_write_line "phases failed"
 				fi
 				;;
+			gen_metadata_batch\ *)
+				# read every env up front so the fd is free for inherit
+				# requests while sourcing.
+				line=${com#gen_metadata_batch }
+				PKGCORE_METADATA_BATCH=()
+				for (( x=0; x < line; x++ )); do
+					__ebd_read_line com
+					__ebd_read_size "${com}" "PKGCORE_METADATA_BATCH[${x}]"
+				done
+				for (( x=0; x < line; x++ )); do
+					if __ebd_process_metadata batch depend ${x}; then
+						__ebd_write_line "phases succeeded"
+					else
+						__ebd_write_line "phases failed"
+					fi
+				done
+				unset PKGCORE_METADATA_BATCH x
+				;;
 			alive)
 				__ebd_write_line "yep!"
 				;;
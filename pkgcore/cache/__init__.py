@@ -14,11 +14,124 @@ import operator
 
 from snakeoil import klass
 from snakeoil.compatibility import raise_from
+from snakeoil.demandload import demandload
 from snakeoil.mappings import (
     ProtectedDict, autoconvert_py3k_methods_metaclass, make_SlottedDict_kls)
 
 from pkgcore.cache import errors
 from pkgcore.ebuild.const import metadata_keys
+from pkgcore.log import logger
+
+demandload('threading')
+
+
+class _WriteBehind(object):
+
+    """
+    queue of serialized cache updates written out by a background thread
+
+    Updates are keyed by cpv, so repeated writes of an entry before it's
+    flushed collapse into one.  Updates failing to be written are logged
+    and handed to on_error, if given, rather than raised.
+    """
+
+    def __init__(self, cache, queue_size, on_error=None):
+        self.cache = cache
+        self.queue_size = queue_size
+        self.on_error = on_error
+        # forked children inherit the queue but not the thread flushing it.
+        self.pid = os.getpid()
+        # cpv -> serialized values, or None for a deletion.
+        self.pending = {}
+        # the batch currently being written out.
+        self.inflight = {}
+        # number of callers waiting in flush().
+        self.flushing = 0
+        self.closing = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name='cache write-behind')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _threshold(self):
+        # don't wait for a full queue, or writers stall until it's drained.
+        return max(1, min(self.cache.sync_rate, self.queue_size // 2))
+
+    def put(self, cpv, values):
+        with self.cond:
+            while len(self.pending) >= self.queue_size and cpv not in self.pending:
+                self.cond.notify_all()
+                self.cond.wait()
+            self.pending[cpv] = values
+            if len(self.pending) >= self._threshold():
+                self.cond.notify_all()
+
+    def get(self, cpv):
+        """Return (found, values) for an update not yet on disk."""
+        with self.cond:
+            for updates in (self.pending, self.inflight):
+                if cpv in updates:
+                    return True, updates[cpv]
+        return False, None
+
+    def flush(self):
+        """Wait till everything queued so far is written out."""
+        with self.cond:
+            self.flushing += 1
+            self.cond.notify_all()
+            try:
+                while self.pending or self.inflight:
+                    self.cond.wait()
+            finally:
+                self.flushing -= 1
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self.cond:
+                self.closing = True
+                self.cond.notify_all()
+            self.thread.join()
+
+    def _run(self):
+        cache = self.cache
+        while True:
+            with self.cond:
+                while not (self.closing or (self.pending and (
+                        self.flushing or len(self.pending) >= self._threshold()))):
+                    self.cond.wait()
+                if self.closing:
+                    return
+                self.inflight, self.pending = self.pending, {}
+                # room for writers again.
+                self.cond.notify_all()
+            for cpv, values in sorted(self.inflight.iteritems()):
+                try:
+                    if values is None:
+                        try:
+                            cache._delitem(cpv)
+                        except KeyError:
+                            pass
+                    else:
+                        cache._setitem(cpv, values)
+                except Exception as e:
+                    self._failed(cpv, e)
+            if not cache.autocommits:
+                try:
+                    cache._commit()
+                except Exception as e:
+                    # none of the batch made it to disk.
+                    for cpv in sorted(self.inflight):
+                        self._failed(cpv, e)
+            with self.cond:
+                self.inflight = {}
+                self.cond.notify_all()
+
+    def _failed(self, cpv, error):
+        logger.warning("caught cache error writing %s: %s", cpv, error)
+        if self.on_error is not None:
+            self.on_error(cpv, error)
 
 
 class base(object):
@@ -62,7 +175,12 @@ class base(object):
         self._chf_deserializer = self._get_chf_deserializer(self.chf_type)
         self._known_keys |= frozenset([self._chf_key])
         self._cdict_kls = make_SlottedDict_kls(self._known_keys)
+        # values of these are interned as entries are loaded; LICENSE, SLOT,
+        # deps of sibling versions and the like recur across many entries.
+        self._interned_keys = self._known_keys.difference(
+            ('_eclasses_', self._chf_key))
         self.readonly = readonly
+        self._write_behind = None
         self.set_sync_rate(self.default_sync_rate)
         self.updates = 0
 
@@ -96,8 +214,15 @@ class base(object):
             l.append((chf, self._get_chf_deserializer(chf)))
         return tuple(l)
 
+    def _get_write_behind(self):
+        wb = self._write_behind
+        if wb is not None and wb.pid != os.getpid():
+            return None
+        return wb
+
     def _sync_if_needed(self, increment=False):
-        if self.autocommits:
+        if self.autocommits or self._get_write_behind() is not None:
+            # write-behind commits after each batch it writes.
             return
         if increment:
             self.updates += 1
@@ -113,7 +238,18 @@ class base(object):
         handles it, they can override it.
         """
         self._sync_if_needed()
-        d = self._getitem(cpv)
+        found, d = False, None
+        wb = self._get_write_behind()
+        if wb is not None:
+            found, d = wb.get(cpv)
+        if not found:
+            d = self._getitem(cpv)
+        elif d is None:
+            raise KeyError(cpv)
+        else:
+            known = self._known_keys
+            d = self._cdict_kls((k, v) for k, v in d.iteritems() if k in known)
+            d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
         if "_eclasses_" in d:
             d["_eclasses_"] = self.reconstruct_eclasses(cpv, d["_eclasses_"])
         return d
@@ -144,7 +280,12 @@ class base(object):
             d["_eclasses_"] = self.deconstruct_eclasses(d["_eclasses_"])
 
         d[self._chf_key] = self._chf_serializer(d.pop('_chf_'))
-        self._setitem(cpv, d)
+        wb = self._get_write_behind()
+        if wb is not None:
+            # detach from values; the caller is free to modify it afterwards.
+            wb.put(cpv, dict(d.iteritems()))
+        else:
+            self._setitem(cpv, d)
         self._sync_if_needed(True)
 
     def _setitem(self, name, values):
@@ -163,7 +304,17 @@ class base(object):
         """
         if self.readonly:
             raise errors.ReadOnly()
-        self._delitem(cpv)
+        wb = self._get_write_behind()
+        if wb is not None:
+            found, values = wb.get(cpv)
+            if found:
+                if values is None:
+                    raise KeyError(cpv)
+            elif cpv not in self:
+                raise KeyError(cpv)
+            wb.put(cpv, None)
+        else:
+            self._delitem(cpv)
         self._sync_if_needed(True)
 
     def _delitem(self, cpv):
@@ -204,7 +355,45 @@ class base(object):
         if rate == 0:
             self.commit()
 
+    def set_write_behind(self, queue_size=0, on_error=None):
+        """Control writing updates out from a background thread.
+
+        While enabled, updates are queued and written in batches once
+        :obj:`sync_rate` of them are pending, so the caller doesn't wait on
+        the filesystem.  Lookups via ``cache[cpv]`` see queued updates;
+        membership tests and iteration don't till they're flushed.  Each
+        update is written as atomically as the backend normally does.
+        :obj:`commit` waits for the queue to drain.  Updates failing to be
+        written don't abort the others; each is logged as a warning instead.
+
+        :param queue_size: maximum number of pending updates before writers
+            block; 0 flushes the queue and disables write-behind.
+        :param on_error: callable invoked (from the writer thread) with the
+            cpv and exception of each update failing to be written
+        """
+        wb, self._write_behind = self._get_write_behind(), None
+        if wb is not None:
+            wb.close()
+        if queue_size:
+            if self.readonly:
+                raise errors.ReadOnly()
+            self._write_behind = _WriteBehind(self, queue_size, on_error)
+
     def commit(self, force=False):
+        """Flush queued updates and write out any uncommitted state.
+
+        :param force: passed to the backend; see :obj:`_commit`
+        """
+        wb = self._get_write_behind()
+        if wb is not None:
+            wb.flush()
+        self._commit(force=force)
+
+    def _commit(self, force=False):
+        """commit calls this after flushing write-behind updates.
+
+        override it in derived classes that don't autocommit.
+        """
         if not self.autocommits:
             raise NotImplementedError
 
@@ -310,7 +499,7 @@ class bulk(base):
         del self.data[key]
         self._pending_updates.append((key, None))
 
-    def commit(self, force=False):
+    def _commit(self, force=False):
         if self._pending_updates or force:
             self._write_data()
             self._pending_updates = []
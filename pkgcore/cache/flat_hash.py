@@ -11,7 +11,7 @@ import errno
 import os
 import stat
 
-from snakeoil.compatibility import raise_from
+from snakeoil.compatibility import intern, raise_from
 from snakeoil.fileutils import readlines_ascii
 from snakeoil.osutils import pjoin
 
@@ -51,9 +51,12 @@ class database(fs_template.FsBased):
     def _parse_data(self, data, mtime):
         d = self._cdict_kls()
         known = self._known_keys
+        interned = self._interned_keys
         for x in data:
             k, v = x.split("=", 1)
-            if k in known:
+            if k in interned:
+                d[k] = intern(v)
+            elif k in known:
                 d[k] = v
 
         if self._mtime_used:
@@ -127,7 +130,9 @@ class database(fs_template.FsBased):
         while dirs:
             d = dirs.pop(0)
             for l in os.listdir(d):
-                if l.endswith(".cpickle"):
+                # dotfiles are in progress updates or bookkeeping, such as
+                # the regen journal; never entries.
+                if l.endswith(".cpickle") or l.startswith("."):
                     continue
                 p = pjoin(d, l)
                 st = os.lstat(p)
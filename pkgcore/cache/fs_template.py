@@ -5,7 +5,7 @@
 template for fs based backends
 """
 
-__all__ = ("FsBased",)
+__all__ = ("FsBased", "writable_location")
 
 import os
 
@@ -74,3 +74,14 @@ class FsBased(base):
         else:
             path = self.location
         return ensure_dirs(path, mode=0775, minimal=False)
+
+
+def writable_location(caches):
+    """Return the location of the first writable fs based cache, or None.
+
+    Useful for bookkeeping that needs to live and die with a cache.
+    """
+    for cache in caches:
+        if isinstance(cache, FsBased) and not cache.readonly:
+            return cache.location
+    return None
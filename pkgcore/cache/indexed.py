@@ -0,0 +1,300 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+single file, offset indexed backend
+"""
+
+__all__ = ("database",)
+
+import errno
+import fcntl
+import mmap
+import os
+import threading
+
+from snakeoil.compatibility import intern, raise_from
+from snakeoil.osutils import pjoin
+
+from pkgcore.cache import fs_template, errors
+from pkgcore.config import ConfigHint
+
+
+class database(fs_template.FsBased):
+
+    """
+    stores all cache entries in one append only file, indexed by cpv
+
+    Each record is a header line of the form ``cpv length`` followed by
+    ``length`` bytes of key=value lines; a length of -1 marks the cpv as
+    deleted.  The file is memory mapped and its record headers are scanned
+    once, so a lookup is a dict probe and a slice instead of an
+    open/read/close per cpv.  Records superseded by later writes are
+    dropped by :meth:`commit` once they make up enough of the file, and a
+    partial record left by a writer that died is dropped by the next write.
+    """
+
+    pkgcore_config_type = ConfigHint(
+        {'readonly': 'bool', 'location': 'str', 'label': 'str',
+         'auxdbkeys': 'list'},
+        required=['location'],
+        positional=['location'],
+        typename='cache')
+
+    autocommits = True
+    eclass_chf_types = ('eclassdir', 'mtime')
+
+    filename = 'entries'
+    magic = 'pkgcore-indexed-cache 1\n'
+    # fraction of the file that has to be dead records before commit rewrites it
+    compaction_ratio = 0.5
+
+    def __init__(self, *args, **config):
+        super(database, self).__init__(*args, **config)
+        self.path = pjoin(self.location, self.filename)
+        self._lock = threading.Lock()
+        self._map = None
+        self._file_id = None
+        self._index = {}
+        self._scanned = 0
+        self._garbage = 0
+
+    def _reset(self):
+        if self._map:
+            self._map.close()
+        self._map = None
+        self._file_id = None
+        self._index = {}
+        self._scanned = 0
+        self._garbage = 0
+
+    def _load(self):
+        """(Re)map the file, scanning any records not yet indexed."""
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise_from(errors.GeneralCacheCorruption(e))
+            self._reset()
+            self._map = ''
+            return
+        try:
+            st = os.fstat(fd)
+            file_id = (st.st_dev, st.st_ino)
+            if file_id != self._file_id:
+                # new file, or it was compacted out from under us.
+                self._reset()
+                self._file_id = file_id
+            elif st.st_size == len(self._map):
+                return
+            if st.st_size:
+                new_map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            else:
+                new_map = ''
+        finally:
+            os.close(fd)
+        if self._map:
+            self._map.close()
+        self._map = new_map
+        if not self._scanned and new_map:
+            if new_map[:len(self.magic)] != self.magic:
+                raise errors.GeneralCacheCorruption(
+                    "%s isn't an indexed cache file" % (self.path,))
+            self._scanned = len(self.magic)
+        self._scan()
+
+    def _scan(self):
+        data = self._map
+        index = self._index
+        end = len(data)
+        pos = self._scanned
+        while pos < end:
+            eol = data.find('\n', pos)
+            if eol == -1:
+                # partial write from another process; pick it up later.
+                break
+            try:
+                cpv, length = data[pos:eol].split(' ')
+                length = int(length)
+            except ValueError:
+                raise errors.GeneralCacheCorruption(
+                    "invalid record header at offset %i of %s" % (pos, self.path))
+            start = eol + 1
+            if start + max(length, 0) > end:
+                break
+            old = index.pop(cpv, None)
+            if old is not None:
+                self._garbage += old[1] - old[2]
+            if length < 0:
+                self._garbage += start - pos
+                pos = start
+            else:
+                index[cpv] = (start, start + length, pos)
+                pos = start + length
+        self._scanned = pos
+
+    def _lookup(self, cpv):
+        if self._map is None:
+            self._load()
+        entry = self._index.get(cpv)
+        if entry is None:
+            # possibly written by another process since we last looked.
+            self._load()
+            entry = self._index.get(cpv)
+        return entry
+
+    def _getitem(self, cpv):
+        with self._lock:
+            entry = self._lookup(cpv)
+            if entry is None:
+                raise KeyError(cpv)
+            if entry[1] > len(self._map):
+                self._load()
+            data = self._map[entry[0]:entry[1]]
+        try:
+            return self._parse_data(data)
+        except ValueError as e:
+            raise_from(errors.CacheCorruption(cpv, e))
+
+    def _parse_data(self, data):
+        d = self._cdict_kls()
+        known = self._known_keys
+        interned = self._interned_keys
+        for x in data.splitlines():
+            k, v = x.split("=", 1)
+            if k in interned:
+                d[k] = intern(v)
+            elif k in known:
+                d[k] = v
+        d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+        return d
+
+    def _open_locked(self):
+        """Open the file for appending, holding an exclusive lock on it.
+
+        Retries if the file was replaced by a compaction while we waited on
+        the lock, since anything appended to the old file would be lost.
+        """
+        while True:
+            try:
+                fd = os.open(
+                    self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, self._perms)
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT or not self._ensure_dirs():
+                    raise_from(errors.GeneralCacheCorruption(e))
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                st = os.fstat(fd)
+                if os.path.samestat(st, os.stat(self.path)):
+                    if not st.st_size:
+                        self._ensure_access(self.path)
+                        self._write(fd, self.magic)
+                    return fd
+            except EnvironmentError as e:
+                os.close(fd)
+                if e.errno != errno.ENOENT:
+                    raise_from(errors.GeneralCacheCorruption(e))
+                continue
+            os.close(fd)
+
+    @staticmethod
+    def _write(fd, data):
+        while data:
+            data = data[os.write(fd, data):]
+
+    def _append(self, cpv, payload):
+        if payload is None:
+            record = "%s -1\n" % (cpv,)
+        else:
+            record = "%s %i\n%s" % (cpv, len(payload), payload)
+        fd = self._open_locked()
+        try:
+            # index everything up to our record so the bookkeeping below
+            # stays accurate.
+            self._load()
+            if os.fstat(fd).st_size > self._scanned:
+                # a partial record left by a writer that died; nobody else
+                # is writing while we hold the lock, so it'll never be
+                # completed.  Drop it, or our record would be misread.
+                os.ftruncate(fd, self._scanned)
+                if self._map:
+                    self._map.close()
+                self._map = ''
+            self._write(fd, record)
+        except EnvironmentError as e:
+            raise_from(errors.CacheCorruption(cpv, e))
+        finally:
+            os.close(fd)
+        # our own record is picked up lazily by the next _load; update the
+        # index now so reads in this process see it immediately.
+        pos = self._scanned
+        old = self._index.pop(cpv, None)
+        if old is not None:
+            self._garbage += old[1] - old[2]
+        if payload is None:
+            self._garbage += len(record)
+        else:
+            start = pos + len(record) - len(payload)
+            self._index[cpv] = (start, pos + len(record), pos)
+        self._scanned = pos + len(record)
+
+    def _setitem(self, cpv, values):
+        payload = ''.join("%s=%s\n" % (k, v) for k, v in values.iteritems())
+        with self._lock:
+            self._append(cpv, payload)
+
+    def _delitem(self, cpv):
+        with self._lock:
+            if self._lookup(cpv) is None:
+                raise KeyError(cpv)
+            self._append(cpv, None)
+
+    def __contains__(self, cpv):
+        with self._lock:
+            return self._lookup(cpv) is not None
+
+    def iterkeys(self):
+        with self._lock:
+            self._load()
+            return iter(list(self._index))
+
+    def _commit(self, force=False):
+        """Rewrite the file without dead records if enough have piled up.
+
+        :param force: if True, compact regardless of the amount of dead data.
+        """
+        if self.readonly:
+            return
+        with self._lock:
+            self._load()
+            if not self._garbage:
+                return
+            if not force and self._garbage < self._scanned * self.compaction_ratio:
+                return
+            fd = self._open_locked()
+            try:
+                self._load()
+                self._compact()
+            finally:
+                os.close(fd)
+            self._load()
+
+    def _compact(self):
+        tmp_path = pjoin(self.location, ".update.%i.%s" % (os.getpid(), self.filename))
+        data = self._map
+        try:
+            with open(tmp_path, 'w', 32768) as f:
+                f.write(self.magic)
+                # keep file order so concurrent readers scanning it see
+                # the same layout they'd build themselves.
+                for start, end, pos in sorted(self._index.itervalues()):
+                    f.write(data[pos:end])
+            self._ensure_access(tmp_path)
+            os.rename(tmp_path, self.path)
+        except EnvironmentError as e:
+            try:
+                os.remove(tmp_path)
+            except EnvironmentError:
+                pass
+            raise_from(errors.GeneralCacheCorruption(e))
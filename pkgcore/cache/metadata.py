@@ -13,7 +13,7 @@ import errno
 import os
 
 from snakeoil.osutils import pjoin
-from snakeoil.compatibility import raise_from
+from snakeoil.compatibility import intern, raise_from
 from snakeoil.mappings import ProtectedDict
 
 from pkgcore.cache import flat_hash, errors
@@ -79,8 +79,9 @@ class database(flat_hash.database):
 
     def _parse_data(self, data, mtime):
         i = iter(self.hardcoded_auxdbkeys_processing)
-        d = self._cdict_kls([(key, val) for (key, val) in
-            izip(i, data) if key])
+        interned = self._interned_keys
+        d = self._cdict_kls([(key, intern(val) if key in interned else val)
+            for (key, val) in izip(i, data) if key])
         # sadly, this is faster then doing a .next() and snagging the
         # exception
         for x in i:
@@ -22,6 +22,8 @@ except ImportError:
 PKGCORE_BASE_PATH  = osp.dirname(osp.abspath(__file__))
 SYSTEM_CONF_FILE   = '/etc/pkgcore.conf'
 USER_CONF_FILE     = osp.expanduser('~/.pkgcore.conf')
+USER_CACHE_PATH    = osp.join(
+    os.environ.get('XDG_CACHE_HOME') or osp.expanduser('~/.cache'), 'pkgcore')
 
 SANDBOX_BINARY     = '/usr/bin/sandbox'
 BASH_BINARY        = find_binary('bash')
@@ -0,0 +1,167 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+shared storage of the per cpv indexes kept alongside an ebuild repo's cache
+"""
+
+__all__ = ("AppendLog",)
+
+import errno
+import fcntl
+import os
+
+from snakeoil.osutils import ensure_dirs
+
+from pkgcore.log import logger
+
+
+class AppendLog(object):
+
+    """
+    mapping of cpv to a record, persisted as an append only log
+
+    Each line is a record as formatted by :meth:`_format`, or ``-cpv``
+    marking a removed one; later lines win.  Updates are single appends, so
+    writers never need the log loaded; :meth:`commit` rewrites it once
+    superseded lines dominate it.  Appends and rewrites hold an exclusive
+    flock on the log, so lines appended by other processes aren't lost.
+
+    Derivatives implement :meth:`_parse` and :meth:`_format`, and may keep
+    their own lookups in sync via :meth:`_loaded` and :meth:`_forget`.
+    """
+
+    # named in warnings about malformed lines.
+    description = 'index'
+
+    def __init__(self, path):
+        self.path = path
+        # cpv -> record; loaded on first query.
+        self._records = None
+        self._log_len = 0
+
+    @staticmethod
+    def _parse(line):
+        """Return the (cpv, record) pair of a line, raising ValueError if bad."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _format(cpv, record):
+        """Return the line storing record."""
+        raise NotImplementedError
+
+    def _loaded(self):
+        """Hook run once :attr:`_records` was loaded."""
+
+    def _load(self):
+        if self._records is not None:
+            return
+        records = {}
+        self._log_len = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    self._log_len += 1
+                    line = line.rstrip('\n')
+                    if line.startswith('-'):
+                        records.pop(line[1:], None)
+                        continue
+                    try:
+                        cpv, record = self._parse(line)
+                    except ValueError:
+                        logger.warning(
+                            "ignoring malformed line in %s %r: %r",
+                            self.description, self.path, line)
+                        continue
+                    records[cpv] = record
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        self._records = records
+        self._loaded()
+
+    def _open_locked(self):
+        """Open the log for appending, holding an exclusive lock on it.
+
+        Retries if the log was replaced by a :meth:`commit` while we waited on
+        the lock, since anything appended to the old file would be lost.
+        """
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        while True:
+            try:
+                fd = os.open(self.path, flags, 0664)
+            except EnvironmentError as e:
+                # the cache dir may not exist yet if its writes are queued.
+                if e.errno != errno.ENOENT or not ensure_dirs(os.path.dirname(self.path)):
+                    raise
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.path.samestat(os.fstat(fd), os.stat(self.path)):
+                    return fd
+            except EnvironmentError as e:
+                os.close(fd)
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            os.close(fd)
+
+    def _append(self, line):
+        fd = self._open_locked()
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        self._log_len += 1
+
+    def _forget(self, cpv):
+        """Drop the loaded record of cpv, if any."""
+        return self._records.pop(cpv, None)
+
+    def discard(self, cpv):
+        """Note that a cpv's cache entry was removed."""
+        self._append("-%s\n" % (cpv,))
+        if self._records is not None:
+            self._forget(cpv)
+
+    def __contains__(self, cpv):
+        self._load()
+        return cpv in self._records
+
+    def __iter__(self):
+        self._load()
+        return iter(self._records)
+
+    def __len__(self):
+        self._load()
+        return len(self._records)
+
+    def commit(self, force=False):
+        """Rewrite the log without superseded lines, if enough have piled up.
+
+        :param force: rewrite it regardless
+        """
+        fd = self._open_locked()
+        try:
+            # reload under the lock to pick up anything other processes
+            # appended; they'll block until the rewritten log is in place.
+            self._records = None
+            self._load()
+            records = self._records
+            if not force and self._log_len <= 2 * len(records):
+                return
+            tmp_path = "%s.update.%i" % (self.path, os.getpid())
+            try:
+                with open(tmp_path, 'w') as f:
+                    for cpv, record in sorted(records.iteritems()):
+                        f.write(self._format(cpv, record))
+                os.rename(tmp_path, self.path)
+            except EnvironmentError:
+                try:
+                    os.remove(tmp_path)
+                except EnvironmentError:
+                    pass
+                raise
+        finally:
+            os.close(fd)
+        self._log_len = len(records)
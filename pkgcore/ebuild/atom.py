@@ -20,6 +20,7 @@ from snakeoil.klass import (
 
 from pkgcore.ebuild import cpv, errors, restricts
 from pkgcore.restrictions import values, packages, boolean
+from pkgcore.util.interning import InternCache
 
 demandload(
     'pkgcore.restrictions.packages:Conditional,AndRestriction@PkgAndRestriction',
@@ -46,6 +47,10 @@ valid_use_chars = frozenset(valid_use_chars)
 valid_repo_chars = frozenset(valid_repo_chars)
 valid_slot_chars = frozenset(valid_slot_chars)
 
+# recently parsed atoms, reused by the factories EAPI.atom_kls hands out for
+# depset parsing; the same few thousand recur across every depset.
+atom_cache = InternCache(8192)
+
 
 def native_init(self, atom, negate_vers=False, eapi=-1):
     """
@@ -399,6 +404,11 @@ class atom(boolean.AndRestriction):
 
     weak_blocker = alias_attr("blocks_temp_ignorable")
 
+    @property
+    def pinned_key(self):
+        """(category, package) of the packages this atom can match"""
+        return self.category, self.package
+
     def __repr__(self):
         if self.op == '=*':
             atom = "=%s*" % self.cpvstr
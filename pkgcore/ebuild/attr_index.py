@@ -0,0 +1,328 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+persisted inverted index of selected metadata keys of cache entries
+
+Lets restrictions on license, keywords, iuse, inherited eclasses, description
+words, and the cat/pkg of dependency atoms be answered for the whole repo
+without loading each package's metadata.  Tokens are taken from the raw cache
+entries across all USE conditionals, so the cpvs the index yields for a
+restriction are a superset of the actual matches; they're still matched
+normally afterwards.
+
+Each dependency atom is also kept along with the attribute and USE
+conditionals it appears under, serving as a reverse dependency index.
+"""
+
+__all__ = ("AttrIndex", "index_path", "entry_tokens", "dep_edges")
+
+import re
+
+from snakeoil.compatibility import intern
+from snakeoil.demandload import demandload
+from snakeoil.osutils import pjoin
+
+from pkgcore.cache.fs_template import writable_location
+from pkgcore.ebuild.append_log import AppendLog
+from pkgcore.ebuild.cpv import versioned_CPV
+from pkgcore.ebuild.errors import InvalidCPV
+from pkgcore.restrictions import boolean, packages, values
+
+demandload('pkgcore.ebuild:restricts')
+
+_word_re = re.compile(r'\w+', re.U)
+_literal_re = re.compile(r'^\w+$', re.U)
+
+# package attr -> index key for restrictions containment matched against
+# the attr.
+_containment_attrs = {
+    'license': 'license',
+    'keywords': 'keywords',
+    'iuse': 'iuse',
+    'inherited': 'inherited',
+}
+_dep_keys = (
+    ('DEPEND', 'depends'),
+    ('RDEPEND', 'rdepends'),
+    ('PDEPEND', 'post_rdepends'),
+)
+_dep_attrs = frozenset(attr for key, attr in _dep_keys)
+
+_index_keys = ('license', 'keywords', 'iuse', 'inherited', 'description', 'deps')
+
+
+def index_path(caches):
+    """Find where the attr index for a set of caches should live.
+
+    :return: path, or None if no writable fs based cache exists
+    """
+    location = writable_location(caches)
+    if location is None:
+        return None
+    return pjoin(location, '.attr-index')
+
+
+def _depset_tokens(s):
+    for token in s.split():
+        if token in ('(', ')', '||') or token[-1] == '?':
+            continue
+        yield token
+
+
+def dep_edges(data):
+    """Extract the dependency atoms of a metadata cache entry.
+
+    :return: list of (attr, atom string, conditionals) tuples, attr being one
+        of depends, rdepends or post_rdepends and conditionals the tuple of
+        USE conditionals (``flag`` or ``!flag``) the atom is nested in
+    :raise ValueError: if the dependencies are malformed
+    """
+    edges = []
+    for key, attr in _dep_keys:
+        # conditional (or None) of each open paren.
+        conds = []
+        pending = None
+        for token in data.get(key, '').split():
+            if token[-1] == '?':
+                pending = token[:-1]
+            elif token == '(':
+                conds.append(pending)
+                pending = None
+            elif token == ')':
+                if not conds:
+                    raise ValueError("unbalanced parens in %s" % (key,))
+                conds.pop()
+            elif token != '||':
+                edges.append((attr, token, tuple(x for x in conds if x)))
+        if conds:
+            raise ValueError("unbalanced parens in %s" % (key,))
+    return edges
+
+
+def _dep_key(token):
+    token = token.lstrip('!')
+    versioned = token[:1] in '<>=~'
+    token = token.lstrip('<>=~').split('[', 1)[0].split(':', 1)[0]
+    if versioned:
+        return versioned_CPV(token.rstrip('*')).key
+    return token
+
+
+def entry_tokens(data):
+    """Extract the indexed tokens from a metadata cache entry.
+
+    Keys whose tokens can't be determined are left out, marking them as
+    unknown for the entry.
+
+    :return: dict of index key to frozenset of tokens
+    """
+    tokens = {
+        'license': frozenset(_depset_tokens(data.get('LICENSE', ''))),
+        'keywords': frozenset(data.get('KEYWORDS', '').split()),
+        'iuse': frozenset(data.get('IUSE', '').split()),
+        'inherited': frozenset(data.get('_eclasses_', ())),
+        'description': frozenset(
+            _word_re.findall(data.get('DESCRIPTION', '').lower())),
+    }
+    try:
+        edges = dep_edges(data)
+        tokens['deps'] = frozenset(_dep_key(x[1]) for x in edges)
+    except (InvalidCPV, ValueError):
+        pass
+    else:
+        tokens['revdeps'] = frozenset(
+            '|'.join((attr, dep, ','.join(conds))) for attr, dep, conds in edges)
+    return tokens
+
+
+class AttrIndex(AppendLog):
+
+    """
+    mapping of index key and token to the cpvs whose cache entry has it
+
+    Each cpv's record also holds the ebuild mtime and inherited eclass mtimes
+    of the cache entry it was taken from; records not matching the current
+    state are treated as unknown, and never exclude a package.  They're
+    stored as ``cpv<tab>mtime<tab>eclass:mtime ...<tab>key=token token...``
+    lines of the log.
+    """
+
+    description = 'attr index'
+
+    def __init__(self, path):
+        AppendLog.__init__(self, path)
+        # records are (mtime, eclasses, tokens); (key, token) -> cpvs is
+        # built along with them.
+        self._users = None
+
+    def _loaded(self):
+        self._users = {}
+        for cpv, record in self._records.iteritems():
+            self._add_users(cpv, record[2])
+
+    @staticmethod
+    def _parse(line):
+        fields = line.split('\t')
+        cpv, mtime, eclasses = fields[:3]
+        eclasses = tuple(
+            (name, float(eclass_mtime)) for name, eclass_mtime in
+            (x.rsplit(':', 1) for x in eclasses.split()))
+        tokens = {}
+        for field in fields[3:]:
+            key, sep, vals = field.partition('=')
+            if not sep:
+                raise ValueError(field)
+            tokens[key] = frozenset(intern(x) for x in vals.split())
+        return cpv, (float(mtime), eclasses, tokens)
+
+    @staticmethod
+    def _format(cpv, record):
+        mtime, eclasses, tokens = record
+        return "%s\t%r\t%s\t%s\n" % (
+            cpv, mtime,
+            ' '.join('%s:%r' % x for x in eclasses),
+            '\t'.join('%s=%s' % (key, ' '.join(sorted(vals)))
+                      for key, vals in sorted(tokens.iteritems())))
+
+    @staticmethod
+    def _iter_users_keys(tokens):
+        for key in _index_keys:
+            vals = tokens.get(key)
+            if vals is None:
+                # unknown tokens; tracked under a None token.
+                yield key, None
+            else:
+                for val in vals:
+                    yield key, val
+
+    def _add_users(self, cpv, tokens):
+        users = self._users
+        for x in self._iter_users_keys(tokens):
+            users.setdefault(x, set()).add(cpv)
+
+    def _forget(self, cpv):
+        record = AppendLog._forget(self, cpv)
+        if record is not None:
+            for x in self._iter_users_keys(record[2]):
+                self._users[x].discard(cpv)
+
+    def update(self, cpv, mtime, data):
+        """Record a cpv's freshly written or validated cache entry.
+
+        :param mtime: ebuild mtime the entry is valid for
+        :param data: the cache entry; its ``_eclasses_`` must map eclass names
+            to their eclass cache entries
+        """
+        eclasses = tuple(sorted(
+            (name, float(eclass.mtime))
+            for name, eclass in data.get('_eclasses_', {}).iteritems()))
+        record = (float(mtime), eclasses, entry_tokens(data))
+        self._append(self._format(cpv, record))
+        if self._records is not None:
+            self._forget(cpv)
+            self._records[cpv] = record
+            self._add_users(cpv, record[2])
+
+    def is_current(self, cpv, mtime, eclass_cache):
+        """Is cpv's record valid for the given ebuild mtime and eclasses?"""
+        self._load()
+        record = self._records.get(cpv)
+        if record is None or record[0] != mtime:
+            return False
+        eclasses = eclass_cache.eclasses
+        for name, eclass_mtime in record[1]:
+            eclass = eclasses.get(name)
+            if eclass is None or float(eclass.mtime) != eclass_mtime:
+                return False
+        return True
+
+    def users(self, key, *tokens):
+        """Return the cpvs whose record has any of the tokens for key.
+
+        Records lacking key entirely are included, since their tokens are
+        unknown.
+        """
+        self._load()
+        users = self._users
+        ret = set(users.get((key, None), ()))
+        for token in tokens:
+            ret.update(users.get((key, token), ()))
+        return frozenset(ret)
+
+    def tokens(self, key):
+        """Return all indexed tokens for key."""
+        self._load()
+        return frozenset(
+            token for (k, token), cpvs in self._users.iteritems()
+            if k == key and token is not None and cpvs)
+
+    def candidates(self, restrict):
+        """Return the cpvs that may match restrict, or None if unanswerable.
+
+        Packages whose record isn't current (see :meth:`is_current`) may
+        match regardless of the returned set.
+        """
+        if restrict.negate:
+            return None
+        if isinstance(restrict, packages.PackageRestriction):
+            if restrict.conditional:
+                return None
+            return self._attr_candidates(restrict.attr, restrict.restriction)
+        if type(restrict) not in (boolean.AndRestriction, boolean.OrRestriction) \
+                or restrict.type != packages.package_type:
+            return None
+        results = [self.candidates(x) for x in restrict.restrictions]
+        if isinstance(restrict, boolean.AndRestriction):
+            results = [x for x in results if x is not None]
+            if not results:
+                return None
+            return frozenset.intersection(*results)
+        if not results or None in results:
+            return None
+        return frozenset.union(*results)
+
+    def _attr_candidates(self, attr, restrict):
+        if restrict.negate:
+            return None
+        key = _containment_attrs.get(attr)
+        if key is not None:
+            if not isinstance(restrict, values.ContainmentMatch2):
+                return None
+            if restrict.all:
+                return frozenset.intersection(
+                    *[self.users(key, x) for x in restrict.vals])
+            return self.users(key, *restrict.vals)
+        elif attr == 'description':
+            if not isinstance(restrict, values.StrRegex) or \
+                    not _literal_re.match(restrict.regex):
+                return None
+            # the literal has to be within a single word of the description.
+            literal = restrict.regex.lower()
+            return self.users('description', *[
+                x for x in self.tokens('description') if literal in x])
+        elif attr in _dep_attrs:
+            if not isinstance(restrict, restricts.AnyDepMatch):
+                return None
+            return self.users('deps', *restrict.keys)
+        return None
+
+    def dep_edges(self, cpv, key):
+        """Return the dependency atoms of cpv's record on a cat/pkg.
+
+        :return: list of (attr, atom string, conditionals) as
+            :obj:`dep_edges` returns, or None if they're unknown
+        """
+        self._load()
+        record = self._records.get(cpv)
+        if record is None:
+            return None
+        edges = record[2].get('revdeps')
+        if edges is None:
+            return None
+        l = []
+        for edge in edges:
+            attr, dep, conds = edge.split('|')
+            if _dep_key(dep) == key:
+                l.append((attr, dep, tuple(conds.split(',')) if conds else ()))
+        return l
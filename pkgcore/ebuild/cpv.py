@@ -5,7 +5,8 @@
 
 """gentoo ebuild specific base package class"""
 
-__all__ = ("CPV", "versioned_CPV", "unversioned_CPV")
+__all__ = ("CPV", "versioned_CPV", "unversioned_CPV", "ver_sort_key",
+           "cpv_sort_key", "cpv_sort_keys", "sorted_cpvs")
 
 from itertools import izip
 
@@ -15,6 +16,7 @@ from snakeoil.klass import inject_richcmp_methods_from_cmp
 
 from pkgcore.ebuild.errors import InvalidCPV
 from pkgcore.package import base
+from pkgcore.util.interning import InternCache, InterningMeta
 
 # do this to break the cycle.
 demandload("pkgcore.ebuild:atom")
@@ -322,6 +324,76 @@ def cpy_ver_cmp(ver1, rev1, ver2, rev2):
     return cmp(rev1, rev2)
 
 
+def ver_sort_key(version, revision):
+    """Return a key ordering versions the same as :func:`ver_cmp` does.
+
+    Keys compare as plain tuples, so sorting many versions by key parses
+    each one once instead of on every comparison.
+    """
+    if version is None:
+        return ()
+    parts = version.split("_")
+    ver_parts = parts[0].split(".")
+    letter = -1
+    if ver_parts[-1][-1].isalpha():
+        letter = ord(ver_parts[-1][-1])
+        ver_parts[-1] = ver_parts[-1][:-1]
+    # components with a leading 0 compare as strings, trailing 0s stripped;
+    # they're always lower than those without, which compare as ints.
+    ver_parts = tuple(
+        (0, x.rstrip("0")) if x[0] == "0" else (1, int(x)) for x in ver_parts)
+    suffixes = []
+    for suffix in parts[1:]:
+        match = suffix_regexp.match(suffix)
+        suffixes.append(
+            (suffix_value[match.group(1)], int("0" + match.group(2))))
+    # a missing suffix compares as 0 against the other's (nonzero) value.
+    suffixes.append((0,))
+    return ver_parts, letter, tuple(suffixes), revision or 0
+
+
+def cpv_sort_key(pkg):
+    """Return a key ordering cpvs, versioned or not, as comparing them does."""
+    return pkg.category, pkg.package, ver_sort_key(pkg.version, pkg.revision)
+
+
+def cpv_sort_keys(pkgs):
+    """Return the :func:`cpv_sort_key` of each of pkgs, in order.
+
+    Each distinct version is only parsed once.
+    """
+    ver_keys = {}
+    keys = []
+    for pkg in pkgs:
+        ver = pkg.version, pkg.revision
+        ver_key = ver_keys.get(ver)
+        if ver_key is None:
+            ver_key = ver_keys[ver] = ver_sort_key(*ver)
+        keys.append((pkg.category, pkg.package, ver_key))
+    return keys
+
+
+def sorted_cpvs(iterable, reverse=False):
+    """Sort cpvs by precomputed keys rather than pairwise comparison.
+
+    Anything lacking cpv attributes, such as the category and package names
+    repos also sort with their sorter, falls back to :func:`sorted`.
+    """
+    l = list(iterable)
+    try:
+        keys = cpv_sort_keys(l)
+    except AttributeError:
+        return sorted(l, reverse=reverse)
+    order = sorted(xrange(len(l)), key=keys.__getitem__, reverse=reverse)
+    return [l[i] for i in order]
+
+sorted_cpvs.merge_order = (cpv_sort_key, False)
+
+
+# recently parsed cpvs, shared by the vdb, binpkg and ebuild repos listing them.
+cpv_cache = InternCache(8192)
+
+
 def mk_cpv_cls(base_cls):
     class CPV(base.base, base_cls):
 
@@ -341,9 +413,8 @@ def mk_cpv_cls(base_cls):
         __slots__ = ()
 
         inject_richcmp_methods_from_cmp(locals())
-#       __metaclass__ = WeakInstMeta
-
-#       __inst_caching__ = True
+        __metaclass__ = InterningMeta
+        __intern_cache__ = cpv_cache
 
         def __repr__(self):
             return '<%s cpvstr=%s @%#8x>' % (
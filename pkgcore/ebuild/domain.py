@@ -25,7 +25,6 @@ from pkgcore.config import ConfigHint
 import pkgcore.config.domain
 from pkgcore.config.errors import BaseError
 from pkgcore.ebuild import const
-from pkgcore.ebuild.atom import atom as _atom
 from pkgcore.ebuild.misc import (
     ChunkedDataDict, chunked_data, collapsed_restrict_to_data,
     incremental_expansion, incremental_expansion_license,
@@ -35,14 +34,15 @@ from pkgcore.ebuild.repo_objs import OverlayedLicenses
 from pkgcore.repository import multiplex, visibility
 from pkgcore.restrictions import packages, values
 from pkgcore.restrictions.delegated import delegate
+from pkgcore.restrictions.index import RestrictionIndex
 from pkgcore.util.parserestrict import parse_match
 
 demandload(
-    'collections:defaultdict',
     'errno',
     'operator:itemgetter',
     're',
     'snakeoil.process:get_proc_count',
+    'pkgcore.ebuild:processor@ebuild_processor',
     'pkgcore.ebuild.triggers:generate_triggers@ebuild_generate_triggers',
     'pkgcore.fs.livefs:iter_scan',
 )
@@ -67,23 +67,11 @@ def package_env_splitter(basedir, val):
     return parse_match(val[0]), local_source(pjoin(basedir, val[1]))
 
 
-def apply_mask_filter(globs, atoms, pkg, mode):
-    # mode is ignored; non applicable.
-    for r in chain(globs, atoms.get(pkg.key, ())):
-        if r.match(pkg):
-            return True
-    return False
-
-
 def make_mask_filter(masks, negate=False):
-    atoms = defaultdict(list)
-    globs = []
-    for m in masks:
-        if isinstance(m, _atom):
-            atoms[m.key].append(m)
-        else:
-            globs.append(m)
-    return delegate(partial(apply_mask_filter, globs, atoms), negate=negate)
+    # a plain OR; the filtering repo compiles it, dispatching atoms by
+    # category/package instead of trying each in turn.
+    return packages.OrRestriction(
+        disable_inst_caching=True, negate=negate, *masks)
 
 
 def generate_filter(masks, unmasks, *extra):
@@ -124,6 +112,8 @@ class domain(pkgcore.config.domain.domain):
     for _thing in ('root', 'CHOST', 'CBUILD', 'CTARGET', 'CFLAGS', 'PATH',
                    'PORTAGE_TMPDIR', 'DISTCC_PATH', 'DISTCC_DIR', 'CCACHE_DIR'):
         _types[_thing] = 'str'
+    for _thing in ('ebd_max_processors', 'ebd_max_idle', 'ebd_max_uses'):
+        _types[_thing] = 'int'
 
     # TODO this is missing defaults
     pkgcore_config_type = ConfigHint(
@@ -179,6 +169,17 @@ class domain(pkgcore.config.domain.domain):
 
         self.ebuild_hook_dir = settings.pop("ebuild_hook_dir", None)
 
+        # limits for the ebuild processor pool; see
+        # pkgcore.ebuild.processor.configure_processor_pool.
+        pool_limits = dict(
+            (k, settings.pop('ebd_' + k, None))
+            for k in ('max_processors', 'max_idle', 'max_uses'))
+        if any(v is not None for v in pool_limits.itervalues()):
+            try:
+                ebuild_processor.configure_processor_pool(**pool_limits)
+            except ValueError as e:
+                raise Failure(str(e))
+
         for key, val, action in (
             ("package.mask", pkg_masks, parse_match),
             ("package.unmask", pkg_unmasks, parse_match),
@@ -304,6 +305,7 @@ class domain(pkgcore.config.domain.domain):
                 raise Failure(
                     'user-specified bashrc %r does not exist' % (data,))
             self.bashrcs.append((packages.AlwaysTrue, source))
+        self.bashrcs = RestrictionIndex(self.bashrcs)
 
         # stack use stuff first, then profile.
         self.enabled_use = ChunkedDataDict()
@@ -394,7 +396,8 @@ class domain(pkgcore.config.domain.domain):
 
     def make_license_filter(self, master_license, pkg_licenses):
         """Generates a restrict that matches iff the licenses are allowed."""
-        return delegate(partial(self.apply_license_filter, master_license, pkg_licenses))
+        return delegate(partial(
+            self.apply_license_filter, master_license, RestrictionIndex(pkg_licenses)))
 
     def apply_license_filter(self, master_licenses, pkg_licenses, pkg, mode):
         """Determine if a package's license is allowed."""
@@ -403,9 +406,8 @@ class domain(pkgcore.config.domain.domain):
         # pairs, maybe change this down the line?
 
         matched_pkg_licenses = []
-        for atom, licenses in pkg_licenses:
-            if atom.match(pkg):
-                matched_pkg_licenses += licenses
+        for licenses in pkg_licenses.iter_matches(pkg):
+            matched_pkg_licenses += licenses
 
         raw_accepted_licenses = master_licenses + matched_pkg_licenses
         license_manager = getattr(pkg.repo, 'licenses', self.default_licenses_manager)
@@ -448,7 +450,7 @@ class domain(pkgcore.config.domain.domain):
             #f = self.incremental_apply_keywords_filter
         else:
             f = self.apply_keywords_filter
-        return delegate(partial(f, data, profile_keywords))
+        return delegate(partial(f, data, RestrictionIndex(profile_keywords)))
 
     @staticmethod
     def incremental_apply_keywords_filter(data, pkg, mode):
@@ -462,9 +464,8 @@ class domain(pkgcore.config.domain.domain):
         # note we ignore mode; keywords aren't influenced by conditionals.
         # note also, we're not using a restriction here.  this is faster.
         pkg_keywords = pkg.keywords
-        for atom, keywords in profile_keywords:
-            if atom.match(pkg):
-                pkg_keywords += keywords
+        for keywords in profile_keywords.iter_matches(pkg):
+            pkg_keywords += keywords
         allowed = data.pull_data(pkg)
         if '**' in allowed:
             return True
@@ -540,9 +541,8 @@ class domain(pkgcore.config.domain.domain):
     def get_package_bashrcs(self, pkg):
         for source in self.profile.bashrcs:
             yield source
-        for restrict, source in self.bashrcs:
-            if restrict.match(pkg):
-                yield source
+        for source in self.bashrcs.iter_matches(pkg):
+            yield source
         if not self.ebuild_hook_dir:
             return
         # matching portage behaviour... it's whacked.
@@ -152,7 +152,8 @@ class EAPI(object):
 
     @klass.jit_attr
     def atom_kls(self):
-        return partial(atom.atom, eapi=int(self.magic))
+        return atom.atom_cache.interning(
+            partial(atom.atom, eapi=int(self.magic)))
 
     def interpret_cache_defined_phases(self, sequence):
         phases = set(sequence)
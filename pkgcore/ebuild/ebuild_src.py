@@ -36,6 +36,7 @@ demandload(
     "snakeoil:data_source,fileutils",
     "pkgcore.ebuild.eapi:get_eapi",
     "pkgcore.log:logger",
+    "pkgcore.util:thread_pool",
 )
 
 demand_compile_regexp(
@@ -310,6 +311,28 @@ class package(base):
             return ebp.get_ebuild_environment(self, self.repo.eclass_cache)
 
 
+class _EclassValidationCache(object):
+
+    """Memoize an eclass cache's verdicts on the eclass data of cache entries.
+
+    Packages mostly share a handful of inherited eclass sets; checking each
+    set once saves redoing it per package during bulk validation.
+    """
+
+    def __init__(self, ecache):
+        self._ecache = ecache
+        self._results = {}
+
+    def rebuild_cache_entry(self, entry_eclasses):
+        key = tuple(entry_eclasses)
+        try:
+            return self._results[key]
+        except KeyError:
+            result = self._results[key] = \
+                self._ecache.rebuild_cache_entry(entry_eclasses)
+            return result
+
+
 class package_factory(metadata.factory):
     child_class = package
 
@@ -321,6 +344,8 @@ class package_factory(metadata.factory):
         super(package_factory, self).__init__(parent, *args, **kwargs)
         self._cache = cachedb
         self._ecache = eclass_cache
+        # cpvstr -> cache entry found valid by prevalidate_metadata
+        self._prevalidated = {}
 
         if mirrors:
             mirrors = {k: mirror(v, k) for k, v in mirrors.iteritems()}
@@ -342,27 +367,80 @@ class package_factory(metadata.factory):
         return os.stat(self._get_ebuild_path(pkg)).st_mtime
 
     def _get_metadata(self, pkg, ebp=None, force_regen=False):
+        data = self._get_cached_metadata(pkg, force_regen=force_regen)
+        if data is not None:
+            return data
+
+        # no cache entries, regen
+        return self._update_metadata(pkg, ebp=ebp)
+
+    def _get_cached_metadata(self, pkg, force_regen=False, eclass_db=None):
+        """Return the first valid cache entry for pkg, or None.
+
+        Stale entries encountered along the way are removed.
+
+        :param eclass_db: eclass cache to validate against, defaulting to ours
+        """
+        data = self._prevalidated.pop(pkg.cpvstr, None)
+        if data is not None and not force_regen:
+            return data
         caches = self._cache
         if force_regen:
             caches = ()
+        if eclass_db is None:
+            eclass_db = self._ecache
         ebuild_hash = chksum.LazilyHashedPath(pkg.path)
         for cache in caches:
             if cache is not None:
                 try:
                     data = cache[pkg.cpvstr]
-                    if cache.validate_entry(data, ebuild_hash, self._ecache):
+                    if cache.validate_entry(data, ebuild_hash, eclass_db):
                         return data
                     if not cache.readonly:
                         del cache[pkg.cpvstr]
+                        self._update_indexes(pkg.cpvstr)
                 except KeyError:
                     continue
                 except cache_errors.CacheError as ce:
                     logger.warning("caught cache error: %s" % ce)
                     del ce
                     continue
-
-        # no cache entries, regen
-        return self._update_metadata(pkg, ebp=ebp)
+        return None
+
+    def prevalidate_metadata(self, pkgs, threads=None):
+        """Validate the cache entries of many packages up front, in parallel.
+
+        The ebuild stats and cache reads are spread across threads, and
+        each distinct set of inherited eclasses is only checked once.
+        Valid entries are handed to the packages when their metadata is
+        first accessed, skipping the usual serial per package validation.
+
+        :param pkgs: iterable of packages from this factory
+        :param threads: number of threads to use, defaulting to the number
+            of cpus
+        :return: list of the packages lacking a valid cache entry
+        """
+        eclass_db = _EclassValidationCache(self._ecache)
+        stale = []
+
+        def validate(queue):
+            for pkg in queue:
+                try:
+                    data = self._get_cached_metadata(pkg, eclass_db=eclass_db)
+                except EnvironmentError:
+                    # e.g. the ebuild disappeared; leave it to the lazy path.
+                    data = None
+                if data is None:
+                    stale.append(pkg)
+                else:
+                    self._prevalidated[pkg.cpvstr] = data
+
+        thread_pool.map_async(pkgs, validate, threads=threads)
+        return stale
+
+    def clear(self):
+        self._prevalidated.clear()
+        super(package_factory, self).clear()
 
     def _update_metadata(self, pkg, ebp=None):
         parsed_eapi = pkg.eapi_obj
@@ -372,6 +450,16 @@ class package_factory(metadata.factory):
         with processor.reuse_or_request(ebp) as my_proc:
             mydata = my_proc.get_keys(pkg, self._ecache)
 
+        return self._store_metadata(pkg, mydata)
+
+    def _store_metadata(self, pkg, mydata):
+        """Convert the raw keys returned by the ebd and write them to the cache.
+
+        :param mydata: mapping of metadata keys as returned by
+            :obj:`pkgcore.ebuild.processor.EbuildProcessor.get_keys`
+        :return: the finalized metadata mapping
+        """
+        parsed_eapi = pkg.eapi_obj
         inherited = mydata.pop("INHERITED", None)
         # rewrite defined_phases as needed, since we now know the eapi.
         eapi = get_eapi(mydata["EAPI"])
@@ -409,10 +497,32 @@ class package_factory(metadata.factory):
                         logger.warning("caught cache error: %s" % ce)
                         del ce
                         continue
+                    self._update_indexes(pkg.cpvstr, mydata)
                     break
 
         return mydata
 
+    def _update_indexes(self, cpvstr, data=None):
+        """Reflect a cache write, or removal if data is None, in the indexes."""
+        index = getattr(self._parent_repo, 'eclass_index', None)
+        if index is not None:
+            try:
+                if data is None:
+                    index.discard(cpvstr)
+                else:
+                    index.update(cpvstr, data["_chf_"].mtime, data["_eclasses_"])
+            except EnvironmentError as e:
+                logger.warning("failed updating eclass index: %s", e)
+        index = getattr(self._parent_repo, 'attr_index', None)
+        if index is not None:
+            try:
+                if data is None:
+                    index.discard(cpvstr)
+                else:
+                    index.update(cpvstr, data["_chf_"].mtime, data)
+            except EnvironmentError as e:
+                logger.warning("failed updating attr index: %s", e)
+
     def new_package(self, *args):
         inst = self._cached_instances.get(args)
         if inst is None:
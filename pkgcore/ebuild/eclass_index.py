@@ -0,0 +1,116 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+persisted reverse index of eclass to the cache entries inheriting it
+"""
+
+__all__ = ("EclassIndex", "index_path")
+
+from snakeoil.osutils import pjoin
+
+from pkgcore.cache.fs_template import writable_location
+from pkgcore.ebuild.append_log import AppendLog
+
+
+def index_path(caches):
+    """Find where the eclass index for a set of caches should live.
+
+    :return: path, or None if no writable fs based cache exists
+    """
+    location = writable_location(caches)
+    if location is None:
+        return None
+    return pjoin(location, '.eclass-index')
+
+
+class EclassIndex(AppendLog):
+
+    """
+    mapping of eclass name to the cpvs whose cache entries inherit it
+
+    Records carry the ebuild and eclass mtimes their cache entry was
+    generated against; queries don't check them, callers needing an
+    accurate answer use :meth:`is_current` and fall back to the package
+    metadata otherwise.  They're stored as
+    ``cpv<tab>mtime<tab>eclass:mtime eclass:mtime...`` lines of the log.
+    """
+
+    description = 'eclass index'
+
+    def __init__(self, path):
+        AppendLog.__init__(self, path)
+        # records are (mtime, ((eclass, mtime), ...)); eclass -> cpvs is
+        # built along with them.
+        self._users = None
+
+    def _loaded(self):
+        self._users = users = {}
+        for cpv, record in self._records.iteritems():
+            for eclass, _mtime in record[1]:
+                users.setdefault(eclass, set()).add(cpv)
+
+    @staticmethod
+    def _parse(line):
+        cpv, mtime, eclasses = line.split('\t')
+        eclasses = tuple(
+            (name, float(eclass_mtime)) for name, eclass_mtime in
+            (x.rsplit(':', 1) for x in eclasses.split()))
+        return cpv, (float(mtime), eclasses)
+
+    @staticmethod
+    def _format(cpv, record):
+        mtime, eclasses = record
+        return "%s\t%r\t%s\n" % (cpv, mtime, ' '.join('%s:%r' % x for x in eclasses))
+
+    def _forget(self, cpv):
+        record = AppendLog._forget(self, cpv)
+        if record is not None:
+            for eclass, _mtime in record[1]:
+                self._users[eclass].discard(cpv)
+
+    def update(self, cpv, mtime, eclasses):
+        """Record the eclasses a cpv's freshly written cache entry inherits.
+
+        :param mtime: ebuild mtime the entry is valid for
+        :param eclasses: the entry's ``_eclasses_``, mapping eclass names to
+            their eclass cache entries
+        """
+        record = (float(mtime), tuple(sorted(
+            (name, float(eclass.mtime)) for name, eclass in eclasses.iteritems())))
+        self._append(self._format(cpv, record))
+        if self._records is not None:
+            self._forget(cpv)
+            self._records[cpv] = record
+            for eclass, _mtime in record[1]:
+                self._users.setdefault(eclass, set()).add(cpv)
+
+    def inherits(self, cpv):
+        """Return the eclasses cpv inherits, or None if it isn't indexed."""
+        self._load()
+        record = self._records.get(cpv)
+        if record is None:
+            return None
+        return tuple(name for name, _mtime in record[1])
+
+    def is_current(self, cpv, mtime, eclass_cache):
+        """Is cpv's record valid for the given ebuild mtime and eclasses?"""
+        self._load()
+        record = self._records.get(cpv)
+        if record is None or record[0] != mtime:
+            return False
+        eclasses = eclass_cache.eclasses
+        for name, eclass_mtime in record[1]:
+            eclass = eclasses.get(name)
+            if eclass is None or float(eclass.mtime) != eclass_mtime:
+                return False
+        return True
+
+    def users(self, *eclasses):
+        """Return the cpvs whose record inherits any of the given eclasses.
+
+        Records aren't checked with :meth:`is_current`.
+        """
+        self._load()
+        users = self._users
+        return frozenset().union(*(users.get(eclass, ()) for eclass in eclasses))
@@ -0,0 +1,112 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+persisted category/package/version layout of an ebuild repository
+
+Each listing is stored alongside the mtime of the directory it was read from;
+a directory's mtime changes whenever entries are added, removed or renamed
+within it, so a single stat vouches for the stored listing and replaces the
+listdir (and per entry stat) otherwise required.
+"""
+
+__all__ = ("LayoutIndex", "index_path")
+
+import errno
+import os
+
+from snakeoil.compatibility import intern
+from snakeoil.osutils import ensure_dirs, pjoin
+
+from pkgcore.cache.fs_template import writable_location
+from pkgcore.log import logger
+
+
+def index_path(caches):
+    """Find where the layout index for a set of caches should live.
+
+    :return: path, or None if no writable fs based cache exists
+    """
+    location = writable_location(caches)
+    if location is None:
+        return None
+    return pjoin(location, '.layout-index')
+
+
+class LayoutIndex(object):
+
+    """
+    mapping of a repository directory path to its listing and mtime when listed
+
+    The listing is whatever the repository derived from the directory, e.g.
+    the versions for a package directory, rather than the raw entries.
+    """
+
+    magic = 'pkgcore-layout-index 1'
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = entries = {}
+        try:
+            with open(self.path) as f:
+                if f.readline().rstrip('\n') != self.magic:
+                    logger.warning(
+                        "ignoring layout index %r: unknown format", self.path)
+                    return
+                for line in f:
+                    path, mtime, listing = line.rstrip('\n').split('\t')
+                    entries[path] = (
+                        float(mtime), tuple(intern(x) for x in listing.split()))
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except ValueError as e:
+            logger.warning("ignoring corrupt layout index %r: %s", self.path, e)
+            entries.clear()
+
+    def get(self, path, mtime):
+        """Return the listing for path if it was taken at the given mtime."""
+        self._load()
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != mtime:
+            return None
+        return entry[1]
+
+    def update(self, path, mtime, listing):
+        """Record the listing of a directory, taken at the given mtime."""
+        self._load()
+        listing = tuple(listing)
+        if self._entries.get(path) != (mtime, listing):
+            self._entries[path] = (mtime, listing)
+            self._dirty = True
+
+    def __len__(self):
+        self._load()
+        return len(self._entries)
+
+    def write(self):
+        """Atomically replace the on disk index, if anything changed."""
+        if not self._dirty:
+            return
+        tmp_path = "%s.update.%i" % (self.path, os.getpid())
+        # the cache dir may not exist yet; if creating it fails, so will open.
+        ensure_dirs(os.path.dirname(self.path))
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(self.magic + '\n')
+                for path, (mtime, listing) in sorted(self._entries.iteritems()):
+                    f.write("%s\t%r\t%s\n" % (path, mtime, ' '.join(listing)))
+            os.rename(tmp_path, self.path)
+        except EnvironmentError:
+            try:
+                os.remove(tmp_path)
+            except EnvironmentError:
+                pass
+            raise
+        self._dirty = False
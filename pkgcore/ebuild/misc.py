@@ -24,6 +24,7 @@ from snakeoil.sequences import namedtuple
 
 from pkgcore.ebuild import atom
 from pkgcore.restrictions import packages, restriction, boolean
+from pkgcore.restrictions.index import RestrictionIndex
 from pkgcore.util.parserestrict import parse_match
 
 restrict_payload = namedtuple("restrict_data", ["restrict", "data"])
@@ -234,16 +235,18 @@ class collapsed_restrict_to_data(object):
             if not x.startswith("-"))
         self.freeform = tuple(x for x in (repo, cat, pkg, multi) if x)
         self.atoms = atom_d
+        # lookups go through the index.  freeform pairs are added first so
+        # their data stays ahead of the more specific atom data; atom_d
+        # entries, global negations appended to them included, are filed
+        # under their key.
+        index = self._index = RestrictionIndex(chain.from_iterable(self.freeform))
+        for key, pairs in atom_d.iteritems():
+            key = tuple(key.split('/', 1))
+            for restrict, data in pairs:
+                index.add(restrict, data, key=key)
 
     def pull_data(self, pkg, force_copy=False, pre_defaults=()):
-        l = []
-        for specific in self.freeform:
-            for restrict, data in specific:
-                if restrict.match(pkg):
-                    l.append(data)
-        for atom, data in self.atoms.get(pkg.key, ()):
-            if atom.match(pkg):
-                l.append(data)
+        l = list(self._index.iter_matches(pkg))
 
         if pre_defaults:
             s = set(pre_defaults)
@@ -260,28 +263,15 @@ class collapsed_restrict_to_data(object):
             yield item
         for item in self.defaults:
             yield item
-        for specific in self.freeform:
-            for restrict, data in specific:
-                if restrict.match(pkg):
-                    for item in data:
-                        yield item
-        for atom, data in self.atoms.get(pkg.key, ()):
-            if atom.match(pkg):
-                for item in data:
-                    yield item
+        for data in self._index.iter_matches(pkg):
+            for item in data:
+                yield item
 
 
 class non_incremental_collapsed_restrict_to_data(collapsed_restrict_to_data):
 
     def pull_data(self, pkg, force_copy=False):
-        l = []
-        for specific in self.freeform:
-            for restrict, data in specific:
-                if restrict.match(pkg):
-                    l.append(data)
-        for atom, data in self.atoms.get(pkg.key, ()):
-            if atom.match(pkg):
-                l.append(data)
+        l = list(self._index.iter_matches(pkg))
         if not l:
             if force_copy:
                 return set(self.defaults)
@@ -292,11 +282,7 @@ class non_incremental_collapsed_restrict_to_data(collapsed_restrict_to_data):
 
     def iter_pull_data(self, pkg):
         l = [self.defaults]
-        for specific in self.freeform:
-            l.extend(data for restrict, data in specific if restrict.match(pkg))
-        for atom, data in self.atoms.get(pkg.key, ()):
-            if atom.match(pkg):
-                l.append(data)
+        l.extend(self._index.iter_matches(pkg))
         if len(l) == 1:
             return iter(self.defaults)
         return iflatten_instance(l)
@@ -20,13 +20,17 @@ design) reduces regen time by over 40% compared to portage-2.1
 
 __all__ = (
     "request_ebuild_processor", "release_ebuild_processor", "EbuildProcessor",
-    "UnhandledCommand", "expected_ebuild_env")
+    "UnhandledCommand", "expected_ebuild_env", "update_eclass_snapshot",
+    "configure_processor_pool", "processor_pool_limits")
 
 try:
     import threading
-    _global_ebp_lock = threading.Lock()
+    # a condition so requests can wait on releases when the pool is full.
+    _global_ebp_lock = threading.Condition()
     _acquire_global_ebp_lock = _global_ebp_lock.acquire
     _release_global_ebp_lock = _global_ebp_lock.release
+    _wait_for_ebp_release = _global_ebp_lock.wait
+    _notify_ebp_release = _global_ebp_lock.notify_all
 except ImportError:
     def _acquire_global_ebp_lock():
         pass
@@ -34,15 +38,23 @@ except ImportError:
     def _release_global_ebp_lock():
         pass
 
+    _wait_for_ebp_release = _notify_ebp_release = None
+
 
 inactive_ebp_list = []
 active_ebp_list = []
 
+# pool limits; see configure_processor_pool.
+_max_processors = None
+_max_idle = None
+_max_uses = None
+
 import contextlib
 import errno
 from functools import partial
 import os
 import signal
+import stat
 
 from pkgcore import const, os_data
 from pkgcore.ebuild import const as e_const
@@ -56,6 +68,7 @@ from snakeoil.osutils import abspath, normpath, pjoin
 from snakeoil.weakrefs import WeakRefFinalizer
 
 demandload(
+    'hashlib',
     'logging',
     'itertools:chain',
     'traceback',
@@ -76,10 +89,55 @@ def _single_thread_allowed(functor):
     return _inner
 
 
+@_single_thread_allowed
+def configure_processor_pool(max_processors=None, max_idle=None, max_uses=None):
+    """
+    limit the processors handed out by :obj:`request_ebuild_processor`
+
+    Each limit defaults to None, meaning unlimited.
+
+    :param max_processors: number of processors allowed to exist at once;
+        requests past it block till a processor is released.  Callers
+        already holding a processor must pass it down rather than requesting
+        another, or they can deadlock.
+    :param max_idle: number of released processors kept alive for reuse
+    :param max_uses: number of requests a processor serves before it's shut
+        down and replaced
+    """
+    global _max_processors, _max_idle, _max_uses
+    if max_processors is not None and max_processors < 1:
+        raise ValueError("max_processors must be at least 1, got %r" % (max_processors,))
+    if max_idle is not None and max_idle < 0:
+        raise ValueError("max_idle can't be negative, got %r" % (max_idle,))
+    if max_uses is not None and max_uses < 1:
+        raise ValueError("max_uses must be at least 1, got %r" % (max_uses,))
+    _max_processors, _max_idle, _max_uses = max_processors, max_idle, max_uses
+    if _notify_ebp_release is not None:
+        # let any waiters recheck against the new limit.
+        _notify_ebp_release()
+
+
+@contextlib.contextmanager
+def processor_pool_limits(**kwds):
+    """
+    apply :obj:`configure_processor_pool` limits for the duration of a block
+
+    The limits in effect beforehand are restored afterwards.
+    """
+    prior = (_max_processors, _max_idle, _max_uses)
+    configure_processor_pool(**kwds)
+    try:
+        yield
+    finally:
+        configure_processor_pool(*prior)
+
+
 @_single_thread_allowed
 def forget_all_processors():
     active_ebp_list[:] = []
     inactive_ebp_list[:] = []
+    if _notify_ebp_release is not None:
+        _notify_ebp_release()
 
 
 @_single_thread_allowed
@@ -99,6 +157,8 @@ def shutdown_all_processors():
                     ignore_keyboard_interrupt=True)
             except EnvironmentError:
                 pass
+        if _notify_ebp_release is not None:
+            _notify_ebp_release()
     except Exception as e:
         traceback.print_exc()
         logger.error(e)
@@ -128,18 +188,30 @@ def request_ebuild_processor(userpriv=False, sandbox=None, fakeroot=False,
     if sandbox is None:
         sandbox = pkgcore.spawn.is_sandbox_capable()
 
-    if not fakeroot:
-        for x in inactive_ebp_list:
-            if x.userprived() == userpriv and (x.sandboxed() or not sandbox):
-                if not x.is_alive:
+    while True:
+        if not fakeroot:
+            for x in inactive_ebp_list[:]:
+                if x.userprived() == userpriv and (x.sandboxed() or not sandbox):
                     inactive_ebp_list.remove(x)
-                    continue
-                inactive_ebp_list.remove(x)
-                active_ebp_list.append(x)
-                return x
+                    if not x.is_alive:
+                        continue
+                    active_ebp_list.append(x)
+                    x.uses += 1
+                    return x
+
+        if (_max_processors is None or _wait_for_ebp_release is None or
+                len(active_ebp_list) < _max_processors):
+            break
+        _wait_for_ebp_release()
+
+    # make room by dropping idle processors that didn't fit this request.
+    while (_max_processors is not None and inactive_ebp_list and
+            len(active_ebp_list) + len(inactive_ebp_list) >= _max_processors):
+        inactive_ebp_list.pop(0).shutdown_processor()
 
     e = EbuildProcessor(userpriv, sandbox, fakeroot, save_file)
     active_ebp_list.append(e)
+    e.uses += 1
     return e
 
 
@@ -167,11 +239,15 @@ def release_ebuild_processor(ebp):
     assert ebp not in inactive_ebp_list
     # if it's a fakeroot'd process, we throw it away.
     # it's not useful outside of a chain of calls
-    if ebp.onetime() or ebp.locked:
+    if (ebp.onetime() or ebp.locked or
+            (_max_uses is not None and ebp.uses >= _max_uses) or
+            (_max_idle is not None and len(inactive_ebp_list) >= _max_idle)):
         # ok, so the thing is not reusable either way.
         ebp.shutdown_processor()
     else:
         inactive_ebp_list.append(ebp)
+    if _notify_ebp_release is not None:
+        _notify_ebp_release()
     return True
 
 
@@ -282,6 +358,8 @@ class EbuildProcessor(object):
 
         self._preloaded_eclasses = {}
         self._eclass_caching = False
+        # number of times handed out by request_ebuild_processor.
+        self.uses = 0
         self._outstanding_expects = []
         self._metadata_paths = None
 
@@ -590,6 +668,29 @@ class EbuildProcessor(object):
             return self._consume_async_expects()
         return True
 
+    def preload_eclass_snapshot(self, cache, path):
+        """
+        Preload all of an eclass stack's eclasses from a snapshot file.
+
+        A single source of the snapshot replaces a read and syntax check per
+        eclass; the snapshot is rebuilt via :obj:`update_eclass_snapshot` if
+        it doesn't match the current eclass state.
+
+        :param cache: :obj:`pkgcore.ebuild.eclass_cache` instance to preload
+        :param path: location of the snapshot
+        :return: boolean, True for success
+        """
+        # hand the daemon the path that was verified.
+        path = os.path.realpath(path)
+        if not update_eclass_snapshot(path, cache):
+            return False
+        self.write("preload_eclass_snapshot %s" % (path,))
+        if not self.expect("preload_eclass_snapshot succeeded", flush=True):
+            return False
+        for eclass, data in cache.eclasses.iteritems():
+            self._preloaded_eclasses[eclass] = data.path
+        return True
+
     def allow_eclass_caching(self):
         self._eclass_caching = True
 
@@ -836,6 +937,75 @@ class EbuildProcessor(object):
 
         return metadata_keys
 
+    def get_keys_batch(self, packages, eclass_cache):
+        """
+        request the metadata of multiple ebuilds be regenerated in one go
+
+        All ebuild environments are sent to the daemon in a single request,
+        which then streams back the metadata of each in turn; this avoids a
+        command round-trip per package.
+
+        :param packages: sequence of :obj:`pkgcore.ebuild.ebuild_src.package`
+            instances to regenerate
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance to use
+            for eclass access
+        :return: list of (package, dict) pairs in the order given, the dict
+            being None if sourcing that package failed.  An error talking to
+            the daemon (an unknown eclass inherited, for example) fails only
+            the package at hand, but whatever the daemon still had to send
+            for the batch can't be told apart from later replies anymore:
+            the processor is shut down and the list stops at that package,
+            leaving the remainder to be resubmitted to another processor.
+        """
+        packages = tuple(packages)
+        if not packages:
+            return []
+        self._ensure_metadata_paths(const.HOST_NONROOT_PATHS)
+
+        data = ["gen_metadata_batch %i\n" % (len(packages),)]
+        for pkg in packages:
+            env = self._generate_env_data(expected_ebuild_env(pkg, depends=True))
+            data.append("%i\n%s" % (len(env), env))
+        self.write(''.join(data), append_newline=False)
+
+        metadata_keys = {}
+
+        def receive_key(self, line):
+            line = line.split("=", 1)
+            if len(line) != 2:
+                raise FinishedProcessing(True)
+            metadata_keys[line[0]] = line[1]
+
+        updates = None
+        if self._eclass_caching:
+            updates = set()
+        commands = {
+            "key": receive_key,
+            "request_inherit": partial(inherit_handler, eclass_cache, updates=updates),
+        }
+        results = []
+        for pkg in packages:
+            try:
+                ok = self.generic_handler(additional_commands=commands)
+            except (ProcessingInterruption, EnvironmentError) as e:
+                logger.error("failed sourcing %s for metadata: %s", pkg, e)
+                results.append((pkg, None))
+                self.shutdown_processor()
+                return results
+            if ok:
+                result = metadata_keys.copy()
+            else:
+                logger.error("failed sourcing %s for metadata", pkg)
+                result = None
+            metadata_keys.clear()
+            results.append((pkg, result))
+
+        # preloading has to wait till the batch is finished; the daemon reads
+        # its input only when asking for an inherit till then.
+        if updates:
+            self.preload_eclasses(eclass_cache, limited_to=updates, async=True)
+        return results
+
     # this basically handles all hijacks from the daemon, whether
     # confcache or portageq.
     def generic_handler(self, additional_commands=None):
@@ -904,6 +1074,113 @@ class EbuildProcessor(object):
             self.unlock()
             return v
 
+_eclass_snapshot_magic = '# pkgcore-eclass-snapshot 2'
+
+
+def _eclass_snapshot_key(eclass_cache):
+    chf = hashlib.sha1()
+    for eclass, data in sorted(eclass_cache.eclasses.iteritems()):
+        chf.update("%s\0%s\0%r\0" % (eclass, data.path, float(data.mtime)))
+    return "%s %s" % (_eclass_snapshot_magic, chf.hexdigest())
+
+
+def _is_private(st):
+    """Is the stat'd file owned by us or root, and not writable by others?"""
+    if st.st_uid not in (0, os.geteuid()):
+        return False
+    return not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _is_private_dir(path):
+    """Can only we (or root) add, remove or rename entries below path?
+
+    Every directory up to / is checked, since anyone able to write to one
+    of them could swap out what's below it; sticky directories (/tmp for
+    example) are fine, as others can't touch entries they don't own.
+    """
+    while True:
+        st = os.stat(path)
+        if not _is_private(st) and not (
+                st.st_uid in (0, os.geteuid()) and st.st_mode & stat.S_ISVTX):
+            return False
+        parent = os.path.dirname(path)
+        if parent == path:
+            return True
+        path = parent
+
+
+def update_eclass_snapshot(path, eclass_cache):
+    """
+    Ensure path holds a preload snapshot of eclass_cache's current eclasses.
+
+    The snapshot is a bash script defining the preloaded eclass functions the
+    daemon's ``preload_eclass`` command would generate; it's keyed by the
+    eclasses' locations and mtimes, and only rewritten when those change.
+
+    As the daemon sources it, the snapshot is only used if nobody but us (or
+    root) could have written it: its directory has to be private (see
+    :obj:`_is_private_dir`), the file ours and not writable by others, and
+    its content has to match the hash recorded in its header.
+
+    :return: boolean, True if the snapshot is usable
+    """
+    path = os.path.realpath(path)
+    key = _eclass_snapshot_key(eclass_cache)
+    dirname = os.path.dirname(path)
+    try:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, 0755)
+        if not _is_private_dir(dirname):
+            logger.warning(
+                "not using eclass snapshot %r: others can write to its directory", path)
+            return False
+    except EnvironmentError as e:
+        logger.warning("failed accessing eclass snapshot dir %r: %s", dirname, e)
+        return False
+
+    try:
+        with open(path) as f:
+            header = f.readline()
+            body = f.read()
+            if _is_private(os.fstat(f.fileno())) and \
+                    header == "%s %s\n" % (key, hashlib.sha1(body).hexdigest()):
+                return True
+    except EnvironmentError as e:
+        if e.errno != errno.ENOENT:
+            logger.warning("failed reading eclass snapshot %r: %s", path, e)
+            return False
+
+    body = []
+    tmp_path = "%s.update.%i" % (path, os.getpid())
+    try:
+        for eclass, data in sorted(eclass_cache.eclasses.iteritems()):
+            with open(data.path) as ec:
+                content = ec.read()
+            body.append("__preloaded_eclass_%s() {\n%s\n}\n" % (eclass, content))
+            body.append("PKGCORE_PRELOADED_ECLASSES[%s]=__preloaded_eclass_%s\n"
+                        % (eclass, eclass))
+        body = ''.join(body)
+        with open(tmp_path, 'w') as f:
+            os.fchmod(f.fileno(), 0644)
+            f.write("%s %s\n" % (key, hashlib.sha1(body).hexdigest()))
+            f.write(body)
+        # one syntax check for the lot rather than one per eclass.
+        if pkgcore.spawn.spawn([const.BASH_BINARY, '-n', tmp_path],
+                               fd_pipes={2: 2}) != 0:
+            logger.warning("not using eclass snapshot %r: syntax errors", path)
+            os.remove(tmp_path)
+            return False
+        os.rename(tmp_path, path)
+    except EnvironmentError as e:
+        logger.warning("failed writing eclass snapshot %r: %s", path, e)
+        try:
+            os.remove(tmp_path)
+        except EnvironmentError:
+            pass
+        return False
+    return True
+
+
 def inherit_handler(ecache, ebp, line, updates=None):
     """
     Callback for implementing inherit digging into eclass_cache.
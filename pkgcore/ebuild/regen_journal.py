@@ -0,0 +1,131 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+record of the ebuild/eclass state seen by the last regen
+
+Used for incremental regeneration: packages whose ebuild mtime and inherited
+eclasses are unchanged since the journal was written are known to have a
+valid cache entry, and don't need their cache entry read and validated.
+"""
+
+__all__ = ("Journal", "journal_path")
+
+import errno
+import os
+
+from snakeoil.osutils import pjoin
+
+from pkgcore.cache.fs_template import writable_location
+from pkgcore.log import logger
+
+
+def journal_path(caches):
+    """Find where the journal for a set of caches should live.
+
+    The journal is stored inside the first writable cache's directory so that
+    wiping the cache also wipes the journal vouching for it.
+
+    :return: path, or None if no suitable cache exists
+    """
+    location = writable_location(caches)
+    if location is None:
+        return None
+    return pjoin(location, '.regen-journal')
+
+
+class Journal(object):
+
+    """
+    per package ebuild mtime and inherited eclasses, and the eclass state
+
+    :ivar changed_eclasses: frozenset of eclass names whose location or mtime
+        differs from the previous journal
+    """
+
+    magic = 'pkgcore-regen-journal 1'
+
+    def __init__(self, path, eclass_cache):
+        """
+        :param path: location of the journal file
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache.base` instance
+            of the repository being regenerated
+        """
+        self.path = path
+        self._eclasses = {
+            eclass: (data.path, float(data.mtime))
+            for eclass, data in eclass_cache.eclasses.iteritems()}
+        old_eclasses, self._old_packages = self._read()
+        self.changed_eclasses = frozenset(
+            eclass for eclass, state in old_eclasses.iteritems()
+            if self._eclasses.get(eclass) != state)
+        self.packages = {}
+
+    def _read(self):
+        eclasses, packages = {}, {}
+        try:
+            with open(self.path) as f:
+                if f.readline().rstrip('\n') != self.magic:
+                    logger.warning(
+                        "ignoring regen journal %r: unknown format", self.path)
+                    return {}, {}
+                for line in f:
+                    line = line.rstrip('\n').split('\t')
+                    if line[0] == 'eclass':
+                        eclasses[line[1]] = (line[2], float(line[3]))
+                    elif line[0] == 'pkg':
+                        packages[line[1]] = (
+                            float(line[2]), tuple(line[3].split()))
+                    else:
+                        raise ValueError("unknown record %r" % (line[0],))
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return {}, {}
+        except (ValueError, IndexError) as e:
+            logger.warning("ignoring corrupt regen journal %r: %s", self.path, e)
+            return {}, {}
+        return eclasses, packages
+
+    def is_current(self, cpvstr, mtime):
+        """Is the package unchanged since the previous journal was written?
+
+        If so, it's carried forward into this journal.
+        """
+        old = self._old_packages.get(cpvstr)
+        if old is None or old[0] != mtime:
+            return False
+        if self.changed_eclasses.intersection(old[1]):
+            return False
+        self.packages[cpvstr] = old
+        return True
+
+    def record(self, cpvstr, mtime, eclasses):
+        """Note that the package's cache entry is valid for the given state."""
+        self.packages[cpvstr] = (mtime, tuple(eclasses))
+
+    def discard(self, cpvstr):
+        """Forget the package, forcing it to be checked next time."""
+        self.packages.pop(cpvstr, None)
+
+    def write(self):
+        """Atomically replace the on disk journal with this one.
+
+        Packages that weren't recorded or carried forward are dropped,
+        forcing a full check next time.
+        """
+        tmp_path = "%s.update.%i" % (self.path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(self.magic + '\n')
+                for eclass, (path, mtime) in sorted(self._eclasses.iteritems()):
+                    f.write("eclass\t%s\t%s\t%r\n" % (eclass, path, mtime))
+                for cpvstr, (mtime, eclasses) in sorted(self.packages.iteritems()):
+                    f.write("pkg\t%s\t%r\t%s\n" % (cpvstr, mtime, ' '.join(eclasses)))
+            os.rename(tmp_path, self.path)
+        except EnvironmentError:
+            try:
+                os.remove(tmp_path)
+            except EnvironmentError:
+                pass
+            raise
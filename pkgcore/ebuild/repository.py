@@ -14,7 +14,7 @@ import stat
 
 from snakeoil import klass
 from snakeoil.bash import iter_read_bash, read_dict
-from snakeoil.compatibility import intern, raise_from
+from snakeoil.compatibility import IGNORED_EXCEPTIONS, intern, raise_from
 from snakeoil.containers import InvertedContains
 from snakeoil.demandload import demandload
 from snakeoil.fileutils import readlines
@@ -26,16 +26,22 @@ from pkgcore.config import ConfigHint, configurable
 from pkgcore.ebuild import ebuild_src
 from pkgcore.ebuild import eclass_cache as eclass_cache_module
 from pkgcore.operations import repo as _repo_ops
+from pkgcore.operations import is_standalone
 from pkgcore.repository import prototype, errors, configured
 
 demandload(
     'errno',
+    'hashlib',
     'operator:attrgetter',
     'random:shuffle',
-    'snakeoil.chksum:get_chksums',
+    'snakeoil.chksum:get_chksums,LazilyHashedPath',
     'snakeoil.data_source:local_source',
-    'pkgcore.ebuild:ebd,digest,repo_objs,atom,profiles,processor',
+    'pkgcore:const',
+    'pkgcore.ebuild:ebd,digest,repo_objs,atom,profiles,processor,regen_journal',
+    'pkgcore.ebuild.cpv:versioned_CPV',
     'pkgcore.ebuild:errors@ebuild_errors',
+    'pkgcore.ebuild.eclass_index:EclassIndex,index_path',
+    'pkgcore.ebuild:attr_index,layout_index',
     'pkgcore.fs.livefs:sorted_scan',
     'pkgcore.log:logger',
     'pkgcore.package:errors@pkg_errors',
@@ -45,6 +51,87 @@ demandload(
 
 class repo_operations(_repo_ops.operations):
 
+    # max number of queued cache updates during regen.
+    _regen_write_behind = 1000
+
+    @is_standalone
+    def _cmd_api_regen_cache(self, observer=None, threads=1, incremental=False,
+                             **options):
+        """Regenerate the metadata cache.
+
+        :param incremental: if True, skip packages whose ebuild and inherited
+            eclasses are unchanged since the last regen, as recorded in the
+            journal stored alongside the cache.
+        """
+        journal = None
+        if incremental:
+            path = regen_journal.journal_path(self.repo.cache)
+            if path is None:
+                self._get_observer(observer).warn(
+                    "repo %s has no writable cache to store a regen journal in; "
+                    "falling back to a full regen", self.repo)
+            else:
+                journal = regen_journal.Journal(path, self.repo.eclass_cache)
+        # keep cache writes off the regen path; flush_cache drains them.
+        caches = [x for x in self.repo.cache if not x.readonly]
+        failed = set()
+        on_error = lambda cpv, e: failed.add(cpv)
+        for cache in caches:
+            cache.set_write_behind(self._regen_write_behind, on_error=on_error)
+        try:
+            # each regen thread or worker holds a single processor.
+            with processor.processor_pool_limits(max_processors=threads):
+                ret = _repo_ops.operations._cmd_api_regen_cache(
+                    self, observer=observer, threads=threads, journal=journal,
+                    **options)
+        finally:
+            # every cache gets flushed and its writer stopped, whatever the
+            # others do.
+            for cache in caches:
+                try:
+                    cache.set_write_behind(0)
+                except IGNORED_EXCEPTIONS:
+                    raise
+                except Exception as e:
+                    logger.warning("failed flushing cache %s: %s", cache, e)
+        if failed:
+            for cpvstr in sorted(failed):
+                self._regen_failed_write(cpvstr, journal)
+            # the indexes were written out with the failed entries.
+            self.repo.operations.run_if_supported("flush_cache")
+        if journal is not None:
+            journal.write()
+        return ret
+
+    def _regen_failed_write(self, cpvstr, journal):
+        """Handle a package whose queued cache write failed.
+
+        The indexes and journal were updated when the write was queued, so
+        are reverted; the metadata is then regenerated and written directly,
+        falling back to the next writable cache as usual.
+        """
+        cpv = versioned_CPV(cpvstr)
+        pkg = self.repo.package_class(cpv.category, cpv.package, cpv.fullver)
+        pkg._parent._update_indexes(cpvstr)
+        if journal is not None:
+            journal.discard(cpvstr)
+        try:
+            pkg._fetch_metadata(force_regen=True)
+        except IGNORED_EXCEPTIONS:
+            raise
+        except Exception as e:
+            logger.warning("failed regenerating %s after a cache error: %s", cpvstr, e)
+
+    @is_standalone
+    def _cmd_api_flush_cache(self, observer=None):
+        _repo_ops.operations._cmd_api_flush_cache(self, observer=observer)
+        if self.repo.eclass_index is not None:
+            self.repo.eclass_index.commit()
+        if self.repo.layout_index is not None:
+            self.repo.layout_index.write()
+        if self.repo.attr_index is not None:
+            self.repo.attr_index.commit()
+
     def _cmd_implementation_digests(self, domain, matches, observer, **options):
         manifest_config = self.repo.config.manifests
         if manifest_config.disabled:
@@ -299,6 +386,163 @@ class _UnconfiguredTree(prototype.tree):
 
     repo_id = klass.alias_attr("config.repo_id")
 
+    @klass.jit_attr
+    def eclass_index(self):
+        """:obj:`pkgcore.ebuild.eclass_index.EclassIndex` for our writable cache
+
+        None if there's no writable cache to keep it in.
+        """
+        path = index_path(self.cache)
+        if path is None:
+            return None
+        return EclassIndex(path)
+
+    @klass.jit_attr
+    def layout_index(self):
+        """:obj:`pkgcore.ebuild.layout_index.LayoutIndex` for our writable cache
+
+        None if there's no writable cache to keep it in.  Listings are
+        persisted when the cache is flushed, e.g. at the end of a regen.
+        """
+        path = layout_index.index_path(self.cache)
+        if path is None:
+            return None
+        return layout_index.LayoutIndex(path)
+
+    @klass.jit_attr
+    def attr_index(self):
+        """:obj:`pkgcore.ebuild.attr_index.AttrIndex` for our writable cache
+
+        The index is optional: None unless :obj:`build_attr_index` created it
+        (or there's no writable cache to keep it in).  Once it exists, cache
+        writes keep it up to date.
+        """
+        path = attr_index.index_path(self.cache)
+        if path is None or not os.path.exists(path):
+            return None
+        return attr_index.AttrIndex(path)
+
+    def build_attr_index(self):
+        """(Re)build the attr index from the valid entries of the metadata cache.
+
+        Packages lacking a valid cache entry are left out, and so are never
+        excluded by index lookups.
+
+        :return: the :obj:`pkgcore.ebuild.attr_index.AttrIndex`, or None if
+            there's no writable cache to keep it in
+        """
+        path = attr_index.index_path(self.cache)
+        if path is None:
+            return None
+        try:
+            os.unlink(path)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        index = attr_index.AttrIndex(path)
+        for pkg in self:
+            try:
+                data = self.package_class._get_cached_metadata(pkg)
+                mtime = LazilyHashedPath(pkg.path).mtime
+            except EnvironmentError:
+                continue
+            if data is not None:
+                index.update(pkg.cpvstr, mtime, data)
+        index.commit(force=True)
+        self.attr_index = index
+        return index
+
+    def reverse_dependencies(self, target):
+        """Find the dependencies of this repo's packages intersecting an atom.
+
+        Packages with a current :obj:`attr_index` record are answered from it
+        without loading their metadata; the rest have their metadata checked.
+
+        :param target: :obj:`pkgcore.ebuild.atom.atom` instance
+        :return: iterator of (pkg, attr, dep, conditionals) tuples, attr being
+            one of depends, rdepends or post_rdepends, dep the intersecting
+            atom and conditionals the USE conditionals (``flag`` or ``!flag``)
+            it's nested in
+        """
+        index = self.attr_index
+        key = target.key
+        if index is not None:
+            candidates = index.users('deps', key)
+        for pkg in self:
+            edges = None
+            if index is not None:
+                try:
+                    mtime = LazilyHashedPath(pkg.path).mtime
+                except EnvironmentError:
+                    continue
+                if index.is_current(pkg.cpvstr, mtime, self.eclass_cache):
+                    if pkg.cpvstr not in candidates:
+                        continue
+                    edges = index.dep_edges(pkg.cpvstr, key)
+            if edges is None:
+                try:
+                    edges = attr_index.dep_edges(pkg.data)
+                except ValueError as e:
+                    logger.warning("%s: failed parsing dependencies: %s", pkg, e)
+                    continue
+            for attr, dep, conds in edges:
+                try:
+                    dep = atom.atom(dep)
+                except atom.MalformedAtom:
+                    continue
+                if dep.key == key and dep.intersects(target):
+                    yield pkg, attr, dep, conds
+
+    def _get_prefilter(self, restrict):
+        index = self.attr_index
+        if index is None:
+            return None
+        cpvs = index.candidates(restrict)
+        if cpvs is None:
+            return None
+        is_current = index.is_current
+        eclass_cache = self.eclass_cache
+        def prefilter(pkg):
+            if pkg.cpvstr in cpvs:
+                return True
+            # packages whose record is stale could match anything.
+            try:
+                mtime = LazilyHashedPath(pkg.path).mtime
+            except EnvironmentError:
+                return True
+            return not is_current(pkg.cpvstr, mtime, eclass_cache)
+        return prefilter
+
+    def _indexed_listing(self, path, listing):
+        """Return listing() for a directory, via the layout index if possible."""
+        index = self.layout_index
+        if index is None:
+            return listing()
+        try:
+            mtime = os.stat(path).st_mtime
+        except EnvironmentError:
+            # let listing() raise or handle it.
+            return listing()
+        ret = index.get(path, mtime)
+        if ret is None:
+            ret = listing()
+            index.update(path, mtime, ret)
+        return ret
+
+    def prevalidate_metadata(self, pkgs=None, threads=None):
+        """Validate the cache entries of many packages in one parallel sweep.
+
+        Worthwhile before touching the metadata of a large number of
+        packages, e.g. resolving @world; see
+        :obj:`pkgcore.ebuild.ebuild_src.package_factory.prevalidate_metadata`.
+
+        :param pkgs: packages to validate, defaulting to the whole repo
+        :return: list of the packages lacking a valid cache entry
+        """
+        if pkgs is None:
+            pkgs = self
+        return self.package_class.prevalidate_metadata(pkgs, threads=threads)
+
     def __getitem__(self, cpv):
         cpv_inst = self.package_class(*cpv)
         if cpv_inst.fullver not in self.versions[(cpv_inst.category, cpv_inst.package)]:
@@ -343,6 +587,9 @@ class _UnconfiguredTree(prototype.tree):
         cats = self.hardcoded_categories
         if cats is not None:
             return cats
+        return self._indexed_listing(self.base, self._list_categories)
+
+    def _list_categories(self):
         try:
             return tuple(imap(intern, ifilterfalse(
                 self.false_categories.__contains__,
@@ -352,6 +599,10 @@ class _UnconfiguredTree(prototype.tree):
 
     def _get_packages(self, category):
         cpath = pjoin(self.base, category.lstrip(os.path.sep))
+        return self._indexed_listing(
+            cpath, partial(self._list_packages, category, cpath))
+
+    def _list_packages(self, category, cpath):
         try:
             return tuple(ifilterfalse(
                 self.false_packages.__contains__, listdir_dirs(cpath)))
@@ -367,6 +618,10 @@ class _UnconfiguredTree(prototype.tree):
 
     def _get_versions(self, catpkg):
         cppath = pjoin(self.base, catpkg[0], catpkg[1])
+        return self._indexed_listing(
+            cppath, partial(self._list_versions, catpkg, cppath))
+
+    def _list_versions(self, catpkg, cppath):
         pkg = catpkg[-1] + "-"
         lp = len(pkg)
         extension = self.extension
@@ -478,20 +733,48 @@ class _UnconfiguredTree(prototype.tree):
     def _regen_operation_helper(self, **kwds):
         return _RegenOpHelper(
             self, force=bool(kwds.get('force', False)),
-            eclass_caching=bool(kwds.get('eclass_caching', True)))
+            eclass_caching=bool(kwds.get('eclass_caching', True)),
+            journal=kwds.get('journal'))
+
+    def _regen_process_helper(self, **kwds):
+        return _RegenProcessHelper(
+            self, force=bool(kwds.get('force', False)),
+            eclass_caching=bool(kwds.get('eclass_caching', True)),
+            journal=kwds.get('journal'))
+
+
+def _preload_eclass_snapshot(repo, ebp):
+    """Warm ebp with a snapshot of repo's eclasses.
+
+    The daemon sources the snapshot, so it's kept in the per user cache dir
+    rather than next to the repo's (usually group writable) cache.  If it
+    can't be used, ebp is left to preload eclasses as they're inherited.
+    """
+    name = hashlib.sha1(repo.location).hexdigest()
+    ebp.preload_eclass_snapshot(
+        repo.eclass_cache, pjoin(const.USER_CACHE_PATH, 'eclass-preload', name))
 
 
 class _RegenOpHelper(object):
 
-    def __init__(self, repo, force=False, eclass_caching=True):
+    def __init__(self, repo, force=False, eclass_caching=True, journal=None):
         self.force = force
         self.eclass_caching = eclass_caching
+        self.journal = journal
         self.ebp = processor.request_ebuild_processor()
         if eclass_caching:
             self.ebp.allow_eclass_caching()
+            _preload_eclass_snapshot(repo, self.ebp)
 
     def __call__(self, pkg):
-        return pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
+        if self.journal is None:
+            return pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
+        mtime = os.stat(pkg.path).st_mtime
+        if not self.force and self.journal.is_current(pkg.cpvstr, mtime):
+            return None
+        data = pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
+        self.journal.record(pkg.cpvstr, mtime, data.get('_eclasses_', ()))
+        return data
 
     def finish(self):
         if self.eclass_caching:
@@ -500,6 +783,111 @@ class _RegenOpHelper(object):
         self.ebp = None
 
 
+class _RegenProcessHelper(object):
+
+    """Split regen between worker processes and a single cache writer.
+
+    Workers each own an ebuild processor and return the raw metadata keys
+    for stale packages; the parent process finalizes those and writes them
+    to the cache.
+    """
+
+    def __init__(self, repo, force=False, eclass_caching=True, journal=None):
+        self.repo = repo
+        self.force = force
+        self.eclass_caching = eclass_caching
+        self.journal = journal
+        self.ebp = None
+        self._mtimes = {}
+
+    def __iter__(self):
+        for pkg in self.repo:
+            key = (pkg.category, pkg.package, pkg.fullver)
+            if self.journal is not None:
+                try:
+                    mtime = os.stat(pkg.path).st_mtime
+                except EnvironmentError:
+                    # let the worker deal with it.
+                    pass
+                else:
+                    if not self.force and self.journal.is_current(pkg.cpvstr, mtime):
+                        continue
+                    self._mtimes[key] = mtime
+            yield key
+
+    def start(self):
+        """Invoked in the worker process after the fork."""
+        # the parent's processors aren't ours to use or shut down.
+        processor.forget_all_processors()
+        self._request_processor()
+
+    def _request_processor(self):
+        self.ebp = processor.request_ebuild_processor()
+        if self.eclass_caching:
+            self.ebp.allow_eclass_caching()
+            _preload_eclass_snapshot(self.repo, self.ebp)
+
+    def __call__(self, keys):
+        """Invoked in the worker with a batch of keys.
+
+        Packages lacking a valid cache entry are sourced in a single batched
+        request to the ebuild processor.
+
+        :return: list of (key, ok, result) where result is (inherited
+            eclasses, raw metadata keys or None if the cache entry is valid)
+            on success, else an error message
+        """
+        results = []
+        stale = []
+        for key in keys:
+            try:
+                pkg = self.repo.package_class(*key)
+                data = pkg._parent._get_cached_metadata(pkg, force_regen=self.force)
+                if data is not None:
+                    results.append(
+                        (key, True, (tuple(data.get('_eclasses_', ())), None)))
+                elif not pkg.eapi_obj.is_supported:
+                    results.append((key, True, ((), None)))
+                else:
+                    stale.append(pkg)
+            except IGNORED_EXCEPTIONS:
+                raise
+            except Exception as e:
+                results.append((key, False, str(e)))
+
+        while stale:
+            if self.ebp.pid is None:
+                # shut down on an error by an earlier batch.
+                processor.release_ebuild_processor(self.ebp)
+                self._request_processor()
+            batch = self.ebp.get_keys_batch(stale, self.repo.eclass_cache)
+            for pkg, data in batch:
+                key = (pkg.category, pkg.package, pkg.fullver)
+                if data is None:
+                    results.append((key, False, "failed sourcing metadata"))
+                else:
+                    results.append(
+                        (key, True, (tuple(data.get('INHERITED', '').split()), data)))
+            stale = stale[len(batch):]
+        return results
+
+    def commit(self, key, result):
+        """Invoked in the parent with the result of :obj:`__call__`."""
+        eclasses, keys = result
+        pkg = self.repo.package_class(*key)
+        if keys is not None:
+            pkg._parent._store_metadata(pkg, keys)
+        mtime = self._mtimes.pop(key, None)
+        if mtime is not None:
+            self.journal.record(pkg.cpvstr, mtime, eclasses)
+
+    def finish(self):
+        """Invoked in the worker process prior to exiting."""
+        if self.ebp is not None:
+            processor.shutdown_all_processors()
+            self.ebp = None
+
+
 class _SlavedTree(_UnconfiguredTree):
 
     """
@@ -8,13 +8,18 @@
 atom version restrict
 """
 
-__all__ = ("VersionMatch",)
+__all__ = ("VersionMatch", "AnyDepMatch", "revdep", "revdep_pkgs")
 
+from functools import partial
+
+from snakeoil.demandload import demandload
 from snakeoil.klass import generic_equality
 
 from pkgcore.ebuild import cpv, errors
 from pkgcore.restrictions import packages, restriction, values
 
+demandload('pkgcore.ebuild:atom')
+
 
 # TODO: change values.EqualityMatch so it supports le, lt, gt, ge, eq,
 # ne ops, and convert this to it.
@@ -312,3 +317,49 @@ def _parse_nontransitive_use(sequence):
     if default_on[0] or default_on[1]:
         r.append(UseDepDefault(True, *default_on))
     return r
+
+
+class AnyDepMatch(values.FlatteningRestriction):
+
+    """
+    match a depset containing an atom for which a function returns True
+
+    :ivar keys: frozenset of the cat/pkg any atom matching must have, letting
+        indexes narrow down the packages to check
+    """
+
+    __slots__ = ('keys',)
+
+    def __init__(self, func, keys, negate=False):
+        values.FlatteningRestriction.__init__(
+            self, atom.atom, values.AnyMatch(values.FunctionRestriction(func)),
+            negate=negate)
+        object.__setattr__(self, 'keys', frozenset(keys))
+
+
+dep_attrs = ('depends', 'rdepends', 'post_rdepends')
+
+
+def _dep_restriction(kls, func, keys):
+    return kls(*[
+        packages.PackageRestriction(attr, AnyDepMatch(func, keys))
+        for attr in dep_attrs])
+
+
+def revdep(target):
+    """Restriction matching packages with a dependency intersecting an atom."""
+    return _dep_restriction(
+        packages.OrRestriction, target.intersects, (target.key,))
+
+
+def _matches_any(pkgs, dep):
+    return any(dep.match(pkg) for pkg in pkgs)
+
+
+def revdep_pkgs(pkgs):
+    """Restriction matching packages whose DEPEND, RDEPEND and PDEPEND each
+    have a dependency matching any of pkgs."""
+    pkgs = tuple(pkgs)
+    return _dep_restriction(
+        packages.AndRestriction, partial(_matches_any, pkgs),
+        frozenset(pkg.key for pkg in pkgs))
@@ -23,7 +23,7 @@ from snakeoil.osutils import listdir_files, normpath, pjoin
 
 from pkgcore.merge import triggers, const, errors
 from pkgcore.fs import livefs
-from pkgcore.restrictions import values
+from pkgcore.restrictions import packages, values
 
 demandload(
     'fnmatch',
@@ -454,14 +454,18 @@ class ProtectOwned(FileCollision):
         self.vdb = vdb
 
     def collision(self, colliding):
-        real_pkgs = (pkg for repo in self.vdb for pkg in repo if pkg.package_is_real)
+        # vdbs with a file ownership index only load the owners' contents.
+        restrict = packages.PackageRestriction(
+            'contents', values.ContainmentMatch2(colliding, disable_inst_caching=True))
         collisions = {}
 
-        # TODO: worth parallelizing this vdb scanning?
-        for pkg in real_pkgs:
-            pkg_file_collisions = pkg.contents.intersection(colliding)
-            if pkg_file_collisions:
-                collisions[pkg.cpvstr] = pkg_file_collisions
+        for repo in self.vdb:
+            for pkg in repo.itermatch(restrict):
+                if not pkg.package_is_real:
+                    continue
+                pkg_file_collisions = pkg.contents.intersection(colliding)
+                if pkg_file_collisions:
+                    collisions[pkg.cpvstr] = pkg_file_collisions
 
         if collisions:
             pkg_collisions = [
@@ -43,12 +43,20 @@ def check_instance(obj):
 
 
 class contentsSet(object):
-    """set of :class:`pkgcore.fs.fs.fsBase` objects"""
+    """set of :class:`pkgcore.fs.fs.fsBase` objects
+
+    Hierarchy queries (:obj:`iter_child_nodes` and what builds on it) go
+    through a path index mapping each directory path to the paths of its
+    immediate children; it's built on first use and maintained by the
+    set's mutation methods from then on.
+    """
 
     __metaclass__ = generic_equality
     __attr_comparison__ = ('_dict',)
     __dict_kls__ = dict
 
+    # directory path -> set of child paths, None until needed.
+    _paths = None
 
     def __init__(self, initial=None, mutable=True):
 
@@ -58,6 +66,7 @@ class contentsSet(object):
         :param mutable: controls if it modifiable after initialization
         """
         self._dict = self.__dict_kls__()
+        self._paths = None
         if initial is not None:
             self._dict.update(check_instance(x) for x in initial)
         self.mutable = mutable
@@ -86,6 +95,8 @@ class contentsSet(object):
         if not fs.isfs_obj(obj):
             raise TypeError("'%s' is not a fs.fsBase class" % str(obj))
         self._dict[obj.location] = obj
+        if self._paths is not None:
+            self._index_path(obj.location)
 
     def __delitem__(self, obj):
 
@@ -102,18 +113,21 @@ class contentsSet(object):
             raise AttributeError(
                 "%s is frozen; no remove functionality" % self.__class__)
         if fs.isfs_obj(obj):
-            del self._dict[obj.location]
+            location = obj.location
         else:
-            del self._dict[normpath(obj)]
+            location = normpath(obj)
+        del self._dict[location]
+        if self._paths is not None:
+            self._unindex_path(location)
 
     def remove(self, obj):
         del self[obj]
 
     def discard(self, obj):
         if fs.isfs_obj(obj):
-            self._dict.pop(obj.location, None)
-        else:
-            self._dict.pop(obj, None)
+            obj = obj.location
+        if self._dict.pop(obj, None) is not None and self._paths is not None:
+            self._unindex_path(obj)
 
     def __getitem__(self, obj):
         if fs.isfs_obj(obj):
@@ -135,6 +149,7 @@ class contentsSet(object):
             raise AttributeError(
                 "%s is frozen; no clear functionality" % self.__class__)
         self._dict.clear()
+        self._paths = None
 
     @staticmethod
     def _convert_loc(iterable):
@@ -235,8 +250,14 @@ class contentsSet(object):
 
     def update(self, iterable):
         d = self._dict
+        if self._paths is None:
+            for x in iterable:
+                d[x.location] = x
+            return
+        index_path = self._index_path
         for x in iterable:
             d[x.location] = x
+            index_path(x.location)
 
     def iterfiles(self, invert=False):
         """A generator yielding just :obj:`pkgcore.fs.fs.fsFile` instances.
@@ -323,10 +344,47 @@ class contentsSet(object):
         cset.update(change_offset_rewriter(old_offset, new_offset, self))
         return cset
 
+    def _get_paths(self):
+        if self._paths is None:
+            self._paths = {}
+            index_path = self._index_path
+            for location in self._dict:
+                index_path(location)
+        return self._paths
+
+    def _index_path(self, location):
+        paths = self._paths
+        parent = path.dirname(location)
+        while parent != location:
+            children = paths.get(parent)
+            if children is not None:
+                children.add(location)
+                return
+            # parent wasn't known yet; link it to its own parent as well.
+            paths[parent] = set([location])
+            location, parent = parent, path.dirname(parent)
+
+    def _unindex_path(self, location):
+        # paths stay as long as they're entries, or have entries beneath them.
+        paths = self._paths
+        d = self._dict
+        while location not in paths and location not in d:
+            parent = path.dirname(location)
+            if parent == location:
+                return
+            children = paths[parent]
+            children.discard(location)
+            if children:
+                return
+            del paths[parent]
+            location = parent
+
     def iter_child_nodes(self, start_point):
         """Yield a stream of nodes that are fs entries contained within the
         passed in start point.
 
+        Nodes are yielded depth first, in sorted order per directory.
+
         :param start_point: fs filepath all yielded nodes must be within.
         """
 
@@ -335,11 +393,24 @@ class contentsSet(object):
                 start_point = start_point.target
             else:
                 start_point = start_point.location
-        for x in self:
-            cn_path = normpath(start_point).rstrip(path.sep) + path.sep
-            # what about sym targets?
-            if x.location.startswith(cn_path):
+        start_point = normpath(start_point).rstrip(path.sep)
+        if not start_point:
+            # everything is within the root, itself included.
+            for x in self:
                 yield x
+            return
+        # what about sym targets?
+        paths = self._get_paths()
+        d = self._dict
+        stack = sorted(paths.get(start_point, ()), reverse=True)
+        while stack:
+            location = stack.pop()
+            obj = d.get(location)
+            if obj is not None:
+                yield obj
+            children = paths.get(location)
+            if children is not None:
+                stack.extend(sorted(children, reverse=True))
 
     def child_nodes(self, start_point):
         """Return a clone of this instance, w/ just the child nodes returned
@@ -378,18 +449,12 @@ class contentsSet(object):
 
     def add_missing_directories(self, mode=0775, uid=0, gid=0, mtime=None):
         """Ensure that a directory node exists for each path; add if missing."""
-        missing = (x.dirname for x in self)
-        missing = set(x for x in missing if x not in self)
+        # every parent path is in the index; the missing ones are those
+        # that aren't entries.
+        d = self._dict
+        missing = [x for x in self._get_paths() if x not in d and x != "/"]
         if mtime is None:
             mtime = time.time()
-        # have to go recursive since many directories may be missing.
-        missing_initial = list(missing)
-        for x in missing_initial:
-            target = path.dirname(x)
-            while target not in missing and target not in self:
-                missing.add(target)
-                target = path.dirname(target)
-        missing.discard("/")
         self.update(fs.fsDir(location=x, mode=mode, uid=uid, gid=gid, mtime=mtime)
             for x in missing)
 
@@ -8,10 +8,13 @@ Shouldn't be accessed directly for the most part, use
 :mod:`pkgcore.plugins` to get at these ops.
 """
 
+from collections import deque
 import errno
 from functools import partial
 import os
 
+from snakeoil import compatibility
+from snakeoil.demandload import demandload
 from snakeoil.osutils import ensure_dirs, pjoin, unlink_if_exists
 
 from pkgcore.const import COPY_BINARY
@@ -20,6 +23,9 @@ from pkgcore.fs.livefs import gen_obj
 from pkgcore.plugin import get_plugin
 from pkgcore.spawn import spawn
 
+demandload(
+    'pkgcore.util.thread_pool:map_async',
+)
 
 __all__ = [
     "merge_contents", "unmerge_contents", "default_ensure_perms",
@@ -207,7 +213,86 @@ def do_link(src, trg):
     return True
 
 
-def merge_contents(cset, offset=None, callback=None):
+def _copy_nondir(copyfile, x):
+    try:
+        copyfile(x, mkdirs=True)
+    except CannotOverwrite as cf:
+        if not fs.issym(x):
+            raise
+
+        # by this time, all directories should've been merged.
+        # thus we can check the target
+        try:
+            if not fs.isdir(gen_obj(pjoin(x.location, x.target))):
+                raise cf
+        except OSError:
+            raise cf
+
+
+def _copy_worker(queue, copyfile, failures, merged):
+    for x in queue:
+        try:
+            copyfile(x, mkdirs=True)
+        except compatibility.IGNORED_EXCEPTIONS:
+            raise
+        except Exception as e:
+            failures.append(e)
+        else:
+            merged.add(x)
+
+
+def _merge_threaded(entries, callback, copyfile, threads):
+    """Merge non directories, copying regular files from a pool of threads.
+
+    Everything else is merged by the calling thread, which also invokes
+    callback for every entry in order, once it and the entries before it
+    are merged.  Files hardlinked to an earlier entry are linked once all
+    copies are done.
+    """
+    failures = []
+    merged_inodes = {}
+    deferred = []
+    pending = deque()
+    merged = set()
+
+    def report():
+        while pending and pending[0] in merged:
+            callback(pending.popleft())
+
+    def dispatch():
+        for x in entries:
+            if failures:
+                return
+            report()
+            pending.append(x)
+            if not x.is_reg:
+                _copy_nondir(copyfile, x)
+                merged.add(x)
+                continue
+            key = (x.dev, x.inode)
+            if None not in key:
+                if key in merged_inodes:
+                    deferred.append(x)
+                    continue
+                merged_inodes[key] = [x]
+            yield x
+
+    map_async(dispatch(), _copy_worker, copyfile, failures, merged,
+              threads=threads)
+    if failures:
+        raise failures[0]
+
+    for x in deferred:
+        candidates = merged_inodes[(x.dev, x.inode)]
+        if not any(target._can_be_hardlinked(x) and do_link(target, x)
+                   for target in candidates):
+            candidates.append(x)
+            copyfile(x, mkdirs=True)
+        merged.add(x)
+    report()
+
+
+def merge_contents(cset, offset=None, callback=None, threads=1):
 
     """
     merge a :class:`pkgcore.fs.contents.contentsSet` instance to the livefs
@@ -217,6 +302,10 @@ def merge_contents(cset, offset=None, callback=None):
         Think of it as target dir.
     :param callback: callable to report each entry being merged; given a single arg,
         the fs object being merged.
+    :param threads: number of threads copying regular files.  Directories
+        are created up front either way, and callback is invoked in the
+        same order regardless; with more than one thread, non directories
+        are reported once merged rather than just before.
     :raise EnvironmentError: Thrown for permission failures.
     """
 
@@ -269,6 +358,11 @@ def merge_contents(cset, offset=None, callback=None):
             ensure_perms(x)
     del d
 
+    if threads > 1:
+        _merge_threaded(iterate(cset.iterdirs(invert=True)), callback,
+                        copyfile, threads)
+        return True
+
     # might look odd, but what this does is minimize the try/except cost
     # to one time, assuming everything behaves, rather then per item.
     i = iterate(cset.iterdirs(invert=True))
@@ -98,6 +98,9 @@ class MergeEngine(object):
             tempdir = normpath(tempdir) + '/'
         self.tempdir = tempdir
 
+        # triggers that aren't always worth running threaded only do so when
+        # asked to.
+        self.parallelism_configured = parallelism is not None
         if parallelism is None:
             parallelism = get_proc_count()
 
@@ -441,7 +441,17 @@ class merge(base):
 
     def trigger(self, engine, merging_cset):
         op = get_plugin('fs_ops.merge_contents')
-        return op(merging_cset, callback=engine.observer.installing_fs_obj)
+        # copying from threads only pays off on some storage, so it's only
+        # done if parallelism was configured explicitly.
+        threads = os.environ.get("PKGCORE_TRIGGER_PARALLELISM")
+        if threads is not None:
+            threads = int(threads)
+        elif engine.parallelism_configured:
+            threads = engine.parallelism
+        else:
+            threads = 1
+        return op(merging_cset, callback=engine.observer.installing_fs_obj,
+                  threads=threads)
 
 
 class unmerge(base):
@@ -1,10 +1,14 @@
 # Copyright: 2011 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD 3 clause
 
+from itertools import islice
+
 from snakeoil import compatibility
 from snakeoil.demandload import demandload
 
 demandload(
+    'multiprocessing',
+    'multiprocessing.util:Finalize',
     'pkgcore.util.thread_pool:map_async',
 )
 
@@ -21,7 +25,72 @@ def regen_iter(iterable, regen_func, observer, is_thread=False):
             observer.error("caught exception %s while processing %s", e, x)
 
 
-def regen_repository(repo, observer, threads=1, pkg_attr='keywords', **options):
+# the helper a pool worker was forked with; set by _process_worker_init.
+_process_helper = None
+
+
+def _process_worker_init(helper):
+    global _process_helper
+    _process_helper = helper
+    helper.start()
+    Finalize(None, helper.finish, exitpriority=10)
+
+
+def _process_worker(keys):
+    try:
+        return _process_helper(keys)
+    except compatibility.IGNORED_EXCEPTIONS:
+        raise
+    except Exception as e:
+        return [(key, False, str(e)) for key in keys]
+
+
+def _batched(iterable, size):
+    iterable = iter(iterable)
+    while True:
+        batch = list(islice(iterable, size))
+        if not batch:
+            return
+        yield batch
+
+
+def regen_processes(helper, observer, processes, batch_size=16):
+    """Regenerate using a pool of worker processes feeding a single writer.
+
+    :param helper: object providing the work split; iterating it yields
+        picklable keys, ``start()``/``finish()`` are invoked in each worker,
+        calling it with a list of keys in a worker returns a list of
+        picklable ``(key, ok, result)`` tuples; successful results are handed
+        to ``commit(key, result)`` in this process, failed ones are error
+        messages.
+    :param batch_size: number of keys handed to a worker at a time
+    """
+    pool = multiprocessing.Pool(processes, _process_worker_init, (helper,))
+    try:
+        for results in pool.imap_unordered(
+                _process_worker, _batched(helper, batch_size)):
+            for key, ok, result in results:
+                if not ok:
+                    observer.error(
+                        "caught exception %s while processing %s", result, key)
+                    continue
+                try:
+                    helper.commit(key, result)
+                except compatibility.IGNORED_EXCEPTIONS:
+                    raise
+                except Exception as e:
+                    observer.error(
+                        "caught exception %s while processing %s", e, key)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def regen_repository(repo, observer, threads=1, pkg_attr='keywords',
+                     processes=False, **options):
 
     helpers = []
 
@@ -33,7 +102,9 @@ def regen_repository(repo, observer, threads=1, pkg_attr='keywords', **options):
         helpers.append(helper)
         return helper
 
-    if threads == 1:
+    if processes and threads > 1 and hasattr(repo, '_regen_process_helper'):
+        regen_processes(repo._regen_process_helper(**options), observer, threads)
+    elif threads == 1:
         def passthru(iterable):
             global count
             for x in iterable:
@@ -9,6 +9,7 @@ from snakeoil.klass import GetAttrProxy
 from pkgcore.ebuild.conditionals import DepSet
 from pkgcore.operations.repo import operations_proxy
 from pkgcore.package.mutated import MutatedPkg
+from pkgcore.repository import multiplex
 from pkgcore.restrictions import packages
 
 
@@ -102,9 +103,11 @@ class multiplex_sorting_repo(object):
         self.__sorter__ = sorter
 
     def itermatch(self, restrict):
-        return iter_sort(
-            self.__sorter__, *[repo.itermatch(restrict)
-                               for repo in self.__repos__])
+        iters = [repo.itermatch(restrict) for repo in self.__repos__]
+        order = multiplex.merge_order(self.__sorter__)
+        if order is None:
+            return iter_sort(self.__sorter__, *iters)
+        return multiplex.merge_sorted(iters, *order)
 
     def match(self, restrict):
         return list(self.itermatch(restrict))
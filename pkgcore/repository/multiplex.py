@@ -5,21 +5,28 @@
 repository that combines multiple repositories together
 """
 
-__all__ = ("tree", "operations")
+__all__ = ("tree", "operations", "merge_order", "merge_sorted")
 
 from functools import partial
+import heapq
 from itertools import chain
 from operator import itemgetter
 
 from snakeoil import klass
 from snakeoil.compatibility import sorted_cmp
 from snakeoil.currying import post_curry
+from snakeoil.demandload import demandload
 from snakeoil.iterables import iter_sort
 
 from pkgcore.config import configurable
 from pkgcore.operations import repo as repo_interface
 from pkgcore.repository import prototype, errors
 
+demandload(
+    'Queue',
+    'threading',
+)
+
 
 class operations(repo_interface.operations_proxy):
 
@@ -60,9 +67,230 @@ class operations(repo_interface.operations_proxy):
         return ret
 
 
-@configurable({'repositories': 'refs:repo'}, typename='repo')
-def config_tree(repositories):
-    return tree(*repositories)
+class _reversed_key(object):
+
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def merge_order(sorter):
+    """Find the ordering a sorter imposes, so its streams can be merged.
+
+    Sorters may declare their ordering via a ``merge_order`` attribute; plain
+    :func:`sorted` and partials of it are recognized as is.
+
+    :return: (key, reverse) tuple as :func:`sorted` accepts them, or None if
+        the sorter is opaque
+    """
+    order = getattr(sorter, 'merge_order', None)
+    if order is not None:
+        return order
+    if sorter is sorted:
+        return None, False
+    if isinstance(sorter, partial) and sorter.func is sorted and not sorter.args:
+        kwds = sorter.keywords or {}
+        if not set(kwds).difference(('key', 'reverse')):
+            return kwds.get('key'), kwds.get('reverse', False)
+    return None
+
+
+def merge_sorted(iterables, key=None, reverse=False):
+    """Merge presorted iterables into a single sorted iterable.
+
+    Unlike :func:`snakeoil.iterables.iter_sort` the heads of the iterables
+    are kept in a heap, so merging n items from k iterables costs
+    O(n log k) comparisons.  Equal items are yielded in iterable order.
+
+    :param iterables: iterables sorted by key and reverse
+    :param key: function returning the sort key of an item
+    :param reverse: if True, the iterables are sorted in descending order
+    """
+    def mk_key(item):
+        k = item if key is None else key(item)
+        return _reversed_key(k) if reverse else k
+
+    heap = []
+    for index, iterable in enumerate(iterables):
+        i = iter(iterable)
+        for item in i:
+            heap.append([mk_key(item), index, item, i])
+            break
+    heapq.heapify(heap)
+    while len(heap) > 1:
+        entry = heap[0]
+        yield entry[2]
+        for item in entry[3]:
+            entry[0] = mk_key(item)
+            entry[2] = item
+            heapq.heapreplace(heap, entry)
+            break
+        else:
+            heapq.heappop(heap)
+    if heap:
+        entry = heap[0]
+        yield entry[2]
+        for item in entry[3]:
+            yield item
+
+
+class _failed(object):
+
+    __slots__ = ('exc',)
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class _pool(object):
+
+    """
+    fixed set of daemon threads running submitted jobs
+
+    The threads are started on the first submission, and live as long as the
+    process; an idle pool costs nothing but the blocked threads.
+    """
+
+    def __init__(self, threads):
+        self.threads = threads
+        self._jobs = None
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        """Queue a callable to be run by one of the threads."""
+        if self._jobs is None:
+            with self._lock:
+                if self._jobs is None:
+                    jobs = Queue.Queue()
+                    for x in xrange(self.threads):
+                        t = threading.Thread(
+                            target=self._run, args=(jobs,), name='multiplex fanout')
+                        # idle workers shouldn't block exit.
+                        t.daemon = True
+                        t.start()
+                    self._jobs = jobs
+        self._jobs.put(job)
+
+    @staticmethod
+    def _run(jobs):
+        while True:
+            jobs.get()()
+
+
+class _fanout_job(object):
+
+    """
+    iterable from a single tree, produced by whoever claims it first
+
+    A pool thread claiming it queues the items for :meth:`stream`; if
+    :meth:`stream` gets there first it iterates the tree itself, so
+    consumers never wait on a job no thread has picked up.
+    """
+
+    _done = object()
+
+    def __init__(self, functor, tree, cancelled, queue_size):
+        self.functor = functor
+        self.tree = tree
+        self.results = Queue.Queue(queue_size)
+        self._cancelled = cancelled
+        self._claim = threading.Lock()
+
+    def __call__(self):
+        if self._cancelled.is_set() or not self._claim.acquire(False):
+            return
+        try:
+            for item in self.functor(self.tree):
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self._put(_failed(e))
+        else:
+            self._put(self._done)
+
+    def _put(self, item):
+        # a full queue blocks us until the consumer catches up, or drains
+        # it on cancellation; either way there's room for this item.
+        if self._cancelled.is_set():
+            return False
+        self.results.put(item)
+        return True
+
+    def stream(self):
+        if self._claim.acquire(False):
+            for item in self.functor(self.tree):
+                yield item
+            return
+        while True:
+            item = self.results.get()
+            if item is self._done:
+                return
+            if isinstance(item, _failed):
+                raise item.exc
+            yield item
+
+    def drain(self):
+        """Empty the result queue, unblocking a producer waiting on it."""
+        while True:
+            try:
+                self.results.get_nowait()
+            except Queue.Empty:
+                return
+
+
+class _fanout(object):
+
+    """
+    consume an iterable per member tree via a :obj:`_pool`
+
+    Each tree's results are queued as they're produced, up to
+    :attr:`queue_size` items ahead of the consumer, and handed out via
+    :attr:`streams`, one iterator per tree in tree order; exceptions raised
+    by a tree are reraised from its stream.  Nothing is submitted to the
+    pool until :meth:`start` is called.
+    """
+
+    queue_size = 128
+
+    def __init__(self, functor, trees, pool):
+        self._cancelled = threading.Event()
+        self._pool = pool
+        self._jobs = [_fanout_job(functor, tree, self._cancelled, self.queue_size)
+                      for tree in trees]
+        self.streams = [job.stream() for job in self._jobs]
+
+    def start(self):
+        """Hand the trees to the pool, in order."""
+        for job in self._jobs:
+            self._pool.submit(job)
+
+    def cancel(self):
+        """Stop producing results once the current items are done."""
+        self._cancelled.set()
+        for job in self._jobs:
+            job.drain()
+
+    def consume(self, iterable):
+        """Start the workers and yield from iterable, cancelling them once
+        it's exhausted or abandoned."""
+        self.start()
+        try:
+            for item in iterable:
+                yield item
+        finally:
+            self.cancel()
+
+
+@configurable({'repositories': 'refs:repo', 'threads': 'int'}, typename='repo')
+def config_tree(repositories, threads=0):
+    return tree(*repositories, threads=threads)
 
 
 class tree(prototype.tree):
@@ -73,84 +301,104 @@ class tree(prototype.tree):
     frozen_settable = False
     operations_kls = operations
 
-    def __init__(self, *trees):
+    def __init__(self, *trees, **kwds):
         """
         :param trees: :obj:`pkgcore.repository.prototype.tree` instances
             to combines into one
+        :keyword threads: if nonzero, query up to this many of the trees
+            concurrently; results are yielded in the same order as when
+            querying them serially
         """
+        threads = kwds.pop('threads', 0)
+        if kwds:
+            raise TypeError(
+                "unknown keyword arguments: %s" % ', '.join(sorted(kwds)))
         super(tree, self).__init__()
         for x in trees:
             if not hasattr(x, 'itermatch'):
                 raise errors.InitializationError(
                     "%s is not a repository tree derivative" % (x,))
         self.trees = trees
+        self.threads = threads
+        self._pool = _pool(threads) if threads else None
+
+    def _map_trees(self, functor, exceptions):
+        """Run functor against each tree, serially or from the thread pool.
+
+        :return: list of the results in tree order, None standing in for
+            trees that raised one of exceptions
+        """
+        def f(tree):
+            try:
+                return [functor(tree)]
+            except exceptions:
+                return [None]
+        if not self.threads:
+            return [f(x)[0] for x in self.trees]
+        fanout = _fanout(f, self.trees, self._pool)
+        return list(fanout.consume(chain.from_iterable(fanout.streams)))
+
+    def _combine_listings(self, results, error):
+        results = [x for x in results if x is not None]
+        if not results:
+            raise KeyError(error)
+        return tuple(set(chain.from_iterable(results)))
 
     def _get_categories(self, *optional_category):
-        d = set()
-        failures = 0
         if optional_category:
             optional_category = optional_category[0]
-            for x in self.trees:
-                try:
-                    d.update(x.categories[optional_category])
-                except KeyError:
-                    failures += 1
-        else:
-            for x in self.trees:
-                try:
-                    map(d.add, x.categories)
-                except (errors.TreeCorruption, KeyError):
-                    failures += 1
-        if failures == len(self.trees):
-            if optional_category:
-                raise KeyError("category base '%s' not found" %
-                               str(optional_category))
-            raise KeyError("failed getting categories")
-        return tuple(d)
+            return self._combine_listings(self._map_trees(
+                lambda x: tuple(x.categories[optional_category]), KeyError),
+                "category base '%s' not found" % str(optional_category))
+        return self._combine_listings(self._map_trees(
+            lambda x: tuple(x.categories), (errors.TreeCorruption, KeyError)),
+            "failed getting categories")
 
     def _get_packages(self, category):
-        d = set()
-        failures = 0
-        for x in self.trees:
-            try:
-                d.update(x.packages[category])
-            except (errors.TreeCorruption, KeyError):
-                failures += 1
-        if failures == len(self.trees):
-            raise KeyError("category '%s' not found" % category)
-        return tuple(d)
+        return self._combine_listings(self._map_trees(
+            lambda x: tuple(x.packages[category]),
+            (errors.TreeCorruption, KeyError)),
+            "category '%s' not found" % category)
 
     def _get_versions(self, package):
-        d = set()
-        failures = 0
-        for x in self.trees:
-            try:
-                d.update(x.versions[package])
-            except (errors.TreeCorruption, KeyError):
-                failures += 1
-
-        if failures == len(self.trees):
-            raise KeyError("category '%s' not found" % package)
-        return tuple(d)
+        return self._combine_listings(self._map_trees(
+            lambda x: tuple(x.versions[package]),
+            (errors.TreeCorruption, KeyError)),
+            "category '%s' not found" % (package,))
 
     def itermatch(self, restrict, **kwds):
         sorter = kwds.get("sorter", iter)
+        if self.threads:
+            fanout = _fanout(
+                lambda repo: repo.itermatch(restrict, **kwds),
+                self.trees, self._pool)
+            return fanout.consume(self._merge_matches(sorter, fanout.streams))
+
         if sorter is iter:
             return (match for repo in self.trees
                     for match in repo.itermatch(restrict, **kwds))
+        return self._merge_matches(
+            sorter, [repo.itermatch(restrict, **kwds) for repo in self.trees])
+
+    itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
+        "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
+
+    def _merge_matches(self, sorter, iters):
+        if sorter is iter:
+            return chain.from_iterable(iters)
 
-        # ugly, and a bit slow, but works.
+        order = merge_order(sorter)
+        if order is not None:
+            return merge_sorted(iters, *order)
+
+        # opaque sorter; ugly, and a bit slow, but works.
         def f(x, y):
             l = sorter([x, y])
             if l[0] == y:
                 return 1
             return -1
         f = post_curry(sorted_cmp, f, key=self.zero_index_grabber)
-        return iter_sort(
-            f, *[repo.itermatch(restrict, **kwds) for repo in self.trees])
-
-    itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
-        "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
+        return iter_sort(f, *iters)
 
     def __iter__(self):
         return (pkg for repo in self.trees for pkg in repo)
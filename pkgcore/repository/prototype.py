@@ -9,6 +9,8 @@ __all__ = (
     "CategoryIterValLazyDict", "PackageMapping", "VersionMapping", "tree"
 )
 
+from functools import partial
+
 from snakeoil.compatibility import is_py3k
 from snakeoil.lists import iflatten_instance
 from snakeoil.mappings import LazyValDict, DictMixin
@@ -117,6 +119,10 @@ class VersionMapping(DictMixin):
             self._cache.pop(key, None)
 
 
+def _prefiltered_match(prefilter, match, pkg):
+    return prefilter(pkg) and match(pkg)
+
+
 class tree(object):
     """
     repository template
@@ -227,21 +233,49 @@ class tree(object):
         if sorter is None:
             sorter = iter
 
-        if isinstance(restrict, atom):
-            candidates = [(restrict.category, restrict.package)]
+        key_atom = restrict
+        if not isinstance(restrict, atom) and \
+                isinstance(restrict, boolean.AndRestriction) and not restrict.negate:
+            # an atom and'd with other restrictions (a visibility filter for
+            # example) still pins down the candidates.
+            key_atom = next(
+                (x for x in restrict.restrictions if isinstance(x, atom)), restrict)
+        if isinstance(key_atom, atom):
+            candidates = [(key_atom.category, key_atom.package)]
         else:
             candidates = self._identify_candidates(restrict, sorter)
 
         if force is None:
-            match = restrict.match
+            # evaluate whatever is derived from the cpv before anything
+            # pulling metadata.  Only plain and/or nodes are descended into;
+            # compiled restrictions (filters, see visibility.filterTree) are
+            # ordered once up front and carry their cost.
+            match = packages.order_by_cost(restrict).match
         elif force:
             match = restrict.force_True
         else:
             match = restrict.force_False
+
+        if force is None or force:
+            prefilter = self._get_prefilter(restrict)
+            if prefilter is not None:
+                match = partial(_prefiltered_match, prefilter, match)
         return self._internal_match(
             candidates, match, sorter, pkg_klass_override,
             yield_none=yield_none)
 
+    def _get_prefilter(self, restrict):
+        """Return a callable rejecting packages that can't match restrict.
+
+        Repos able to answer restrictions without loading package metadata,
+        from an index for example, override this; the callable is handed
+        each candidate package ahead of the actual match and must never
+        reject a package that would match.
+
+        :return: callable, or None if no prefiltering is possible
+        """
+        return None
+
     def _internal_gen_candidates(self, candidates, sorter):
         pkls = self.package_class
         for cp in sorter(candidates):
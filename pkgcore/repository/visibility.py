@@ -14,6 +14,8 @@ from snakeoil.klass import GetAttrProxy
 
 from pkgcore.operations.repo import operations_proxy
 from pkgcore.repository import prototype, errors
+from pkgcore.restrictions import packages
+from pkgcore.restrictions.compiler import compile_restriction, static_compiled
 from pkgcore.restrictions.restriction import base
 
 # these tricks are to keep 2to3 from screwing up.
@@ -40,17 +42,35 @@ class filterTree(prototype.tree):
         self.raw_repo = repo
         if sentinel_val:
             self._filterfunc = ifilter
+            free, costly = packages.split_by_cost(restriction)
         else:
             self._filterfunc = filterfalse
+            free, costly = None, restriction
+        if free is not None:
+            # handed to the raw repo as a single leaf, so it neither expands
+            # nor walks the (potentially huge, think masks) tree per query.
+            free = static_compiled(free)
+        if costly is not None:
+            costly = compile_restriction(costly)
+        self._free_compiled, self._costly_compiled = free, costly
+        self._compiled = compile_restriction(restriction)
 
     def itermatch(self, restrict, **kwds):
-        # note that this lets the repo do the initial filtering.
-        # better design would to analyze the restrictions, and inspect
-        # the repo, determine what can be done without cost
-        # (determined by repo's attributes) versus what does cost
-        # (metadata pull for example).
-        return self._filterfunc(
-            self.restriction.match, self.raw_repo.itermatch(restrict, **kwds))
+        # predicates that don't pull metadata are handed to the raw repo
+        # ahead of restrict, so packages they reject are never loaded; the
+        # costly remainder is applied to what the repo returns.
+        free = self._free_compiled
+        if free is not None and kwds.get('force', True):
+            # free predicates only look at the cpv, so forcing them is
+            # equivalent to matching.  force_False is NAND logic though.
+            restrict = packages.AndRestriction(free, restrict)
+            free = None
+        matches = self.raw_repo.itermatch(restrict, **kwds)
+        if free is not None:
+            matches = ifilter(free.match, matches)
+        if self._costly_compiled is None:
+            return matches
+        return self._filterfunc(self._costly_compiled.match, matches)
 
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
         "@param", "@keyword").replace(":keyword restrict:", ":param restrict:")
@@ -65,7 +85,7 @@ class filterTree(prototype.tree):
 
     def __getitem__(self, key):
         v = self.raw_repo[key]
-        if self.restriction.match(v) != self.sentinel_val:
+        if self._compiled.match(v) != self.sentinel_val:
             raise KeyError(key)
         return v
 
@@ -9,11 +9,11 @@ import operator
 from itertools import chain, islice, ifilterfalse as filterfalse
 import sys
 
-from snakeoil.compatibility import cmp, sort_cmp
 from snakeoil.iterables import caching_iter
 
 # XXX: hack; see insert_blockers
 from pkgcore.ebuild import atom as _atom
+from pkgcore.ebuild.cpv import cpv_sort_key, sorted_cpvs
 from pkgcore.repository import misc, multiplex, visibility
 from pkgcore.resolver import state
 from pkgcore.resolver.choice_point import choice_point
@@ -31,8 +31,9 @@ def dprint(handle, fmt, args=None, label=None):
 
 
 # iter/pkg sorting functions for selection strategy
-pkg_sort_highest = partial(sorted, reverse=True)
-pkg_sort_lowest = sorted
+pkg_sort_highest = partial(sorted_cpvs, reverse=True)
+pkg_sort_highest.merge_order = (cpv_sort_key, True)
+pkg_sort_lowest = sorted_cpvs
 
 pkg_grabber = operator.itemgetter(0)
 
@@ -44,18 +45,7 @@ def highest_iter_sort(l, pkg_grabber=pkg_grabber):
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return 1
-        elif y.repo.livefs:
-            return -1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber, reverse=True)
+    l.sort(key=lambda x: _livefs_key(pkg_grabber(x)), reverse=True)
     return l
 
 
@@ -66,21 +56,21 @@ def lowest_iter_sort(l, pkg_grabber=pkg_grabber):
     :param pkg_grabber: function to use as an attrgetter
     :return: sorted list of packages
     """
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return -1
-        elif y.repo.livefs:
-            return 1
-        return 0
-    sort_cmp(l, f, key=pkg_grabber)
+    l.sort(key=lambda x: _livefs_key(pkg_grabber(x), True))
     return l
 
 
+def _livefs_key(pkg, livefs_first=False):
+    # livefs pkgs sort above others of the same version, or below them if
+    # livefs_first is set.
+    livefs = bool(getattr(pkg.repo, 'livefs', False))
+    return cpv_sort_key(pkg), livefs != livefs_first
+
+# the pkg orderings the above impose, for merging presorted pkg streams.
+highest_iter_sort.merge_order = (_livefs_key, True)
+lowest_iter_sort.merge_order = (partial(_livefs_key, livefs_first=True), False)
+
+
 class MutableContainmentRestriction(values.base):
 
     __slots__ = ('_blacklist', 'match')
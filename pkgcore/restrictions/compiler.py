@@ -0,0 +1,340 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+compilation of package restriction trees into flat matching closures
+
+Matching a restriction tree walks it node by node, every
+:obj:`pkgcore.restrictions.packages.PackageRestriction` pulling its attribute
+from the package on its own.  :func:`compile_restriction` instead generates
+an equivalent matcher up front: nested and/or nodes of the same kind are
+flattened, children are ordered by cost, restrictions sharing an attribute
+pull it once, constant children are folded away, and nodes pinned to a
+category/package (atoms, for example) are dispatched to via a dict keyed on
+``(pkg.category, pkg.package)`` rather than tried one by one.
+
+Whether a restriction is pinned to a category/package is worked out from its
+children; restrictions knowing better (atoms) can say so up front via a
+``pinned_key`` attribute, see :func:`restriction_key`.
+"""
+
+__all__ = (
+    "compiled", "static_compiled", "compile_restriction", "restriction_key")
+
+from pkgcore.restrictions import boolean, packages, restriction, values
+
+
+class compiled(restriction.base):
+
+    """
+    restriction matching exactly what the wrapped restriction does
+
+    The matcher and cost are worked out on first use; force_True and
+    force_False are handed to the wrapped restriction.
+    """
+
+    __slots__ = ('restriction', 'match', '_match', '_cost')
+
+    type = packages.package_type
+    __inst_caching__ = False
+
+    def __init__(self, restrict):
+        """
+        :param restrict: package restriction to compile
+        """
+        if restrict.type != packages.package_type:
+            raise TypeError("restriction must be of type %r, got %r" %
+                            (packages.package_type, restrict))
+        sf = object.__setattr__
+        sf(self, "restriction", restrict)
+        sf(self, "_match", None)
+        sf(self, "_cost", None)
+        sf(self, "match", self._compile_match)
+
+    def _compile_match(self, pkg):
+        # anything that grabbed this bound method before compilation keeps
+        # calling it, so only compile once.
+        match = self._match
+        if match is None:
+            match = _compile(self.restriction)
+            object.__setattr__(self, "_match", match)
+            object.__setattr__(self, "match", match)
+        return match(pkg)
+
+    def force_True(self, pkg):
+        return self.restriction.force_True(pkg)
+
+    def force_False(self, pkg):
+        return self.restriction.force_False(pkg)
+
+    @property
+    def cost(self):
+        # queries and'ing a compiled restriction in are ordered by cost on
+        # every call; don't walk the wrapped tree each time.
+        cost = self._cost
+        if cost is None:
+            cost = packages.restriction_cost(self.restriction)
+            object.__setattr__(self, "_cost", cost)
+        return cost
+
+    def __len__(self):
+        return len(self.restriction)
+
+    def __str__(self):
+        return str(self.restriction)
+
+    def __repr__(self):
+        return '<%s restriction=%r @%#8x>' % (
+            self.__class__.__name__, self.restriction, id(self))
+
+
+class static_compiled(compiled):
+
+    """
+    compiled restriction that forcing can't change the result of
+
+    Restrictions consulting only the cpv and repo of a package (those
+    :obj:`pkgcore.restrictions.packages.restriction_cost` rates as free)
+    can't be forced either way, so force_True and force_False are answered
+    by the compiled matcher instead of walking the wrapped restriction.
+    """
+
+    __slots__ = ()
+
+    # free by definition.
+    cost = 0
+
+    def force_True(self, pkg):
+        return self.match(pkg)
+
+    def force_False(self, pkg):
+        return not self.match(pkg)
+
+
+def compile_restriction(restrict):
+    """Return a :obj:`compiled` equivalent of a package restriction."""
+    if isinstance(restrict, compiled):
+        return restrict
+    return compiled(restrict)
+
+
+_and_match = boolean.AndRestriction.match
+_or_match = boolean.OrRestriction.match
+_attr_match = packages.PackageRestriction.match
+
+
+def _node_kind(restrict):
+    """Return the match method of a plain package and/or node, else None."""
+    if getattr(restrict, "type", None) != packages.package_type:
+        return None
+    match = type(restrict).match
+    # derivatives overriding match (DepSet for example) are leaves.
+    if isinstance(restrict, boolean.AndRestriction) and match == _and_match:
+        return _and_match
+    if isinstance(restrict, boolean.OrRestriction) and match == _or_match:
+        return _or_match
+    return None
+
+
+def _flatten(restrict, kind):
+    """Expand children that are non negated nodes of the same kind."""
+    l = []
+    for x in restrict.restrictions:
+        if _node_kind(x) is kind and not x.negate:
+            l.extend(_flatten(x, kind))
+        else:
+            l.append(x)
+    return l
+
+
+def _is_plain_attr(restrict):
+    return isinstance(restrict, packages.PackageRestriction) and \
+        type(restrict).match == _attr_match
+
+
+def _exact_match(restrict):
+    """Return (attr, value) if restrict is a plain attr == value check."""
+    if not _is_plain_attr(restrict) or restrict.negate:
+        return None
+    r = restrict.restriction
+    if not isinstance(r, values.StrExactMatch) or r.negate or not r.case_sensitive:
+        return None
+    return restrict.attr, r.exact
+
+
+def _node_key(children):
+    """Return the (category, package) the and'd children pin, if any."""
+    pinned = {}
+    for x in children:
+        m = _exact_match(x)
+        if m is not None and m[0] in ("category", "package"):
+            pinned.setdefault(m[0], m[1])
+    if len(pinned) != 2:
+        return None
+    return pinned["category"], pinned["package"]
+
+
+def restriction_key(restrict):
+    """Return the (category, package) a restriction is pinned to, if any.
+
+    A pinned restriction never matches packages of any other
+    category/package.
+    """
+    key = getattr(restrict, "pinned_key", None)
+    if key is not None:
+        return key
+    if _node_kind(restrict) is _and_match and not restrict.negate:
+        return _node_key(_flatten(restrict, _and_match))
+    return None
+
+
+def _compile(restrict):
+    if isinstance(restrict, compiled):
+        restrict = restrict.restriction
+    kind = _node_kind(restrict)
+    if kind is _and_match:
+        f = _compile_and(_flatten(restrict, kind))
+    elif kind is _or_match:
+        f = _compile_or(_flatten(restrict, kind))
+    else:
+        return restrict.match
+    if restrict.negate:
+        return lambda pkg: not f(pkg)
+    return f
+
+
+def _compile_children(children, short_circuit):
+    """Compile the children of a flattened node, cheapest first.
+
+    :param short_circuit: the child result deciding the node, False for
+        and nodes, True for or nodes
+    :return: list of matchers, or None if a constant child decides the node
+    """
+    funcs = []
+    groups = {}
+    for x in sorted(children, key=packages.restriction_cost):
+        if isinstance(x, restriction.AlwaysBool):
+            if x.negate == short_circuit:
+                return None
+            continue
+        if _is_plain_attr(x):
+            group = groups.get(x.attr)
+            if group is None:
+                group = groups[x.attr] = []
+                # placeholder, filled in once all members are known.
+                funcs.append(group)
+            group.append(x)
+            continue
+        funcs.append(_compile(x))
+    for i, x in enumerate(funcs):
+        if isinstance(x, list):
+            funcs[i] = _compile_attr(x, short_circuit)
+    return funcs
+
+
+def _compile_attr(restricts, short_circuit):
+    """Generate a matcher pulling the shared attr of restricts once."""
+    if len(restricts) == 1:
+        return restricts[0].match
+    pull = restricts[0]._pull_attr
+    sentinel = restricts[0].__sentinel__
+    checks = tuple((x.restriction.match, x.negate) for x in restricts)
+    if short_circuit:
+        def f(pkg):
+            val = pull(pkg)
+            if val is sentinel:
+                return any(negate for match, negate in checks)
+            for match, negate in checks:
+                if match(val) != negate:
+                    return True
+            return False
+    else:
+        def f(pkg):
+            val = pull(pkg)
+            if val is sentinel:
+                return all(negate for match, negate in checks)
+            for match, negate in checks:
+                if match(val) == negate:
+                    return False
+            return True
+    return f
+
+
+def _compile_and(children, key=None):
+    """
+    :param key: (category, package) the caller already verified; checks for
+        it are dropped
+    """
+    if key is None:
+        key = check_key = _node_key(children)
+    else:
+        check_key = None
+    if key is not None:
+        checks = (("category", key[0]), ("package", key[1]))
+        children = [x for x in children if _exact_match(x) not in checks]
+    funcs = _compile_children(children, False)
+    if funcs is None:
+        return lambda pkg: False
+    if check_key is not None:
+        category, package = check_key
+        def f(pkg):
+            try:
+                return pkg.category == category and pkg.package == package
+            except AttributeError:
+                return False
+        funcs.insert(0, f)
+    if not funcs:
+        return lambda pkg: True
+    elif len(funcs) == 1:
+        return funcs[0]
+    def f(pkg):
+        for func in funcs:
+            if not func(pkg):
+                return False
+        return True
+    return f
+
+
+def _compile_or(children):
+    table = {}
+    residual = []
+    for x in children:
+        key = restriction_key(x)
+        if key is not None:
+            if _node_kind(x) is _and_match and not x.negate:
+                f = _compile_and(_flatten(x, _and_match), key)
+            else:
+                f = _compile(x)
+            table.setdefault(key, []).append(f)
+            continue
+        residual.append(x)
+    funcs = _compile_children(residual, True)
+    if funcs is None:
+        return lambda pkg: True
+    if table:
+        for key, l in table.iteritems():
+            if len(l) == 1:
+                table[key] = l[0]
+            else:
+                table[key] = _compile_any(l)
+        def f(pkg):
+            try:
+                func = table.get((pkg.category, pkg.package))
+            except AttributeError:
+                return False
+            return func is not None and func(pkg)
+        funcs.insert(0, f)
+    if not funcs:
+        return lambda pkg: False
+    elif len(funcs) == 1:
+        return funcs[0]
+    return _compile_any(funcs)
+
+
+def _compile_any(funcs):
+    def f(pkg):
+        for func in funcs:
+            if func(pkg):
+                return True
+        return False
+    return f
@@ -21,16 +21,19 @@ class delegate(restriction.base):
     :obj:`pkgcore.ebuild.domain`.
     """
 
-    __slots__ = ('_transform', 'negate')
+    __slots__ = ('_transform', 'negate', 'cost')
 
     type = packages.package_type
     inst_caching = False
 
-    def __init__(self, transform_func, negate=False):
+    def __init__(self, transform_func, negate=False, cost=None):
         """
 
         :param transform_func: callable invoked with data, pkg, and mode
             mode may be "match", "force_True", or "force_False"
+        :param cost: relative cost of matching, see
+            :obj:`pkgcore.restrictions.packages.restriction_cost`;
+            None if unknown
         """
 
         if not callable(transform_func):
@@ -38,6 +41,7 @@ class delegate(restriction.base):
 
         object.__setattr__(self, "negate", negate)
         object.__setattr__(self, "_transform", transform_func)
+        object.__setattr__(self, "cost", cost)
 
 
     def match(self, pkginst):
@@ -0,0 +1,94 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+lookup of restriction:data pairs applying to a package
+
+Configuration like package.keywords or package.license is a list of
+restriction:data pairs, nearly all of them atoms.  Rather than trying each
+restriction against every package, :obj:`RestrictionIndex` files pairs under
+the category/package their restriction is pinned to; only those and the
+(usually few) unpinned ones are tried.
+"""
+
+__all__ = ("RestrictionIndex",)
+
+from heapq import merge
+from itertools import chain
+from operator import itemgetter
+
+from snakeoil.klass import generic_equality
+
+from pkgcore.restrictions.compiler import compile_restriction, restriction_key
+
+
+class RestrictionIndex(object):
+
+    """
+    restriction:data pairs indexed by the category/package they're pinned to
+
+    Pairs whose restriction isn't pinned (globs, category wide matches,
+    AlwaysTrue, ...) form a residual list tried for every package.  Lookups
+    yield pairs in the order they were added.
+    """
+
+    __metaclass__ = generic_equality
+    __attr_comparison__ = ("__class__", "pairs")
+
+    def __init__(self, pairs=()):
+        """
+        :param pairs: iterable of (restriction, data) to add
+        """
+        # entries are (position, compiled restriction, data).
+        self._keyed = {}
+        self._residual = []
+        self._count = 0
+        for restrict, data in pairs:
+            self.add(restrict, data)
+
+    def add(self, restrict, data, key=None):
+        """Add a pair.
+
+        :param key: (category, package) to file the pair under, rather than
+            the one restrict is pinned to; restrict is then only tried for
+            packages of that category/package
+        """
+        if key is None:
+            key = restriction_key(restrict)
+        entry = (self._count, compile_restriction(restrict), data)
+        self._count += 1
+        if key is None:
+            self._residual.append(entry)
+        else:
+            self._keyed.setdefault(key, []).append(entry)
+
+    def _entries(self, pkg):
+        try:
+            keyed = self._keyed.get((pkg.category, pkg.package))
+        except AttributeError:
+            keyed = None
+        if keyed is None:
+            return self._residual
+        elif not self._residual:
+            return keyed
+        return merge(keyed, self._residual)
+
+    def iter_matches(self, pkg):
+        """Yield the data of each pair whose restriction matches pkg."""
+        for position, restrict, data in self._entries(pkg):
+            if restrict.match(pkg):
+                yield data
+
+    @property
+    def pairs(self):
+        """all (restriction, data) pairs, in the order added"""
+        entries = sorted(chain(self._residual, *self._keyed.itervalues()),
+                         key=itemgetter(0))
+        return tuple((restrict.restriction, data)
+                     for position, restrict, data in entries)
+
+    def __len__(self):
+        return self._count
+
+    def __nonzero__(self):
+        return self._count != 0
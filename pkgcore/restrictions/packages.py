@@ -80,6 +80,14 @@ class PackageRestriction_mixin(restriction.base):
     subtype = restriction.value_type
     conditional = False
 
+    # relative cost of pulling an attribute (its first component) from a
+    # package; anything derived from the cpv or owning repo is free, anything
+    # unlisted is assumed to require a metadata pull.
+    attr_costs = dict.fromkeys(
+        ("category", "package", "key", "cpvstr", "fullver", "version",
+         "revision", "unversioned_atom", "versioned_atom", "repo"), 0)
+    default_attr_cost = 10
+
     def _handle_exception(self, pkg, exc, attr_split):
         if isinstance(exc, AttributeError):
             if not self.ignore_missing:
@@ -146,6 +154,10 @@ class PackageRestriction_mixin(restriction.base):
     def attrs(self):
         return (self.attr,)
 
+    @property
+    def cost(self):
+        return max(_attr_cost(x) for x in self.attrs)
+
 
 class native_PackageRestrictionMulti(native_PackageRestriction):
 
@@ -298,6 +310,77 @@ class Conditional(PackageRestriction):
 
 
 
+def _attr_cost(attr):
+    return PackageRestriction_mixin.attr_costs.get(
+        attr.split('.', 1)[0], PackageRestriction_mixin.default_attr_cost)
+
+
+def restriction_cost(restrict):
+    """Estimate the relative cost of matching a package restriction.
+
+    Zero means only attributes derived from the package's cpv or repo are
+    consulted; restrictions that can't be analyzed are assumed to pull
+    metadata.
+    """
+    if isinstance(restrict, boolean.base):
+        return max([restriction_cost(x) for x in restrict.restrictions] or [0])
+    cost = getattr(restrict, 'cost', None)
+    if cost is not None:
+        return cost
+    if isinstance(restrict, restriction.AlwaysBool):
+        return 0
+    attr = getattr(restrict, 'attr', None)
+    if isinstance(attr, basestring):
+        # non PackageRestriction derivatives matching a single attr,
+        # VersionMatch for example.
+        return _attr_cost(attr)
+    return PackageRestriction_mixin.default_attr_cost
+
+
+def order_by_cost(restrict):
+    """Return an equivalent restriction matching its cheapest children first.
+
+    Only plain package And/Or restrictions are reordered (recursively);
+    anything else, atoms included, is returned as is.  Reordering only
+    affects :obj:`match` short circuiting, not the result.
+    """
+    if type(restrict) not in (boolean.AndRestriction, boolean.OrRestriction) \
+            or restrict.type != package_type:
+        return restrict
+    children = [order_by_cost(x) for x in restrict.restrictions]
+    ordered = sorted(children, key=restriction_cost)
+    if all(x is y for x, y in zip(ordered, restrict.restrictions)):
+        return restrict
+    return restrict.change_restrictions(*ordered)
+
+
+def split_by_cost(restrict):
+    """Split a restriction into its free and its costly parts.
+
+    The parts and'd together are equivalent to restrict.
+
+    :return: (free, costly) tuple, either of which may be None if empty
+    """
+    if type(restrict) is not boolean.AndRestriction or restrict.negate \
+            or restrict.type != package_type:
+        if restriction_cost(restrict):
+            return None, order_by_cost(restrict)
+        return restrict, None
+    free, costly = [], []
+    for x in restrict.restrictions:
+        if restriction_cost(x):
+            costly.append(x)
+        else:
+            free.append(x)
+    def mk(l):
+        if not l:
+            return None
+        elif len(l) == 1:
+            return order_by_cost(l[0])
+        return order_by_cost(restrict.change_restrictions(*l))
+    return mk(free), mk(costly)
+
+
 # "Invalid name" (pylint uses the module const regexp, not the class regexp)
 # pylint: disable-msg=C0103
 
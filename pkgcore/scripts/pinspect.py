@@ -19,6 +19,7 @@ demandload(
     'collections:defaultdict',
     'itertools:groupby,islice',
     'operator:attrgetter,itemgetter',
+    'snakeoil.chksum:LazilyHashedPath',
     'snakeoil.lists:iflatten_instance,unstable_unique',
     'pkgcore:fetch',
     'pkgcore.package:errors',
@@ -231,8 +232,21 @@ class eclass_usage_kls(histo_data):
 
     def get_data(self, repo, options):
         pos, data = 0, defaultdict(lambda:0)
+        # the eclass index answers without pulling (and validating) metadata,
+        # for packages whose ebuild and eclasses are unchanged since.
+        index = getattr(repo, 'eclass_index', None)
         for pos, pkg in enumerate(repo):
-            for eclass in getattr(pkg, 'inherited', ()):
+            eclasses = None
+            if index is not None:
+                try:
+                    mtime = LazilyHashedPath(pkg.path).mtime
+                except EnvironmentError:
+                    mtime = None
+                if index.is_current(pkg.cpvstr, mtime, repo.eclass_cache):
+                    eclasses = index.inherits(pkg.cpvstr)
+            if eclasses is None:
+                eclasses = getattr(pkg, 'inherited', ())
+            for eclass in eclasses:
                 data[eclass] += 1
         return data, pos + 1
 
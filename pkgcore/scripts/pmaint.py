@@ -179,9 +179,33 @@ regen.add_argument(
     default=commandline.DelayedValue(_get_default_jobs, 100),
     help="number of threads to use for regeneration. Defaults to using all "
     "available processors")
+regen.add_argument(
+    "--processes", action='store_true', default=False,
+    help="""
+        Regenerate using worker processes instead of threads; --threads
+        controls the number of workers. Each worker runs its own ebuild
+        daemon and sends the generated metadata back to the main process
+        which writes it to the cache, avoiding contention on the GIL.
+    """)
 regen.add_argument(
     "--force", action='store_true', default=False,
     help="force regeneration to occur regardless of staleness checks")
+regen.add_argument(
+    "--incremental", action='store_true', default=False,
+    help="""
+        Only check packages whose ebuild or inherited eclasses changed since
+        the last regen, as recorded in a journal kept in the repository's
+        writable cache. Falls back to a full regen if there's no journal.
+    """)
+regen.add_argument(
+    "--attr-index", action='store_true', default=False,
+    help="""
+        Build an index of license, keywords, iuse, inherited eclasses,
+        description words and dependencies from the regenerated cache, letting
+        queries on those (e.g. pquery --license or --restrict-revdep) skip
+        packages without loading their metadata. Once built, cache updates
+        keep it current.
+    """)
 regen.add_argument(
     "--rsync", action='store_true', default=False,
     help="perform actions necessary for rsync repos (update metadata/timestamp.chk)")
@@ -202,9 +226,15 @@ def regen_main(options, out, err):
 
         start_time = time.time()
         repo.operations.regen_cache(
-            threads=options.threads,
+            threads=options.threads, processes=options.processes,
+            incremental=options.incremental,
             observer=observer.formatter_output(out), force=options.force,
             eclass_caching=(not options.disable_eclass_caching))
+        if options.attr_index:
+            if getattr(repo, 'build_attr_index', None) is None or \
+                    repo.build_attr_index() is None:
+                out.error(
+                    "repository %s doesn't support an attr index" % (repo,))
         end_time = time.time()
         if options.verbose:
             out.write(
@@ -9,7 +9,7 @@ from functools import partial
 from snakeoil.demandload import demandload
 from snakeoil.formatters import decorate_forced_wrapping
 
-from pkgcore.ebuild import conditionals, atom
+from pkgcore.ebuild import conditionals, atom, cpv, restricts
 from pkgcore.restrictions import packages, values, boolean
 from pkgcore.util import (
     commandline, repo_utils, parserestrict, packages as pkgutils)
@@ -382,7 +382,7 @@ def print_packages_noversion(options, out, err, pkgs):
         out.write(out.bold, green, ' * ', out.fg(), pkgs[0].key)
         out.wrap = True
         out.later_prefix = ['                  ']
-        versions = ' '.join(pkg.fullver for pkg in sorted(pkgs))
+        versions = ' '.join(pkg.fullver for pkg in cpv.sorted_cpvs(pkgs))
         out.write(green, '     versions: ', out.fg(), versions)
         # If we are already matching on all repos we do not need to duplicate.
         if not options.all_repos:
@@ -573,15 +573,7 @@ def parse_revdep(value):
         targetatom = atom.atom(value)
     except atom.MalformedAtom as e:
         raise parserestrict.ParseError(str(e))
-    val_restrict = values.FlatteningRestriction(
-        atom.atom,
-        values.AnyMatch(values.FunctionRestriction(targetatom.intersects)))
-    return packages.OrRestriction(*list(
-        packages.PackageRestriction(dep, val_restrict)
-        for dep in ('depends', 'rdepends', 'post_rdepends')))
-
-def _revdep_pkgs_match(pkgs, value):
-    return any(value.match(pkg) for pkg in pkgs)
+    return restricts.revdep(targetatom)
 
 @bind_add_query(
     '--restrict-revdep-pkgs', action='append', type=atom.atom,
@@ -596,11 +588,7 @@ def revdep_pkgs_finalize(sequence, namespace):
         for repo in namespace.repos:
             l.extend(repo.itermatch(atom_inst))
     # have our pkgs; now build the restrict.
-    any_restrict = values.AnyMatch(
-        values.FunctionRestriction(partial(_revdep_pkgs_match, tuple(l))))
-    r = values.FlatteningRestriction(atom.atom, any_restrict)
-    return list(packages.PackageRestriction(dep, r)
-                for dep in ('depends', 'rdepends', 'post_rdepends'))
+    return [restricts.revdep_pkgs(l)]
 
 @bind_add_query(
     '--description', '-S', action='append', dest='description',
@@ -855,15 +843,18 @@ def main(options, out, err):
         return 0
     for repo in options.repos:
         try:
-            for pkgs in pkgutils.groupby_pkg(repo.itermatch(options.query, sorter=sorted)):
+            for pkgs in pkgutils.groupby_pkg(
+                    repo.itermatch(options.query, sorter=cpv.sorted_cpvs)):
                 pkgs = list(pkgs)
                 if options.noversion:
                     print_packages_noversion(options, out, err, pkgs)
                 elif options.min or options.max:
                     if options.min:
-                        print_package(options, out, err, min(pkgs))
+                        print_package(options, out, err,
+                                      min(pkgs, key=cpv.cpv_sort_key))
                     if options.max:
-                        print_package(options, out, err, max(pkgs))
+                        print_package(options, out, err,
+                                      max(pkgs, key=cpv.cpv_sort_key))
                 else:
                     for pkg in pkgs:
                         print_package(options, out, err, pkg)
@@ -1,12 +1,13 @@
 # Copyright: 2006 Marien Zwart <marienz@gentoo.org>
 # License: BSD/GPL2
 
+import logging
 import operator
 
 from snakeoil.chksum import LazilyHashedPath
 
 from pkgcore.cache import base, errors, bulk
-from pkgcore.test import TestCase
+from pkgcore.test import TestCase, silence_logging
 
 
 def _mk_chf_obj(**kwargs):
@@ -181,6 +182,54 @@ class BaseTest(TestCase):
         db["dar5"] = {"foo":"blah"}
         self.assertLen(tracker, 3)
 
+    def test_write_behind(self):
+        db = self.get_db()
+        db['spork'] = {'foo': 'bar'}
+        db.set_sync_rate(1000)
+        db.set_write_behind(10)
+        db['foon'] = {'foo': 'baz'}
+        del db['spork']
+        # queued updates are visible to lookups, not membership tests.
+        self.assertEqual({'foo': 'baz'}, db['foon'])
+        self.assertRaises(KeyError, operator.getitem, db, 'spork')
+        self.assertRaises(KeyError, operator.delitem, db, 'spork')
+        self.assertNotIn('foon', db)
+        db.commit()
+        self.assertEqual(['foon'], sorted(db))
+
+        # writers block on a full queue till it's written out.
+        db.set_write_behind(1)
+        for x in xrange(20):
+            db['dar%i' % x] = {'foo': str(x)}
+        db.set_write_behind(0)
+        self.assertIdentical(db._write_behind, None)
+        self.assertEqual({'foo': '19'}, db['dar19'])
+        self.assertLen(list(db), 21)
+
+    @silence_logging(logging.root)
+    def test_write_behind_errors(self):
+        db = self.get_db()
+        failed = []
+        db.set_write_behind(10, on_error=lambda cpv, e: failed.append((cpv, e)))
+
+        orig_setitem = db._setitem
+        def _setitem(cpv, values):
+            if cpv == 'spork':
+                raise errors.CacheCorruption(cpv, 'bad disk')
+            orig_setitem(cpv, values)
+        db._setitem = _setitem
+        db['spork'] = {'foo': 'bar'}
+        db['foon'] = {'foo': 'baz'}
+        # failures are reported per entry, without affecting the others.
+        db.commit()
+        self.assertEqual([x[0] for x in failed], ['spork'])
+        self.assertIsInstance(failed[0][1], errors.CacheCorruption)
+        self.assertEqual(['foon'], sorted(db))
+        db.set_write_behind(0)
+        self.assertLen(failed, 1)
+        self.assertRaises(errors.ReadOnly,
+                          self.get_db(True).set_write_behind, 10)
+
 
 class TestBulk(BaseTest):
 
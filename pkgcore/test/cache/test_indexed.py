@@ -0,0 +1,107 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+import operator
+import os
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import indexed, errors
+from pkgcore.test.cache import util, test_base
+
+
+class db(indexed.database):
+
+    def __setitem__(self, cpv, data):
+        data['_chf_'] = test_base._chf_obj
+        return indexed.database.__setitem__(self, cpv, data)
+
+    def __getitem__(self, cpv):
+        d = dict(indexed.database.__getitem__(self, cpv).iteritems())
+        d.pop('_%s_' % self.chf_type, None)
+        return d
+
+
+class TestIndexed(util.GenericCacheMixin, TempDirMixin):
+
+    def get_db(self, readonly=False):
+        return db(self.dir,
+            auxdbkeys=self.cache_keys, readonly=readonly)
+
+    def test_roundtrip(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0', 'KEYWORDS': 'x86'}
+        cache['dev-util/foo-2'] = {'SLOT': '1'}
+        cache['dev-util/foo-1'] = {'SLOT': '2'}
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '2'})
+        # a fresh instance has to rebuild the same view from the file.
+        cache = self.get_db()
+        self.assertEqual(sorted(cache), ['dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '2'})
+        self.assertEqual(cache['dev-util/foo-2'], {'SLOT': '1'})
+        self.assertEqual(len(os.listdir(self.dir)), 1)
+
+    def test_delitem(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0'}
+        del cache['dev-util/foo-1']
+        self.assertNotIn('dev-util/foo-1', cache)
+        self.assertRaises(KeyError, operator.delitem, cache, 'dev-util/foo-1')
+        self.assertRaises(KeyError, operator.getitem, self.get_db(), 'dev-util/foo-1')
+
+    def test_concurrent_instances(self):
+        reader = self.get_db()
+        self.assertNotIn('dev-util/foo-1', reader)
+        writer = self.get_db()
+        writer['dev-util/foo-1'] = {'SLOT': '0'}
+        self.assertEqual(reader['dev-util/foo-1'], {'SLOT': '0'})
+        writer['dev-util/foo-1'] = {'SLOT': '1'}
+        writer.commit(force=True)
+        # the reader's mapping points at the pre-compaction file.
+        writer['dev-util/foo-2'] = {'SLOT': '3'}
+        self.assertEqual(reader['dev-util/foo-2'], {'SLOT': '3'})
+        self.assertEqual(reader['dev-util/foo-1'], {'SLOT': '1'})
+
+    def test_commit(self):
+        cache = self.get_db()
+        for x in xrange(10):
+            cache['dev-util/foo-1'] = {'SLOT': str(x)}
+        cache['dev-util/foo-2'] = {'SLOT': '0'}
+        size = os.stat(cache.path).st_size
+        cache.commit()
+        self.assertTrue(os.stat(cache.path).st_size < size)
+        size = os.stat(cache.path).st_size
+        cache.commit(force=True)
+        self.assertEqual(os.stat(cache.path).st_size, size)
+        cache = self.get_db()
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '9'})
+        self.assertEqual(cache['dev-util/foo-2'], {'SLOT': '0'})
+
+    def test_corruption(self):
+        with open(pjoin(self.dir, indexed.database.filename), 'w') as f:
+            f.write('not a cache\n')
+        self.assertRaises(errors.GeneralCacheCorruption,
+                          operator.getitem, self.get_db(), 'dev-util/foo-1')
+
+    def test_truncated_tail(self):
+        cache = self.get_db()
+        cache['dev-util/foo-1'] = {'SLOT': '0'}
+        # a writer died partway through its record.
+        with open(cache.path, 'a') as f:
+            f.write('dev-util/foo-2 100\nSLOT=')
+        for partial in (self.get_db(), cache):
+            partial['dev-util/foo-3'] = {'SLOT': '3'}
+            self.assertEqual(partial['dev-util/foo-3'], {'SLOT': '3'})
+        cache = self.get_db()
+        self.assertEqual(sorted(cache), ['dev-util/foo-1', 'dev-util/foo-3'])
+        self.assertEqual(cache['dev-util/foo-1'], {'SLOT': '0'})
+        self.assertEqual(cache['dev-util/foo-3'], {'SLOT': '3'})
+
+        # partial headers are dropped too.
+        with open(cache.path, 'a') as f:
+            f.write('dev-util/fo')
+        cache['dev-util/foo-4'] = {'SLOT': '4'}
+        cache = self.get_db()
+        self.assertEqual(cache['dev-util/foo-4'], {'SLOT': '4'})
+        self.assertEqual(cache['dev-util/foo-3'], {'SLOT': '3'})
@@ -63,3 +63,16 @@ class GenericCacheMixin(TestCase):
             d = dict(raw_data)
             db[key] = d
 
+
+    def test_interned_values(self):
+        db = self.get_db(False)
+        for cpv in ('dev-util/foo-1', 'dev-util/foo-2'):
+            # built at runtime so they aren't interned already.
+            db[cpv] = {'LICENSE': '-'.join(['GPL', '2']),
+                       'SLOT': ''.join(['1', '0'])}
+        db.commit()
+        db = self.get_db(True)
+        foo1, foo2 = db['dev-util/foo-1'], db['dev-util/foo-2']
+        self.assertEqual(foo1['LICENSE'], 'GPL-2')
+        self.assertIdentical(foo1['LICENSE'], foo2['LICENSE'])
+        self.assertIdentical(foo1['SLOT'], foo2['SLOT'])
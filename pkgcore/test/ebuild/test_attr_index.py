@@ -0,0 +1,223 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+import fcntl
+import logging
+import threading
+import time
+
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import flat_hash
+from pkgcore.ebuild import attr_index, restricts
+from pkgcore.ebuild.atom import atom
+from pkgcore.restrictions import packages, values
+from pkgcore.test import TestCase, silence_logging
+from pkgcore.test.ebuild.test_eclass_cache import FakeEclassCache
+
+
+def contains(attr, *vals, **kwds):
+    return packages.PackageRestriction(
+        attr, values.ContainmentMatch2(frozenset(vals), **kwds))
+
+
+def revdep(target):
+    return restricts.revdep(atom(target))
+
+
+class TestEntryTokens(TestCase):
+
+    def test_tokens(self):
+        tokens = attr_index.entry_tokens({
+            'LICENSE': 'GPL-2 doc? ( FDL-1.2 ) || ( MIT BSD )',
+            'KEYWORDS': 'x86 ~amd64',
+            'IUSE': '+doc test',
+            'DESCRIPTION': 'A Fancy library, for foo-ing',
+            'DEPEND': '>=dev-libs/foo-1.2:0=[bar] !!dev-util/bar doc? ( app-doc/baz )',
+            'RDEPEND': '=dev-libs/quux-1* dev-libs/foo::gentoo',
+            '_eclasses_': {'eclass1': None},
+        })
+        self.assertEqual(tokens['license'],
+                         frozenset(['GPL-2', 'FDL-1.2', 'MIT', 'BSD']))
+        self.assertEqual(tokens['keywords'], frozenset(['x86', '~amd64']))
+        self.assertEqual(tokens['iuse'], frozenset(['+doc', 'test']))
+        self.assertEqual(tokens['inherited'], frozenset(['eclass1']))
+        self.assertEqual(tokens['description'],
+                         frozenset(['a', 'fancy', 'library', 'for', 'foo', 'ing']))
+        self.assertEqual(tokens['deps'], frozenset(
+            ['dev-libs/foo', 'dev-util/bar', 'app-doc/baz', 'dev-libs/quux']))
+
+    def test_unparsable_deps(self):
+        for depend in ('>=dev-libs/foo', 'dev-libs/foo )', 'doc? ( dev-libs/foo'):
+            tokens = attr_index.entry_tokens({'DEPEND': depend})
+            self.assertNotIn('deps', tokens)
+            self.assertNotIn('revdeps', tokens)
+
+    def test_dep_edges(self):
+        self.assertEqual(attr_index.dep_edges({
+            'DEPEND': 'dev-libs/foo doc? ( !test? ( >=dev-libs/bar-1 ) || ( a/b c/d ) )',
+            'PDEPEND': 'x? ( a/b ) c/d',
+        }), [
+            ('depends', 'dev-libs/foo', ()),
+            ('depends', '>=dev-libs/bar-1', ('doc', '!test')),
+            ('depends', 'a/b', ('doc',)),
+            ('depends', 'c/d', ('doc',)),
+            ('post_rdepends', 'a/b', ('x',)),
+            ('post_rdepends', 'c/d', ()),
+        ])
+
+
+class TestAttrIndex(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.path = pjoin(self.dir, 'index')
+        self.ec = FakeEclassCache('/nonexistent/path')
+
+    def mk_index(self):
+        return attr_index.AttrIndex(self.path)
+
+    def populate(self, index):
+        eclasses = {'eclass1': self.ec.eclasses['eclass1']}
+        index.update('dev-util/foo-1', 1, {
+            'LICENSE': 'GPL-2', 'KEYWORDS': 'x86', 'DESCRIPTION': 'diffing tool',
+            'RDEPEND': 'dev-libs/bar', '_eclasses_': eclasses})
+        index.update('dev-util/foo-2', 2, {
+            'LICENSE': 'GPL-2 MIT', 'KEYWORDS': '~x86 amd64',
+            'DESCRIPTION': 'diffing tool', '_eclasses_': eclasses})
+        index.update('dev-util/bar-1', 3, {'LICENSE': 'BSD', 'IUSE': 'doc'})
+
+    def test_index_path(self):
+        caches = [flat_hash.database(pjoin(self.dir, 'ro'), readonly=True),
+                  flat_hash.database(pjoin(self.dir, 'rw'))]
+        self.assertEqual(attr_index.index_path(caches),
+                         pjoin(self.dir, 'rw', '.attr-index'))
+        self.assertIdentical(attr_index.index_path(caches[:1]), None)
+
+    def test_candidates(self):
+        index = self.mk_index()
+        self.populate(index)
+        for index in (index, self.mk_index()):
+            candidates = index.candidates
+            self.assertEqual(candidates(contains('license', 'GPL-2')),
+                             frozenset(['dev-util/foo-1', 'dev-util/foo-2']))
+            self.assertEqual(candidates(contains('license', 'MIT', 'BSD')),
+                             frozenset(['dev-util/foo-2', 'dev-util/bar-1']))
+            self.assertEqual(
+                candidates(contains('license', 'GPL-2', 'MIT', match_all=True)),
+                frozenset(['dev-util/foo-2']))
+            self.assertEqual(candidates(contains('iuse', 'doc')),
+                             frozenset(['dev-util/bar-1']))
+            self.assertEqual(candidates(contains('inherited', 'eclass1')),
+                             frozenset(['dev-util/foo-1', 'dev-util/foo-2']))
+            self.assertEqual(candidates(revdep('>=dev-libs/bar-2')),
+                             frozenset(['dev-util/foo-1']))
+            self.assertEqual(
+                candidates(packages.PackageRestriction(
+                    'description', values.StrRegex('Diff', case_sensitive=False))),
+                frozenset(['dev-util/foo-1', 'dev-util/foo-2']))
+            # boolean combinations; unanswerable children are ignored in ands.
+            self.assertEqual(
+                candidates(packages.AndRestriction(
+                    contains('license', 'GPL-2'), contains('keywords', 'amd64'),
+                    atom('dev-util/foo'))),
+                frozenset(['dev-util/foo-2']))
+            self.assertEqual(
+                candidates(packages.OrRestriction(
+                    contains('keywords', 'x86'), contains('license', 'BSD'))),
+                frozenset(['dev-util/foo-1', 'dev-util/bar-1']))
+
+    def test_unanswerable(self):
+        index = self.mk_index()
+        self.populate(index)
+        for restrict in (
+                atom('dev-util/foo'),
+                contains('license', 'GPL-2', negate=True),
+                packages.PackageRestriction(
+                    'license', values.ContainmentMatch2(frozenset(['GPL-2'])),
+                    negate=True),
+                packages.PackageRestriction(
+                    'description', values.StrRegex('diff.*tool')),
+                packages.OrRestriction(
+                    contains('license', 'BSD'), atom('dev-util/foo'))):
+            self.assertIdentical(index.candidates(restrict), None, restrict)
+
+    def test_dep_edges(self):
+        index = self.mk_index()
+        index.update('dev-util/foo-1', 1, {
+            'DEPEND': 'doc? ( >=dev-libs/bar-1:0= )', 'RDEPEND': 'dev-libs/bar'})
+        index.update('dev-util/foo-2', 1, {'DEPEND': 'dev-libs/foo )'})
+        for index in (index, self.mk_index()):
+            self.assertEqual(sorted(index.dep_edges('dev-util/foo-1', 'dev-libs/bar')), [
+                ('depends', '>=dev-libs/bar-1:0=', ('doc',)),
+                ('rdepends', 'dev-libs/bar', ()),
+            ])
+            self.assertEqual(index.dep_edges('dev-util/foo-1', 'dev-libs/foo'), [])
+            self.assertIdentical(index.dep_edges('dev-util/foo-2', 'dev-libs/foo'), None)
+            self.assertIdentical(index.dep_edges('dev-util/foo-3', 'dev-libs/foo'), None)
+            self.assertEqual(
+                index.candidates(restricts.revdep_pkgs([atom('=dev-libs/bar-2')])),
+                frozenset(['dev-util/foo-1', 'dev-util/foo-2']))
+
+    def test_unknown_tokens(self):
+        index = self.mk_index()
+        index.update('dev-util/foo-1', 1, {'DEPEND': '>=dev-libs/bar'})
+        index.update('dev-util/foo-2', 1, {'DEPEND': 'dev-libs/baz'})
+        self.assertEqual(index.candidates(revdep('dev-libs/bar')),
+                         frozenset(['dev-util/foo-1']))
+
+    def test_is_current(self):
+        index = self.mk_index()
+        self.populate(index)
+        self.assertTrue(index.is_current('dev-util/foo-1', 1, self.ec))
+        self.assertFalse(index.is_current('dev-util/foo-1', 2, self.ec))
+        self.assertFalse(index.is_current('dev-util/foo-3', 1, self.ec))
+        self.ec.eclasses['eclass1'] = LazilyHashedPath(
+            '/nonexistent/path', mtime=300)
+        self.assertFalse(index.is_current('dev-util/foo-1', 1, self.ec))
+        self.assertTrue(index.is_current('dev-util/bar-1', 3, self.ec))
+
+    def test_discard_and_commit(self):
+        index = self.mk_index()
+        self.populate(index)
+        self.populate(index)
+        index.discard('dev-util/foo-2')
+        index.commit()
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        for index in (index, self.mk_index()):
+            self.assertEqual(sorted(index), ['dev-util/bar-1', 'dev-util/foo-1'])
+            self.assertEqual(index.candidates(contains('license', 'GPL-2')),
+                             frozenset(['dev-util/foo-1']))
+
+    def test_writes_locked(self):
+        index = self.mk_index()
+        self.populate(index)
+        self.populate(index)
+        self.populate(index)
+        with open(self.path) as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            writers = [threading.Thread(target=index.commit),
+                       threading.Thread(target=self.mk_index().update,
+                                        args=('dev-util/baz-1', 1, {'LICENSE': 'MIT'}))]
+            for t in writers:
+                t.start()
+            time.sleep(0.1)
+            # both wait on the lock, rather than racing the compaction.
+            self.assertTrue(all(t.is_alive() for t in writers))
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            for t in writers:
+                t.join()
+        index = self.mk_index()
+        self.assertEqual(sorted(index),
+            ['dev-util/bar-1', 'dev-util/baz-1', 'dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(index.candidates(contains('license', 'MIT')),
+                         frozenset(['dev-util/baz-1', 'dev-util/foo-2']))
+
+    @silence_logging(logging.root)
+    def test_malformed(self):
+        with open(self.path, 'w') as f:
+            f.write('garbage\ndev-util/foo-1\t1.0\t\tlicense=GPL-2\n')
+        self.assertEqual(list(self.mk_index()), ['dev-util/foo-1'])
@@ -200,6 +200,9 @@ class native_CpvTest(TestCase):
         # swap the ordering, so that it's no longer obj1.__cmp__, but obj2s
         self.assertTrue(obj2 < obj1, '%r must be < %r' % (obj2, obj1))
 
+        self.assertTrue(cpv.cpv_sort_key(obj1) > cpv.cpv_sort_key(obj2),
+                        'sort key, %r > %r' % (obj1, obj2))
+
         if self.run_cpy_ver_cmp and obj1.fullver and obj2.fullver:
             self.assertTrue(cpv.cpy_ver_cmp(obj1.version, obj1.revision,
                 obj2.version, obj2.revision) > 0,
@@ -292,6 +295,32 @@ class native_CpvTest(TestCase):
         self.assertEqual(DummySubclass("da/ba-6.0", versioned=True),
             DummySubclass("da/ba-6.0-r0", versioned=True))
 
+    def test_interning(self):
+        self.assertIdentical(
+            self.vkls("da/ba-1"), self.vkls("da/ba-1"))
+        self.assertNotIdentical(
+            self.vkls("da/ba-1"), self.vkls("da/ba-1-r1"))
+
+    def test_sort_keys(self):
+        vkls = self.vkls
+        for v1, v2 in (("6.0_alpha", "6.0_alpha0"), ("6.01.0", "6.010.0"),
+                       ("6", "6-r0"), ("1.00", "1.0")):
+            self.assertEqual(cpv.cpv_sort_key(vkls("da/ba-%s" % v1)),
+                             cpv.cpv_sort_key(vkls("da/ba-%s" % v2)))
+        pkgs = [vkls("da/ba-%s" % x) for x in (
+            "1.0_p1", "1.0-r2", "1.0a", "1.01", "1.0_rc1", "1.0", "1.1",
+            "0.9", "1.0_beta2_p1", "1.0_beta2", "10")]
+        pkgs.append(vkls("da/aa-20"))
+        pkgs.append(vkls("aa/ba-0.1"))
+        self.assertEqual(
+            [x.cpvstr for x in cpv.sorted_cpvs(reversed(pkgs))],
+            [x.cpvstr for x in sorted(pkgs)])
+        self.assertEqual(
+            [x.cpvstr for x in cpv.sorted_cpvs(pkgs, reverse=True)],
+            [x.cpvstr for x in sorted(pkgs, reverse=True)])
+        self.assertEqual(cpv.sorted_cpvs(["b", "c", "a"]), ["a", "b", "c"])
+        self.assertEqual(cpv.sorted_cpvs([], reverse=True), [])
+
     def test_no_init(self):
         """Test if the cpv is in a somewhat sane state if __init__ fails.
 
@@ -443,6 +443,37 @@ class test_package_factory(TestCase):
         self.assertEqual(cache2[pkg.cpvstr],
             {'_eclasses_':{'eclass1':(None, 100)}, 'marker':2, '_mtime_':200})
 
+    def test_prevalidate_metadata(self):
+        calls = []
+
+        class counting_ec(FakeEclassCache):
+            def rebuild_cache_entry(self, entry_eclasses):
+                calls.append(entry_eclasses)
+                return FakeEclassCache.rebuild_cache_entry(self, entry_eclasses)
+
+        class fake_cache(dict):
+            readonly = True
+            def validate_entry(self, data, ebuild_hash, eclass_db):
+                return eclass_db.rebuild_cache_entry(data['_eclasses_']) is not None
+
+        eclasses = [('eclass1', (('mtime', 100),))]
+        pkgs = [malleable_obj(cpvstr='dev-util/diffball-%i' % x, path='bollocks')
+                for x in xrange(10)]
+        cache = fake_cache(
+            (pkg.cpvstr, {'_eclasses_': eclasses, 'marker': x})
+            for x, pkg in enumerate(pkgs))
+        cache[pkgs[-1].cpvstr] = {'_eclasses_': [('eclass1', (('mtime', 1),))]}
+        pf = self.mkinst(cache=(cache,), eclasses=counting_ec('/nonexistent/path'))
+
+        self.assertEqual(pf.prevalidate_metadata(pkgs, threads=4), pkgs[-1:])
+        # each distinct eclass set is checked once.
+        self.assertLen(calls, 2)
+        self.assertEqual(pf._get_cached_metadata(pkgs[3])['marker'], 3)
+        self.assertLen(calls, 2)
+        # handed out once; after that it's back to the normal path.
+        pf._get_cached_metadata(pkgs[3])
+        self.assertLen(calls, 3)
+
     def test_required_use(self):
         pass
 
@@ -0,0 +1,140 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+import fcntl
+import logging
+import threading
+import time
+
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import flat_hash
+from pkgcore.ebuild import eclass_index
+from pkgcore.test import silence_logging
+from pkgcore.test.ebuild.test_eclass_cache import FakeEclassCache
+
+
+class TestEclassIndex(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.path = pjoin(self.dir, 'index')
+        self.ec = FakeEclassCache('/nonexistent/path')
+        for x in xrange(5):
+            self.ec.eclasses.setdefault(
+                'eclass%i' % x, LazilyHashedPath('/nonexistent/path', mtime=x))
+
+    def mk_index(self):
+        return eclass_index.EclassIndex(self.path)
+
+    def update(self, index, cpv, *eclasses):
+        index.update(cpv, 1, {x: self.ec.eclasses[x] for x in eclasses})
+
+    def test_index_path(self):
+        caches = [flat_hash.database(pjoin(self.dir, 'ro'), readonly=True),
+                  flat_hash.database(pjoin(self.dir, 'rw'))]
+        self.assertEqual(eclass_index.index_path(caches),
+                         pjoin(self.dir, 'rw', '.eclass-index'))
+        self.assertIdentical(eclass_index.index_path(caches[:1]), None)
+
+    def test_queries(self):
+        index = self.mk_index()
+        self.assertEqual(len(index), 0)
+        self.update(index, 'dev-util/foo-1', 'eclass2', 'eclass1')
+        self.update(index, 'dev-util/foo-2', 'eclass2')
+        self.update(index, 'dev-util/bar-1')
+        for index in (index, self.mk_index()):
+            self.assertEqual(sorted(index),
+                ['dev-util/bar-1', 'dev-util/foo-1', 'dev-util/foo-2'])
+            self.assertEqual(index.inherits('dev-util/foo-1'),
+                             ('eclass1', 'eclass2'))
+            self.assertEqual(index.inherits('dev-util/bar-1'), ())
+            self.assertIdentical(index.inherits('dev-util/bar-2'), None)
+            self.assertEqual(index.users('eclass1'),
+                             frozenset(['dev-util/foo-1']))
+            self.assertEqual(index.users('eclass1', 'eclass2'),
+                             frozenset(['dev-util/foo-1', 'dev-util/foo-2']))
+            self.assertEqual(index.users('eclass3'), frozenset())
+
+    def test_update_and_discard(self):
+        index = self.mk_index()
+        # loaded prior to the changes to exercise the in memory updates.
+        self.assertNotIn('dev-util/foo-1', index)
+        self.update(index, 'dev-util/foo-1', 'eclass1')
+        self.update(index, 'dev-util/foo-2', 'eclass1')
+        self.update(index, 'dev-util/foo-1', 'eclass2')
+        index.discard('dev-util/foo-2')
+        for index in (index, self.mk_index()):
+            self.assertEqual(list(index), ['dev-util/foo-1'])
+            self.assertEqual(index.users('eclass1'), frozenset())
+            self.assertEqual(index.users('eclass2'),
+                             frozenset(['dev-util/foo-1']))
+
+    def test_is_current(self):
+        index = self.mk_index()
+        self.update(index, 'dev-util/foo-1', 'eclass1')
+        self.update(index, 'dev-util/bar-1')
+        for index in (index, self.mk_index()):
+            self.assertTrue(index.is_current('dev-util/foo-1', 1, self.ec))
+            self.assertFalse(index.is_current('dev-util/foo-1', 2, self.ec))
+            self.assertFalse(index.is_current('dev-util/foo-2', 1, self.ec))
+        self.ec.eclasses['eclass1'] = LazilyHashedPath(
+            '/nonexistent/path', mtime=300)
+        self.assertFalse(index.is_current('dev-util/foo-1', 1, self.ec))
+        del self.ec.eclasses['eclass1']
+        self.assertFalse(index.is_current('dev-util/foo-1', 1, self.ec))
+        self.assertTrue(index.is_current('dev-util/bar-1', 1, self.ec))
+
+    def test_commit(self):
+        index = self.mk_index()
+        self.update(index, 'dev-util/foo-1', 'eclass1')
+        self.update(index, 'dev-util/foo-2', 'eclass1')
+        index.commit()
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        for x in xrange(5):
+            self.update(index, 'dev-util/foo-1', 'eclass%i' % x)
+        index.discard('dev-util/foo-2')
+        index.commit()
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'dev-util/foo-1\t1.0\teclass4:4.0\n')
+        self.assertEqual(list(self.mk_index()), ['dev-util/foo-1'])
+
+    def test_commit_sees_other_writers(self):
+        index = self.mk_index()
+        self.assertEqual(len(index), 0)
+        other = self.mk_index()
+        for x in xrange(3):
+            self.update(other, 'dev-util/foo-1', 'eclass%i' % x)
+        index.commit()
+        self.assertEqual(index.inherits('dev-util/foo-1'), ('eclass2',))
+
+    def test_writes_locked(self):
+        index = self.mk_index()
+        for x in xrange(5):
+            self.update(index, 'dev-util/foo-1', 'eclass%i' % x)
+        with open(self.path) as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            writers = [threading.Thread(target=index.commit),
+                       threading.Thread(target=self.update,
+                                        args=(self.mk_index(), 'dev-util/foo-2', 'eclass1'))]
+            for t in writers:
+                t.start()
+            time.sleep(0.1)
+            # both wait on the lock, rather than racing the compaction.
+            self.assertTrue(all(t.is_alive() for t in writers))
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            for t in writers:
+                t.join()
+        index = self.mk_index()
+        self.assertEqual(sorted(index), ['dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(index.inherits('dev-util/foo-1'), ('eclass4',))
+
+    @silence_logging(logging.root)
+    def test_malformed(self):
+        with open(self.path, 'w') as f:
+            f.write('garbage\ndev-util/foo-1\teclass1\n'
+                    'dev-util/foo-2\t1.0\teclass1:100.0\n')
+        self.assertEqual(list(self.mk_index()), ['dev-util/foo-2'])
@@ -0,0 +1,63 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+import logging
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import flat_hash
+from pkgcore.ebuild import layout_index
+from pkgcore.test import silence_logging
+
+
+class TestLayoutIndex(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.path = pjoin(self.dir, 'index')
+
+    def mk_index(self):
+        return layout_index.LayoutIndex(self.path)
+
+    def test_index_path(self):
+        caches = [flat_hash.database(pjoin(self.dir, 'ro'), readonly=True),
+                  flat_hash.database(pjoin(self.dir, 'rw'))]
+        self.assertEqual(layout_index.index_path(caches),
+                         pjoin(self.dir, 'rw', '.layout-index'))
+        self.assertIdentical(layout_index.index_path(caches[:1]), None)
+
+    def test_get_update(self):
+        index = self.mk_index()
+        self.assertIdentical(index.get('/repo/cat', 1.5), None)
+        index.update('/repo', 1.25, ['cat'])
+        index.update('/repo/cat', 1.5, ['pkg', 'pkg2'])
+        index.update('/repo/cat/pkg2', 2.0, [])
+        index.write()
+        for index in (index, self.mk_index()):
+            self.assertEqual(len(index), 3)
+            self.assertEqual(index.get('/repo', 1.25), ('cat',))
+            self.assertEqual(index.get('/repo/cat', 1.5), ('pkg', 'pkg2'))
+            self.assertEqual(index.get('/repo/cat/pkg2', 2.0), ())
+            self.assertIdentical(index.get('/repo/cat', 1.75), None)
+
+    def test_write(self):
+        index = self.mk_index()
+        # nothing changed, nothing written.
+        index.write()
+        self.assertEqual(len(self.mk_index()), 0)
+        index.update('/repo/cat', 1.0, ['pkg'])
+        index.write()
+        index.update('/repo/cat', 2.0, ['pkg', 'pkg2'])
+        index.write()
+        self.assertEqual(self.mk_index().get('/repo/cat', 2.0), ('pkg', 'pkg2'))
+        self.assertIdentical(self.mk_index().get('/repo/cat', 1.0), None)
+
+    @silence_logging(logging.root)
+    def test_corrupt(self):
+        with open(self.path, 'w') as f:
+            f.write('%s\n/repo/cat\t1.0\n' % layout_index.LayoutIndex.magic)
+        self.assertEqual(len(self.mk_index()), 0)
+        with open(self.path, 'w') as f:
+            f.write('garbage\n')
+        self.assertEqual(len(self.mk_index()), 0)
@@ -4,7 +4,9 @@
 from snakeoil.test import mk_cpy_loadable_testcase
 
 from pkgcore.ebuild import misc
-from pkgcore.restrictions import packages
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import versioned_CPV
+from pkgcore.restrictions import packages, values
 from pkgcore.test import TestCase
 
 AlwaysTrue = packages.AlwaysTrue
@@ -43,6 +45,21 @@ class test_collapsed_restrict_to_data(base):
             [(AlwaysTrue, ['x', 'y']), (AlwaysTrue, ['-x'])]),
             defaults=['y'])
 
+    def test_pull_data(self):
+        cat = packages.PackageRestriction("category", values.StrExactMatch("dev-util"))
+        obj = self.kls(
+            [(AlwaysTrue, ['a']), (atom("dev-util/foo"), ['-a', 'b']), (cat, ['c'])],
+            [(AlwaysTrue, ['-b']), (atom("dev-util/bar"), ['d'])])
+        def pull(cpv):
+            return sorted(obj.pull_data(versioned_CPV(cpv)))
+        # atoms win over category wide settings, global negations over
+        # preceding atoms.
+        self.assertEqual(pull("dev-util/foo-1"), ['c'])
+        self.assertEqual(pull("dev-util/bar-1"), ['a', 'c', 'd'])
+        self.assertEqual(pull("dev-lib/foo-1"), ['a'])
+        self.assertEqual(list(obj.iter_pull_data(versioned_CPV("dev-util/bar-1"))),
+                         ['a', 'c', 'd'])
+
 
 class test_incremental_license_expansion(TestCase):
 
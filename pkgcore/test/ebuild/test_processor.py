@@ -0,0 +1,265 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+from StringIO import StringIO
+import logging
+import os
+import threading
+
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild import eclass_cache, processor
+from pkgcore.test import TestCase, silence_logging
+
+
+class FakeProcessor(object):
+
+    locked = False
+
+    def __init__(self, userpriv, sandbox, fakeroot, save_file):
+        self.userpriv = userpriv
+        self.sandbox = sandbox
+        self.fakeroot = fakeroot
+        self.is_alive = True
+        self.uses = 0
+
+    def userprived(self):
+        return self.userpriv
+
+    def sandboxed(self):
+        return self.sandbox
+
+    def onetime(self):
+        return self.fakeroot
+
+    def shutdown_processor(self, ignore_keyboard_interrupt=False):
+        self.is_alive = False
+
+
+class TestProcessorPool(TestCase):
+
+    def setUp(self):
+        self.orig_kls = processor.EbuildProcessor
+        processor.EbuildProcessor = FakeProcessor
+        processor.forget_all_processors()
+
+    def tearDown(self):
+        processor.EbuildProcessor = self.orig_kls
+        processor.configure_processor_pool()
+        processor.forget_all_processors()
+
+    def request(self, **kwds):
+        kwds.setdefault('sandbox', False)
+        return processor.request_ebuild_processor(**kwds)
+
+    def test_reuse(self):
+        ebp = self.request()
+        other = self.request()
+        self.assertNotIdentical(ebp, other)
+        processor.release_ebuild_processor(ebp)
+        self.assertIdentical(self.request(), ebp)
+        self.assertNotIdentical(self.request(userpriv=True), ebp)
+        self.assertEqual(ebp.uses, 2)
+
+    def test_max_uses(self):
+        processor.configure_processor_pool(max_uses=2)
+        ebp = self.request()
+        processor.release_ebuild_processor(ebp)
+        self.assertIdentical(self.request(), ebp)
+        processor.release_ebuild_processor(ebp)
+        self.assertFalse(ebp.is_alive)
+        self.assertNotIdentical(self.request(), ebp)
+
+    def test_max_idle(self):
+        processor.configure_processor_pool(max_idle=1)
+        procs = [self.request() for x in xrange(3)]
+        for ebp in procs:
+            processor.release_ebuild_processor(ebp)
+        self.assertEqual([x.is_alive for x in procs], [True, False, False])
+        self.assertEqual(processor.inactive_ebp_list, procs[:1])
+
+    def test_max_processors(self):
+        processor.configure_processor_pool(max_processors=2)
+        first, second = self.request(), self.request()
+        # an idle processor of the wrong type is dropped to make room.
+        processor.release_ebuild_processor(second)
+        third = self.request(userpriv=True)
+        self.assertFalse(second.is_alive)
+
+        got = []
+        t = threading.Thread(target=lambda: got.append(self.request()))
+        t.start()
+        t.join(0.1)
+        self.assertTrue(t.is_alive())
+        self.assertEqual(got, [])
+        processor.release_ebuild_processor(first)
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(got, [first])
+        processor.release_ebuild_processor(third)
+
+    def test_configure(self):
+        for kwds in ({'max_processors': 0}, {'max_idle': -1}, {'max_uses': 0}):
+            self.assertRaises(ValueError, processor.configure_processor_pool, **kwds)
+        processor.configure_processor_pool(max_idle=0)
+
+    def test_pool_limits(self):
+        processor.configure_processor_pool(max_idle=1)
+        with processor.processor_pool_limits(max_processors=2):
+            self.assertEqual(
+                (processor._max_processors, processor._max_idle), (2, None))
+        self.assertEqual(
+            (processor._max_processors, processor._max_idle), (None, 1))
+
+
+class ScriptedProcessor(processor.EbuildProcessor):
+
+    """processor replaying canned daemon output"""
+
+    def __init__(self, output):
+        self.lock()
+        self.pid = -1
+        self._eclass_caching = False
+        self._outstanding_expects = []
+        self.ebd_read = StringIO(output)
+        self.ebd_write = StringIO()
+
+    @property
+    def is_alive(self):
+        return self.pid is not None
+
+    def _ensure_metadata_paths(self, paths):
+        pass
+
+    def _generate_env_data(self, env_dict):
+        return env_dict['PF']
+
+    def shutdown_processor(self, ignore_keyboard_interrupt=False):
+        self.pid = None
+
+
+class FakeEbuild(object):
+
+    path = None
+
+
+class FakePkg(object):
+
+    category = 'dev-util'
+    revision = None
+    ebuild = FakeEbuild()
+
+    def __init__(self, package, version):
+        self.package = package
+        self.version = self.fullver = version
+
+
+class TestGetKeysBatch(TestCase):
+
+    def setUp(self):
+        self.ec = eclass_cache.base(location='/nonexistent', eclassdir='/nonexistent')
+        self.ec.eclasses = {}
+        self.pkgs = [FakePkg(x, '1') for x in ('foo', 'bar', 'baz')]
+
+    @silence_logging(logging.root)
+    def test_batch(self):
+        ebp = ScriptedProcessor(
+            'key EAPI=0\nphases succeeded\n'
+            'phases failed\n'
+            'key EAPI=5\nkey SLOT=1\nphases succeeded\n')
+        self.assertEqual(ebp.get_keys_batch(self.pkgs, self.ec), [
+            (self.pkgs[0], {'EAPI': '0'}),
+            (self.pkgs[1], None),
+            (self.pkgs[2], {'EAPI': '5', 'SLOT': '1'})])
+        self.assertTrue(ebp.is_alive)
+        self.assertEqual(ebp.ebd_write.getvalue(),
+                         'gen_metadata_batch 3\n5\nfoo-15\nbar-15\nbaz-1')
+
+    @silence_logging(logging.root)
+    def test_daemon_error(self):
+        # the second package inherits an unknown eclass; what's left in the
+        # pipe afterwards mustn't be taken for the third package's metadata.
+        ebp = ScriptedProcessor(
+            'key EAPI=0\nphases succeeded\n'
+            'request_inherit missing\n'
+            'phases failed\n'
+            'key EAPI=5\nphases succeeded\n')
+        self.assertEqual(ebp.get_keys_batch(self.pkgs, self.ec), [
+            (self.pkgs[0], {'EAPI': '0'}),
+            (self.pkgs[1], None)])
+        self.assertFalse(ebp.is_alive)
+
+
+class TestEclassSnapshot(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.ec = eclass_cache.base(location=self.dir, eclassdir=self.dir)
+        self.ec.eclasses = {}
+        self.path = pjoin(self.dir, 'snapshot')
+
+    def add_eclass(self, name, content, mtime=100):
+        path = pjoin(self.dir, '%s.eclass' % name)
+        with open(path, 'w') as f:
+            f.write(content)
+        self.ec.eclasses[name] = LazilyHashedPath(path, mtime=mtime)
+
+    def test_update(self):
+        self.add_eclass('eclass1', 'foo() { :; }\n')
+        self.add_eclass('eclass-2', 'bar=1')
+        self.assertTrue(processor.update_eclass_snapshot(self.path, self.ec))
+        with open(self.path) as f:
+            data = f.read()
+        self.assertIn('__preloaded_eclass_eclass1() {\nfoo() { :; }\n', data)
+        self.assertIn('PKGCORE_PRELOADED_ECLASSES[eclass-2]=__preloaded_eclass_eclass-2\n',
+                      data)
+
+        # unchanged eclass state leaves the snapshot alone.
+        os.utime(self.path, (1, 1))
+        self.assertTrue(processor.update_eclass_snapshot(self.path, self.ec))
+        self.assertEqual(os.stat(self.path).st_mtime, 1)
+
+        self.add_eclass('eclass1', 'foo() { true; }\n', mtime=200)
+        self.assertTrue(processor.update_eclass_snapshot(self.path, self.ec))
+        with open(self.path) as f:
+            self.assertIn('foo() { true; }', f.read())
+
+    @silence_logging(logging.root)
+    def test_syntax_error(self):
+        self.add_eclass('eclass1', 'foo() {\n')
+        self.assertFalse(processor.update_eclass_snapshot(self.path, self.ec))
+        self.assertEqual(os.listdir(self.dir), ['eclass1.eclass'])
+
+    def test_tampered(self):
+        self.add_eclass('eclass1', 'foo() { :; }\n')
+        self.assertTrue(processor.update_eclass_snapshot(self.path, self.ec))
+        with open(self.path) as f:
+            data = f.read()
+        # content not matching the recorded hash is rewritten.
+        with open(self.path, 'w') as f:
+            f.write(data.replace(':;', 'evil;'))
+        self.assertTrue(processor.update_eclass_snapshot(self.path, self.ec))
+        with open(self.path) as f:
+            self.assertEqual(f.read(), data)
+        # as is a snapshot others could have written.
+        os.chmod(self.path, 0666)
+        os.utime(self.path, (1, 1))
+        self.assertTrue(processor.update_eclass_snapshot(self.path, self.ec))
+        st = os.stat(self.path)
+        self.assertNotEqual(st.st_mtime, 1)
+        self.assertFalse(st.st_mode & 0022)
+
+    @silence_logging(logging.root)
+    def test_shared_dir(self):
+        self.add_eclass('eclass1', 'foo() { :; }\n')
+        os.chmod(self.dir, 0775)
+        try:
+            self.assertFalse(processor.update_eclass_snapshot(self.path, self.ec))
+        finally:
+            os.chmod(self.dir, 0700)
+        self.assertFalse(os.path.exists(self.path))
+        # directories are created as needed.
+        path = pjoin(self.dir, 'sub', 'dir', 'snapshot')
+        self.assertTrue(processor.update_eclass_snapshot(path, self.ec))
@@ -0,0 +1,78 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+import logging
+
+from snakeoil.chksum import LazilyHashedPath
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.cache import flat_hash
+from pkgcore.ebuild import regen_journal
+from pkgcore.test import silence_logging
+from pkgcore.test.ebuild.test_eclass_cache import FakeEclassCache
+
+
+class TestJournal(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.path = pjoin(self.dir, 'journal')
+        self.ec = FakeEclassCache('/nonexistent/path')
+
+    def mk_journal(self):
+        return regen_journal.Journal(self.path, self.ec)
+
+    def test_journal_path(self):
+        caches = [flat_hash.database(pjoin(self.dir, 'ro'), readonly=True),
+                  flat_hash.database(pjoin(self.dir, 'rw'))]
+        self.assertEqual(regen_journal.journal_path(caches),
+                         pjoin(self.dir, 'rw', '.regen-journal'))
+        self.assertIdentical(regen_journal.journal_path(caches[:1]), None)
+
+    def test_is_current(self):
+        journal = self.mk_journal()
+        self.assertFalse(journal.is_current('dev-util/foo-1', 1.5))
+        journal.record('dev-util/foo-1', 1.5, ['eclass1'])
+        journal.record('dev-util/foo-2', 2.0, ['eclass2'])
+        journal.record('dev-util/bar-1', 3.0, [])
+        journal.write()
+
+        journal = self.mk_journal()
+        self.assertFalse(journal.changed_eclasses)
+        self.assertTrue(journal.is_current('dev-util/foo-1', 1.5))
+        self.assertFalse(journal.is_current('dev-util/foo-2', 2.5))
+        # only packages carried forward or recorded are written out.
+        journal.write()
+        journal = self.mk_journal()
+        self.assertTrue(journal.is_current('dev-util/foo-1', 1.5))
+        self.assertFalse(journal.is_current('dev-util/bar-1', 3.0))
+
+        # discarded packages are checked again next time.
+        journal.discard('dev-util/foo-1')
+        journal.discard('dev-util/bar-1')
+        journal.write()
+        self.assertFalse(self.mk_journal().is_current('dev-util/foo-1', 1.5))
+
+    def test_changed_eclasses(self):
+        journal = self.mk_journal()
+        journal.record('dev-util/foo-1', 1.0, ['eclass1'])
+        journal.record('dev-util/foo-2', 1.0, ['eclass2'])
+        journal.record('dev-util/bar-1', 1.0, [])
+        journal.write()
+        self.ec.eclasses['eclass2'] = LazilyHashedPath(
+            '/nonexistent/path', mtime=300)
+        journal = self.mk_journal()
+        self.assertEqual(journal.changed_eclasses, frozenset(['eclass2']))
+        self.assertTrue(journal.is_current('dev-util/foo-1', 1.0))
+        self.assertFalse(journal.is_current('dev-util/foo-2', 1.0))
+        self.assertTrue(journal.is_current('dev-util/bar-1', 1.0))
+
+    @silence_logging(logging.root)
+    def test_corrupt(self):
+        with open(self.path, 'w') as f:
+            f.write('%s\npkg\tdev-util/foo-1\n' % regen_journal.Journal.magic)
+        self.assertFalse(self.mk_journal().is_current('dev-util/foo-1', 1.0))
+        with open(self.path, 'w') as f:
+            f.write('garbage\n')
+        self.assertFalse(self.mk_journal().is_current('dev-util/foo-1', 1.0))
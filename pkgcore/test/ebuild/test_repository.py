@@ -2,15 +2,18 @@
 # Copyright: 2007 Marien Zwart <marienz@gentoo.org>
 # License: BSD/GPL2
 
+import logging
 import os
 import textwrap
 
 from snakeoil.osutils import ensure_dirs, pjoin
 from snakeoil.test.mixins import TempDirMixin
 
+from pkgcore.cache import flat_hash
 from pkgcore.ebuild import errors as ebuild_errors
-from pkgcore.ebuild import repository, eclass_cache
+from pkgcore.ebuild import processor, repository, eclass_cache
 from pkgcore.ebuild.atom import atom
+from pkgcore.operations import regen
 from pkgcore.repository import errors
 from pkgcore.test import silence_logging
 
@@ -107,6 +110,32 @@ class UnconfiguredTreeTest(TempDirMixin):
                     repo.itermatch(atom('cat/pkg'))), ['cat/pkg-3'])
                 os.unlink(fp)
 
+    @silence_logging(logging.root)
+    def test_layout_index(self):
+        ensure_dirs(pjoin(self.dir, 'cat', 'pkg'))
+        open(pjoin(self.dir, 'cat', 'pkg', 'pkg-1.ebuild'), 'w').close()
+        os.utime(pjoin(self.dir, 'cat', 'pkg'), (100, 100))
+        # dot dirs aren't categories; create it up front so writing the
+        # index doesn't change the repo dir's mtime.
+        ensure_dirs(pjoin(self.dir, '.cache'))
+        cache = flat_hash.database(pjoin(self.dir, '.cache'))
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        self.assertEqual(dict(repo.versions), {('cat', 'pkg'): ('1',)})
+        repo.layout_index.write()
+
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        def listing(*args):
+            raise AssertionError("listing wasn't pulled from the index")
+        repo._list_categories = repo._list_packages = listing
+        repo._list_versions = listing
+        self.assertEqual(dict(repo.versions), {('cat', 'pkg'): ('1',)})
+
+        # a changed dir mtime invalidates its listing.
+        open(pjoin(self.dir, 'cat', 'pkg', 'pkg-2.ebuild'), 'w').close()
+        os.utime(pjoin(self.dir, 'cat', 'pkg'), (200, 200))
+        repo = self.mk_tree(self.dir, cache=(cache,))
+        self.assertEqual(sorted(repo.versions[('cat', 'pkg')]), ['1', '2'])
+
     @silence_logging
     def test_package_mask(self):
         with open(pjoin(self.pdir, 'package.mask'), 'w') as f:
@@ -181,3 +210,86 @@ class SlavedTreeTest(UnconfiguredTreeTest):
                 f.write('\n'.join(cats[1]))
             repo = self.mk_tree(self.dir)
             self.assertEqual(tuple(sorted(repo.categories)), ('cat', 'foo-bar', 'sys-apps'))
+
+
+class FakeRegenProcessor(object):
+
+    """processor handing back canned metadata; failing for version 3"""
+
+    pid = 1
+
+    def get_keys_batch(self, pkgs, eclass_cache):
+        results = []
+        for pkg in pkgs:
+            if pkg.fullver == '3':
+                results.append((pkg, None))
+                continue
+            results.append((pkg, {
+                'EAPI': '5', 'SLOT': pkg.fullver, 'DEFINED_PHASES': '-',
+                'DESCRIPTION': 'pid %i' % os.getpid(),
+                'INHERITED': 'e1' if pkg.fullver == '1' else ''}))
+        return results
+
+
+class TestRegenProcesses(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        ensure_dirs(pjoin(self.dir, 'profiles'))
+        with open(pjoin(self.dir, 'profiles', 'repo_name'), 'w') as f:
+            f.write('test\n')
+        ensure_dirs(pjoin(self.dir, 'metadata'))
+        with open(pjoin(self.dir, 'metadata', 'layout.conf'), 'w') as f:
+            f.write('masters =\n')
+        ensure_dirs(pjoin(self.dir, 'eclass'))
+        with open(pjoin(self.dir, 'eclass', 'e1.eclass'), 'w') as f:
+            f.write('HOMEPAGE=e1\n')
+        ensure_dirs(pjoin(self.dir, 'cat', 'pkg'))
+        for ver in ('1', '2', '3'):
+            with open(pjoin(self.dir, 'cat', 'pkg', 'pkg-%s.ebuild' % ver), 'w') as f:
+                f.write('EAPI=5\n')
+        self.orig_request = processor.request_ebuild_processor
+        # the pool's workers are forked, so they see the fake too.
+        processor.request_ebuild_processor = FakeRegenProcessor
+
+    def tearDown(self):
+        processor.request_ebuild_processor = self.orig_request
+        TempDirMixin.tearDown(self)
+
+    def test_regen(self):
+        cache = flat_hash.database(pjoin(self.dir, '.cache'))
+        repo = repository._UnconfiguredTree(
+            self.dir, eclass_cache.cache(pjoin(self.dir, 'eclass')), cache=(cache,))
+        errors = []
+        class observer(object):
+            def error(self, msg, *args):
+                errors.append(args)
+        regen.regen_repository(
+            repo, observer(), threads=2, processes=True, eclass_caching=False)
+
+        self.assertEqual(sorted(cache), ['cat/pkg-1', 'cat/pkg-2'])
+        self.assertEqual([x[1] for x in errors], [('cat', 'pkg', '3')])
+        entry = cache['cat/pkg-1']
+        self.assertEqual(entry['SLOT'], '1')
+        self.assertEqual([x[0] for x in entry['_eclasses_']], ['e1'])
+        self.assertEqual(cache['cat/pkg-2']['SLOT'], '2')
+        # sourced by the workers, written by us.
+        self.assertNotEqual(entry['DESCRIPTION'], 'pid %i' % os.getpid())
+        self.assertFalse(cache['cat/pkg-2'].get('_eclasses_'))
+
+    def test_pool_limits(self):
+        cache = flat_hash.database(pjoin(self.dir, '.cache'))
+        repo = repository._UnconfiguredTree(
+            self.dir, eclass_cache.cache(pjoin(self.dir, 'eclass')), cache=(cache,))
+        limits = []
+        orig = regen.regen_repository
+        def regen_repository(*args, **kwds):
+            limits.append(processor._max_processors)
+        regen.regen_repository = regen_repository
+        try:
+            repo.operations.regen_cache(threads=3)
+        finally:
+            regen.regen_repository = orig
+        # capped at the regen threads for the run, and restored after.
+        self.assertEqual(limits, [3])
+        self.assertIdentical(processor._max_processors, None)
@@ -284,6 +284,32 @@ class TestContentsSet(TestCase):
         obj = cs['/dir1']
         self.assertEqual(obj.mode, 0775)
 
+    def test_path_index(self):
+        cs = contents.contentsSet([self.mk_dir("/usr"), self.mk_file("/usr/bin/foo"),
+            self.mk_file("/usr/lib/a/b"), self.mk_file("/usrfoo")])
+        def children(start):
+            return [x.location for x in cs.iter_child_nodes(start)]
+        self.assertEqual(children("/usr/"),
+            ["/usr/bin/foo", "/usr/lib/a/b"])
+        self.assertEqual(children(self.mk_link("/sym", "/usr/lib")), ["/usr/lib/a/b"])
+        self.assertEqual(children("/usr/bin/foo"), [])
+        self.assertEqual(children("/nonexistent"), [])
+        self.assertLen(children("/"), 4)
+
+        # the index is kept up to date by mutations.
+        cs.add(self.mk_dir("/usr/lib"))
+        cs.remove("/usr/lib/a/b")
+        cs.update([self.mk_file("/usr/lib/c")])
+        cs.discard(self.mk_file("/usr/bin/foo"))
+        self.assertEqual(children("/usr"), ["/usr/lib", "/usr/lib/c"])
+        self.assertEqual(sorted(cs._paths), ["/", "/usr", "/usr/lib"])
+        cs.add(self.mk_file("/usr/bin/foo"))
+        cs.add_missing_directories()
+        self.assertEqual(children("/usr"),
+            ["/usr/bin", "/usr/bin/foo", "/usr/lib", "/usr/lib/c"])
+        cs.clear()
+        self.assertEqual(children("/usr"), [])
+
     def test_inode_map(self):
 
         def check_it(target):
@@ -213,6 +213,48 @@ class Test_merge_contents(ContentsMixin):
         os.mkdir(fp)
         ops.merge_contents(cset)
 
+    def test_threaded(self):
+        src = self.gen_dir("src")
+        entries = dict(self.entries_norm1)
+        entries.update(("dir/f%i" % x, ["reg"]) for x in xrange(20))
+        self.generate_tree(src, entries)
+        for x in xrange(20):
+            with open(pjoin(src, "dir/f%i" % x), "w") as f:
+                f.write("data %i" % x)
+        os.link(pjoin(src, "dir/f0"), pjoin(src, "hardlink"))
+        cset = livefs.scan(src, offset=src)
+
+        serial, threaded = [], []
+        dest = self.gen_dir("dest")
+        self.assertTrue(ops.merge_contents(cset, offset=dest, callback=serial.append))
+        dest = self.gen_dir("dest")
+        def callback(x):
+            # entries are reported once merged.
+            if not fs.isdir(x):
+                self.assertTrue(os.path.lexists(x.location), x)
+            threaded.append(x)
+        self.assertTrue(ops.merge_contents(
+            cset, offset=dest, callback=callback, threads=4))
+        self.assertEqual(threaded, serial)
+        self.assertEqual(livefs.scan(src, offset=src), livefs.scan(dest, offset=dest))
+        self.assertEqual(os.stat(pjoin(dest, "hardlink")).st_ino,
+                         os.stat(pjoin(dest, "dir/f0")).st_ino)
+
+        # existing files are replaced.
+        with open(pjoin(dest, "dir/f1"), "w") as f:
+            f.write("old")
+        self.assertTrue(ops.merge_contents(cset, offset=dest, threads=4))
+        with open(pjoin(dest, "dir/f1")) as f:
+            self.assertEqual(f.read(), "data 1")
+        self.assertFalse(os.path.exists(pjoin(dest, "dir/f1#new")))
+
+    def test_threaded_failure(self):
+        path = pjoin(self.dir, "file")
+        os.mkdir(path)
+        cset = contents.contentsSet([fs.fsFile(
+            path, data=local_source(__file__), strict=False)])
+        self.assertRaises(ops.CannotOverwrite, ops.merge_contents, cset, threads=4)
+
 
 class Test_unmerge_contents(ContentsMixin):
 
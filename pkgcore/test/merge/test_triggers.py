@@ -650,3 +650,33 @@ class TestPruneFiles(TestCase):
         self.assertNotIn('/sporks-suck', ' '.join(info))
         self.assertIn('/foons-rule', ' '.join(info))
         self.assertIn('/mango', ' '.join(info))
+
+
+class Test_merge(TestCase):
+
+    def merge_threads(self, env=None, **kwds):
+        calls = []
+        orig = triggers.get_plugin
+        orig_env = os.environ.pop("PKGCORE_TRIGGER_PARALLELISM", None)
+        triggers.get_plugin = lambda name: lambda *a, **kw: calls.append(kw['threads'])
+        try:
+            if env is not None:
+                os.environ["PKGCORE_TRIGGER_PARALLELISM"] = env
+            engine = fake_engine(
+                observer=fake_reporter(installing_fs_obj=None), **kwds)
+            triggers.merge().trigger(engine, contentsSet())
+        finally:
+            triggers.get_plugin = orig
+            os.environ.pop("PKGCORE_TRIGGER_PARALLELISM", None)
+            if orig_env is not None:
+                os.environ["PKGCORE_TRIGGER_PARALLELISM"] = orig_env
+        return calls[0]
+
+    def test_threads(self):
+        # serial unless asked for.
+        self.assertEqual(self.merge_threads(
+            parallelism=4, parallelism_configured=False), 1)
+        self.assertEqual(self.merge_threads(
+            parallelism=4, parallelism_configured=True), 4)
+        self.assertEqual(self.merge_threads(
+            '2', parallelism=4, parallelism_configured=False), 2)
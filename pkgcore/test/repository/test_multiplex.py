@@ -3,8 +3,11 @@
 
 from collections import OrderedDict
 from functools import partial
+import threading
+import time
 
-from pkgcore.repository.multiplex import tree
+from pkgcore.repository import multiplex
+from pkgcore.repository.multiplex import tree, merge_order, merge_sorted
 from pkgcore.repository.util import SimpleTree
 from pkgcore.restrictions import packages, values
 from pkgcore.test import TestCase
@@ -58,12 +61,168 @@ class TestMultiplex(TestCase):
             [y for y in sorted(self.tree1_list + self.tree2_list)
                 if "/diffball" in y])
 
+    def test_listings(self):
+        self.assertEqual(sorted(self.ctree.categories),
+                         ['dev-lib', 'dev-util'])
+        self.assertEqual(sorted(self.ctree.packages['dev-lib']),
+                         ['bsdiff', 'fake'])
+        self.assertEqual(sorted(self.ctree.versions[('dev-util', 'diffball')]),
+                         ['0.7', '1.0', '1.1'])
+        self.assertRaises(KeyError, self.ctree.packages.__getitem__, 'dev-foo')
+        self.assertRaises(KeyError, self.ctree.versions.__getitem__,
+                          ('dev-util', 'foo'))
+
+    def test_ordering(self):
+        self.assertEqual(
+            [x.cpvstr for x in self.ctree.itermatch(packages.AlwaysTrue)],
+            [x.cpvstr for x in self.tree1.itermatch(packages.AlwaysTrue)] +
+            [x.cpvstr for x in self.tree2.itermatch(packages.AlwaysTrue)])
+
     def test_sorting(self):
         self.assertEqual(list(x.cpvstr for x in
             self.ctree.itermatch(packages.AlwaysTrue, sorter=rev_sorted)),
             rev_sorted(self.tree1_list + self.tree2_list))
 
+    def test_sorting_opaque(self):
+        sorter = lambda l: rev_sorted(l)
+        self.assertEqual(list(x.cpvstr for x in
+            self.ctree.itermatch(packages.AlwaysTrue, sorter=sorter)),
+            rev_sorted(self.tree1_list + self.tree2_list))
+
     def test_install(self):
         raise Exception()
     test_install.todo = "need to implement tests for multiplexing down repo_ops"
     test_replace = test_uninstall = test_install
+
+
+class TestThreadedMultiplex(TestMultiplex):
+
+    kls = staticmethod(partial(tree, threads=2))
+
+    def test_failure(self):
+        class BrokenTree(SimpleTree):
+            def itermatch(self, *args, **kwds):
+                for pkg in SimpleTree.itermatch(self, *args, **kwds):
+                    yield pkg
+                raise ValueError("broken")
+        ctree = self.kls(self.tree1, BrokenTree(self.d2), self.tree2)
+        for sorter in (iter, sorted):
+            self.assertRaises(ValueError, list, ctree.itermatch(
+                packages.AlwaysTrue, sorter=sorter))
+
+    def endless_tree(self, produced):
+        pkg = self.tree1.match(packages.AlwaysTrue)[0]
+        class EndlessTree(SimpleTree):
+            def itermatch(self, *args, **kwds):
+                while True:
+                    produced.append(pkg)
+                    yield pkg
+        return EndlessTree({}), pkg
+
+    def wait_for(self, produced, count):
+        # give the workers a chance to run ahead of the consumer.
+        for x in xrange(50):
+            if len(produced) >= count:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+
+    def test_abandoned(self):
+        produced = []
+        endless, pkg = self.endless_tree(produced)
+        ctree = self.kls(self.tree1, endless)
+        matches = ctree.itermatch(packages.AlwaysTrue)
+        matches.next()
+        self.wait_for(produced, multiplex._fanout.queue_size)
+        matches.close()
+        time.sleep(0.05)
+        count = len(produced)
+        time.sleep(0.05)
+        self.assertEqual(len(produced), count)
+
+    def test_bounded(self):
+        produced = []
+        endless, pkg = self.endless_tree(produced)
+        ctree = self.kls(self.tree1, endless)
+        matches = ctree.itermatch(packages.AlwaysTrue)
+        matches.next()
+        self.wait_for(produced, multiplex._fanout.queue_size)
+        # the queue, plus the item the worker is waiting to queue.
+        self.assertTrue(len(produced) <= multiplex._fanout.queue_size + 1)
+        matches.close()
+
+    def test_lazy(self):
+        queried = []
+        class RecordingTree(SimpleTree):
+            def itermatch(self, *args, **kwds):
+                queried.append(self)
+                return SimpleTree.itermatch(self, *args, **kwds)
+        ctree = self.kls(RecordingTree(self.d1), RecordingTree(self.d2))
+        matches = ctree.itermatch(packages.AlwaysTrue)
+        time.sleep(0.05)
+        self.assertEqual(queried, [])
+        self.assertEqual(sorted(x.cpvstr for x in matches),
+                         sorted(self.tree1_list + self.tree2_list))
+        self.assertLen(queried, 2)
+
+    def test_pool(self):
+        def workers():
+            return [t for t in threading.enumerate()
+                    if t.name == 'multiplex fanout']
+        before = len(workers())
+        for x in xrange(3):
+            list(self.ctree.itermatch(packages.AlwaysTrue))
+            self.ctree.categories.keys()
+        self.assertEqual(len(workers()), before + 2)
+
+    def test_more_trees_than_threads(self):
+        # every stream is needed up front to merge them; trees no worker
+        # picked up must not wait behind the ones blocked on full queues.
+        trees = [SimpleTree(self.d1), SimpleTree(self.d2)] * 3
+        ctree = self.kls(*trees)
+        orig = multiplex._fanout.queue_size
+        multiplex._fanout.queue_size = 1
+        try:
+            self.assertEqual(
+                [x.cpvstr for x in ctree.itermatch(packages.AlwaysTrue, sorter=sorted)],
+                sorted((self.tree1_list + self.tree2_list) * 3))
+        finally:
+            multiplex._fanout.queue_size = orig
+
+    def test_unknown_keyword(self):
+        self.assertRaises(TypeError, tree, self.tree1, thread=2)
+
+
+class TestMergeSorted(TestCase):
+
+    def test_merge_order(self):
+        self.assertEqual(merge_order(sorted), (None, False))
+        self.assertEqual(merge_order(rev_sorted), (None, True))
+        self.assertEqual(merge_order(partial(sorted, key=len)), (len, False))
+        self.assertIdentical(merge_order(partial(sorted, cmp=cmp)), None)
+        self.assertIdentical(merge_order(lambda l: sorted(l)), None)
+        sorter = lambda l: sorted(l)
+        sorter.merge_order = (len, True)
+        self.assertEqual(merge_order(sorter), (len, True))
+
+    def test_merge(self):
+        self.assertEqual(list(merge_sorted([])), [])
+        self.assertEqual(list(merge_sorted([[], []])), [])
+        self.assertEqual(list(merge_sorted([xrange(3)])), [0, 1, 2])
+        self.assertEqual(
+            list(merge_sorted([xrange(0, 10, 3), [], xrange(1, 6, 2), [4]])),
+            [0, 1, 3, 3, 4, 5, 6, 9])
+        self.assertEqual(
+            list(merge_sorted([[9, 1], [8, 7, 0], [5]], reverse=True)),
+            [9, 8, 7, 5, 1, 0])
+        self.assertEqual(
+            list(merge_sorted([['aaa', 'c'], ['bb']], key=len, reverse=True)),
+            ['aaa', 'bb', 'c'])
+
+    def test_stable(self):
+        key = lambda x: x[0]
+        for reverse in (False, True):
+            self.assertEqual(
+                list(merge_sorted([[(1, 'a')], [(1, 'b')], [(1, 'c')]],
+                                  key=key, reverse=reverse)),
+                [(1, 'a'), (1, 'b'), (1, 'c')])
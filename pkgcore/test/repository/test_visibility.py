@@ -2,9 +2,10 @@
 # License: GPL2/BSD
 
 from pkgcore.ebuild.atom import atom
-from pkgcore.ebuild.cpv import versioned_CPV
+from pkgcore.ebuild.cpv import versioned_CPV, versioned_CPV_cls
 from pkgcore.repository.visibility import filterTree
-from pkgcore.restrictions import packages, values
+from pkgcore.restrictions import packages, restriction, values
+from pkgcore.restrictions.delegated import delegate
 from pkgcore.test import TestCase
 from pkgcore.test.repository.test_prototype import SimpleTree
 
@@ -52,3 +53,86 @@ class TestVisibility(TestCase):
                     *[values.StrExactMatch(x) for x in ("diffball", "fake")])))
         self.assertEqual(
             sorted(vrepo), sorted(repo.itermatch(atom("dev-util/bsdiff"))))
+
+    def test_cost_ordering(self):
+        seen = []
+        def costly(pkg, mode):
+            seen.append(pkg.cpvstr)
+            return True
+        restrict = packages.AndRestriction(
+            delegate(costly), atom("dev-util/diffball"))
+        repo, vrepo = self.setup_repos(restrict)
+        vrepo = filterTree(repo, restrict, sentinel_val=True)
+        self.assertEqual(
+            sorted(x.cpvstr for x in vrepo.itermatch(packages.AlwaysTrue)),
+            ['dev-util/diffball-0.7', 'dev-util/diffball-1.0'])
+        # the costly predicate only saw what the atom let through.
+        self.assertEqual(sorted(seen),
+            ['dev-util/diffball-0.7', 'dev-util/diffball-1.0'])
+        del seen[:]
+        self.assertEqual(list(vrepo.itermatch(atom("dev-lib/fake"))), [])
+        self.assertEqual(seen, [])
+
+    def test_free_restriction_compiled(self):
+        # the free part of a filter is handed to the raw repo compiled, even
+        # when forcing; neither matching nor forcing walks the masks.
+        calls = []
+        class tracking_atom(atom):
+            __slots__ = ()
+            __inst_caching__ = False
+            def match(self, pkg):
+                calls.append('match')
+                return atom.match(self, pkg)
+            def force_True(self, pkg):
+                calls.append('force_True')
+                return atom.force_True(self, pkg)
+            def force_False(self, pkg):
+                calls.append('force_False')
+                return atom.force_False(self, pkg)
+        masks = [tracking_atom("dev-util/mask%i" % x) for x in xrange(2000)]
+        masks.append(tracking_atom("=dev-util/diffball-1.0"))
+        restrict = packages.OrRestriction(negate=True, *masks)
+        class pkg(versioned_CPV_cls):
+            __slots__ = ()
+            def changes_count(self):
+                return 0
+            def rollback(self, point=0):
+                pass
+        repo = SimpleTree({"dev-util":{"diffball":["1.0", "0.7"]}}, pkg_klass=pkg)
+        vrepo = filterTree(repo, restrict, sentinel_val=True)
+        a = atom("dev-util/diffball")
+        for force in (None, True):
+            del calls[:]
+            self.assertEqual(
+                [x.cpvstr for x in vrepo.itermatch(a, force=force)],
+                ['dev-util/diffball-0.7'])
+            self.assertNotIn('force_True', calls)
+            self.assertNotIn('force_False', calls)
+            # the compiled matcher dispatches on the package key.
+            self.assertTrue(len(calls) <= 4, calls)
+
+    def test_cost_computed_once(self):
+        costs = []
+        class costed(restriction.base):
+            __slots__ = ()
+            type = packages.package_type
+            __inst_caching__ = False
+            @property
+            def cost(self):
+                costs.append(self)
+                return 0
+            def match(self, pkg):
+                return True
+        restrict = packages.OrRestriction(
+            negate=True, *[atom("dev-util/mask%i" % x) for x in xrange(20)])
+        repo, vrepo = self.setup_repos()
+        vrepo = filterTree(
+            repo, packages.AndRestriction(costed(), restrict), sentinel_val=True)
+        a = atom("dev-util/diffball")
+        # the first match compiles the filter, ordering it by cost.
+        self.assertLen(list(vrepo.itermatch(a)), 2)
+        seen = len(costs)
+        for x in xrange(3):
+            self.assertLen(list(vrepo.itermatch(a)), 2)
+        # later queries don't reevaluate the cost of the filter.
+        self.assertEqual(len(costs), seen)
@@ -3,9 +3,11 @@
 
 from snakeoil.currying import post_curry
 
+from pkgcore.repository import misc
 from pkgcore.resolver import plan
+from pkgcore.restrictions import packages
 from pkgcore.test import TestCase
-from pkgcore.test.misc import FakePkg
+from pkgcore.test.misc import FakePkg, FakeRepo
 
 
 class TestPkgSorting(TestCase):
@@ -30,3 +32,22 @@ class TestPkgSorting(TestCase):
 
     test_pkg_sort_lowest = post_curry(check_it, plan.pkg_sort_lowest,
         [11,9,1,6], [1,6,9,11])
+
+    def test_multiplex_sorting(self):
+        # livefs pkgs win ties, whichever direction versions are sorted in.
+        vdb = FakeRepo(livefs=True)
+        repo1, repo2 = FakeRepo(livefs=False), FakeRepo(livefs=False)
+        pkgs = {vdb: [1, 3], repo1: [3, 2], repo2: [4, 1]}
+        for repo, vers in pkgs.iteritems():
+            repo.pkgs = [FakePkg("d-b/a-%s" % x, repo=repo) for x in vers]
+        expected = [(1, True), (1, False), (2, False), (3, True), (3, False),
+                    (4, False)]
+        for sorter, reverse in ((plan.highest_iter_sort, True),
+                                (plan.lowest_iter_sort, False)):
+            for repo in pkgs:
+                repo.pkgs.sort(reverse=reverse)
+            r = misc.multiplex_sorting_repo(sorter, repo1, vdb, repo2)
+            self.assertEqual(
+                [(int(x.fullver), x.repo.livefs)
+                 for x in r.itermatch(packages.AlwaysTrue)],
+                sorted(expected, key=lambda x: x[0], reverse=reverse))
@@ -0,0 +1,142 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import versioned_CPV
+from pkgcore.restrictions import packages, values
+from pkgcore.restrictions.compiler import (
+    compiled, compile_restriction, static_compiled)
+from pkgcore.restrictions.delegated import delegate
+from pkgcore.test import TestCase
+
+
+def attr(name, value, negate=False, **kwds):
+    return packages.PackageRestriction(
+        name, values.StrExactMatch(value, **kwds), negate=negate)
+
+
+class counting_pkg(object):
+
+    def __init__(self, **attrs):
+        self.attrs = attrs
+        self.pulls = []
+
+    def __getattr__(self, attr):
+        if attr not in self.attrs:
+            raise AttributeError(attr)
+        self.pulls.append(attr)
+        return self.attrs[attr]
+
+
+class TestCompiler(TestCase):
+
+    pkgs = [versioned_CPV(x) for x in (
+        "dev-util/diffball-1.0", "dev-util/diffball-0.7",
+        "dev-util/bsdiff-0.4.2", "dev-lib/fake-1.0-r1", "sys-apps/portage-2.2")]
+
+    def assertEquivalent(self, restrict):
+        c = compile_restriction(restrict)
+        for pkg in self.pkgs:
+            self.assertEqual(c.match(pkg), restrict.match(pkg),
+                msg="%s: compiled %r for %s" % (restrict, c.match(pkg), pkg))
+
+    def test_equivalence(self):
+        atoms = [atom(x) for x in (
+            "dev-util/diffball", ">=dev-util/diffball-1", "<dev-util/bsdiff-0.4.2",
+            "=dev-lib/fake-1.0*", "!sys-apps/portage")]
+        glob = packages.PackageRestriction(
+            "package", values.StrGlobMatch("bs"))
+        never = delegate(lambda pkg, mode: False)
+        restricts = [
+            packages.OrRestriction(*atoms),
+            packages.OrRestriction(glob, *atoms[1:]),
+            packages.OrRestriction(negate=True, *atoms),
+            packages.AndRestriction(atoms[0], atoms[1]),
+            packages.AndRestriction(atoms[0], atoms[2]),
+            packages.AndRestriction(atoms[1], negate=True),
+            packages.OrRestriction(
+                packages.AndRestriction(atoms[0], glob), atoms[3]),
+            packages.OrRestriction(
+                packages.OrRestriction(atoms[2], never), atoms[4]),
+            packages.AndRestriction(
+                attr("category", "dev-util"), attr("package", "bsdiff", negate=True),
+                attr("category", "dev-lib", negate=True)),
+            packages.OrRestriction(
+                attr("category", "DEV-LIB", case_sensitive=False),
+                attr("package", "portage")),
+            packages.AndRestriction(packages.AlwaysTrue, atoms[0]),
+            packages.AndRestriction(packages.AlwaysFalse, atoms[0]),
+            packages.OrRestriction(packages.AlwaysFalse, atoms[3]),
+            packages.OrRestriction(packages.AlwaysTrue, atoms[3]),
+            packages.AndRestriction(),
+            packages.OrRestriction(),
+            # missing attrs; matched as the negation flag says.
+            packages.OrRestriction(attr("slot", "0"), attr("slot", "1", negate=True)),
+            packages.AndRestriction(attr("slot", "0", negate=True), atoms[0]),
+        ]
+        for restrict in restricts:
+            self.assertEquivalent(restrict)
+
+    def test_keyed_dispatch(self):
+        tried = []
+        def tracked(name):
+            def f(pkg, mode):
+                tried.append(name)
+                return True
+            return delegate(f)
+        restrict = packages.OrRestriction(
+            packages.AndRestriction(atom("dev-util/diffball"), tracked("diffball")),
+            packages.AndRestriction(atom("dev-lib/fake"), tracked("fake")))
+        c = compile_restriction(restrict)
+        self.assertTrue(c.match(versioned_CPV("dev-lib/fake-1")))
+        self.assertEqual(tried, ["fake"])
+        self.assertFalse(c.match(versioned_CPV("dev-lib/bar-1")))
+        self.assertEqual(tried, ["fake"])
+
+    def test_shared_pulls(self):
+        restrict = packages.AndRestriction(
+            attr("category", "dev-util"),
+            packages.AndRestriction(
+                attr("package", "diffball", negate=True),
+                attr("package", "bsdiff", negate=True)))
+        c = compile_restriction(restrict)
+        pkg = counting_pkg(category="dev-util", package="fake")
+        self.assertTrue(c.match(pkg))
+        self.assertEqual(sorted(pkg.pulls), ["category", "package"])
+
+    def test_compiled(self):
+        r = atom("dev-util/diffball")
+        c = compile_restriction(r)
+        self.assertIsInstance(c, compiled)
+        self.assertIdentical(compile_restriction(c), c)
+        self.assertIdentical(c.restriction, r)
+        self.assertEqual(str(c), str(r))
+        self.assertEqual(c.cost, packages.restriction_cost(r))
+        # matchers grabbed before compilation don't recompile on each call.
+        match = c.match
+        self.assertTrue(match(self.pkgs[0]))
+        self.assertNotIdentical(c.match, match)
+        self.assertIdentical(c._match, c.match)
+        self.assertFalse(match(self.pkgs[2]))
+        self.assertRaises(TypeError, compile_restriction, values.AlwaysTrue)
+
+        forced = []
+        def f(pkg, mode):
+            forced.append(mode)
+            return True
+        c = compile_restriction(delegate(f))
+        self.assertTrue(c.force_True(None))
+        self.assertTrue(c.force_False(None))
+        self.assertEqual(forced, ["force_True", "force_False"])
+
+    def test_static_compiled(self):
+        forced = []
+        def f(pkg, mode):
+            forced.append(mode)
+            return pkg.package == "diffball"
+        c = static_compiled(packages.OrRestriction(
+            delegate(f), atom("dev-util/bsdiff"), negate=True))
+        self.assertFalse(c.force_True(self.pkgs[0]))
+        self.assertTrue(c.force_False(self.pkgs[0]))
+        self.assertTrue(c.force_True(self.pkgs[3]))
+        self.assertEqual(forced, ["match"] * 3)
@@ -0,0 +1,74 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.cpv import versioned_CPV
+from pkgcore.restrictions import packages, values
+from pkgcore.restrictions.compiler import restriction_key
+from pkgcore.restrictions.delegated import delegate
+from pkgcore.restrictions.index import RestrictionIndex
+from pkgcore.test import TestCase
+
+
+class TestRestrictionIndex(TestCase):
+
+    def test_restriction_key(self):
+        cat = packages.PackageRestriction("category", values.StrExactMatch("dev-util"))
+        pkg = packages.PackageRestriction("package", values.StrExactMatch("foo"))
+        self.assertEqual(restriction_key(atom(">=dev-util/foo-1")), ("dev-util", "foo"))
+        self.assertEqual(restriction_key(packages.AndRestriction(cat, pkg)),
+                         ("dev-util", "foo"))
+        self.assertEqual(
+            restriction_key(packages.AndRestriction(atom("dev-util/foo"), cat)),
+            ("dev-util", "foo"))
+        self.assertIdentical(restriction_key(cat), None)
+        self.assertIdentical(
+            restriction_key(packages.AndRestriction(cat, pkg, negate=True)), None)
+        self.assertIdentical(
+            restriction_key(packages.OrRestriction(atom("dev-util/foo"))), None)
+        self.assertIdentical(restriction_key(packages.AlwaysTrue), None)
+
+    def test_iter_matches(self):
+        cat = packages.PackageRestriction("category", values.StrExactMatch("dev-util"))
+        index = RestrictionIndex([
+            (atom("dev-util/foo"), 1),
+            (cat, 2),
+            (atom("dev-lib/bar"), 3),
+            (atom(">=dev-util/foo-2"), 4),
+            (packages.AlwaysTrue, 5),
+            (packages.AlwaysFalse, 6),
+        ])
+        self.assertLen(index, 6)
+        self.assertTrue(index)
+        self.assertFalse(RestrictionIndex())
+        def matches(cpv):
+            return list(index.iter_matches(versioned_CPV(cpv)))
+        self.assertEqual(matches("dev-util/foo-1"), [1, 2, 5])
+        self.assertEqual(matches("dev-util/foo-2"), [1, 2, 4, 5])
+        self.assertEqual(matches("dev-lib/bar-1"), [3, 5])
+        self.assertEqual(matches("dev-util/bar-1"), [2, 5])
+
+        # explicitly keyed pairs are only tried for that key.
+        index.add(packages.AlwaysTrue, 7, key=("dev-lib", "bar"))
+        self.assertEqual(matches("dev-lib/bar-1"), [3, 5, 7])
+        self.assertEqual(matches("dev-util/foo-1"), [1, 2, 5])
+
+    def test_keyed_only_tried(self):
+        tried = []
+        def f(pkg, mode):
+            tried.append(pkg.key)
+            return True
+        index = RestrictionIndex([
+            (packages.AndRestriction(atom("dev-util/foo"), delegate(f)), None)])
+        self.assertEqual(list(index.iter_matches(versioned_CPV("dev-lib/bar-1"))), [])
+        self.assertEqual(tried, [])
+        self.assertEqual(list(index.iter_matches(versioned_CPV("dev-util/foo-1"))), [None])
+        self.assertEqual(tried, ["dev-util/foo"])
+
+    def test_pairs(self):
+        pairs = ((atom("dev-util/foo"), 1), (packages.AlwaysTrue, 2),
+                 (atom("dev-lib/bar"), 3), (atom("=dev-util/foo-1"), 4))
+        index = RestrictionIndex(pairs)
+        self.assertEqual(index.pairs, pairs)
+        self.assertEqual(index, RestrictionIndex(pairs))
+        self.assertNotEqual(index, RestrictionIndex(pairs[1:]))
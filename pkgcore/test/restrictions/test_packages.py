@@ -7,6 +7,7 @@ from snakeoil.test import mk_cpy_loadable_testcase
 
 from pkgcore import log
 from pkgcore.restrictions import packages, values
+from pkgcore.restrictions.delegated import delegate
 from pkgcore.test import (
     silence_logging, TestRestriction, TestCase, malleable_obj, callback_logger)
 
@@ -210,3 +211,52 @@ class ConditionalTest(TestCase):
 
 test_cpy_used = mk_cpy_loadable_testcase('pkgcore.restrictions._restrictions',
     "pkgcore.restrictions.packages", "PackageRestriction_base", "PackageRestriction")
+
+
+class CostTest(TestCase):
+
+    def test_restriction_cost(self):
+        cost = packages.restriction_cost
+        cat = packages.PackageRestriction("category", values.StrExactMatch("foo"))
+        repo = packages.PackageRestriction(
+            "repo.repo_id", values.StrExactMatch("gentoo"))
+        slot = packages.PackageRestriction("slot", values.StrExactMatch("0"))
+        self.assertEqual(cost(cat), 0)
+        self.assertEqual(cost(repo), 0)
+        self.assertTrue(cost(slot))
+        self.assertEqual(cost(packages.AndRestriction(cat, repo)), 0)
+        self.assertEqual(cost(packages.OrRestriction(cat, slot)), cost(slot))
+        self.assertEqual(cost(packages.AlwaysTrue), 0)
+        self.assertEqual(cost(packages.PackageRestrictionMulti(
+            ("category", "slot"), values.AlwaysTrue)), cost(slot))
+        self.assertEqual(cost(delegate(lambda *a: True, cost=0)), 0)
+        # unknown cost is assumed to be expensive.
+        self.assertTrue(cost(delegate(lambda *a: True)))
+
+    def test_order_by_cost(self):
+        cat = packages.PackageRestriction("category", values.StrExactMatch("foo"))
+        slot = packages.PackageRestriction("slot", values.StrExactMatch("0"))
+        r = packages.AndRestriction(cat, slot)
+        self.assertIdentical(packages.order_by_cost(r), r)
+        r = packages.AndRestriction(slot, packages.OrRestriction(slot, cat), cat)
+        self.assertEqual(
+            packages.order_by_cost(r).restrictions,
+            (cat, slot, packages.OrRestriction(cat, slot)))
+        self.assertIdentical(packages.order_by_cost(slot), slot)
+
+    def test_split_by_cost(self):
+        cat = packages.PackageRestriction("category", values.StrExactMatch("foo"))
+        pkg = packages.PackageRestriction("package", values.StrExactMatch("bar"))
+        slot = packages.PackageRestriction("slot", values.StrExactMatch("0"))
+        self.assertEqual(packages.split_by_cost(cat), (cat, None))
+        self.assertEqual(packages.split_by_cost(slot), (None, slot))
+        self.assertEqual(
+            packages.split_by_cost(packages.AndRestriction(slot, cat)),
+            (cat, slot))
+        self.assertEqual(
+            packages.split_by_cost(packages.AndRestriction(slot, cat, pkg)),
+            (packages.AndRestriction(cat, pkg), slot))
+        # negated ands can't be split, only reordered.
+        self.assertEqual(
+            packages.split_by_cost(packages.AndRestriction(slot, cat, negate=True)),
+            (None, packages.AndRestriction(cat, slot, negate=True)))
@@ -235,3 +235,11 @@ class TestRegen(TestCase, helpers.ArgParseMixin):
         self.assertEqual(
             [options.repos[0].__class__, options.threads],
             [TestSimpleTree, 2])
+        self.assertFalse(options.processes)
+
+        options = self.parse(
+            'spork', '--threads', '4', '--processes', '--incremental',
+            spork=basics.HardCodedConfigSection({'class': fake_repo}))
+        self.assertEqual(
+            [options.threads, options.processes, options.incremental],
+            [4, True, True])
@@ -3,7 +3,7 @@
 # License: BSD/GPL2
 
 from pkgcore.config import basics, ConfigHint, configurable
-from pkgcore.ebuild import atom
+from pkgcore.ebuild import atom, restricts
 from pkgcore.repository import util
 from pkgcore.scripts import pquery
 from pkgcore.test import TestCase
@@ -72,5 +72,20 @@ class CommandlineTest(TestCase, helpers.ArgParseMixin):
             '--print-revdep', 'a/spork', '--all', domain=domain_config)
         self.assertEqual([atom.atom('a/spork')], config.print_revdep)
 
+    def test_revdep_pkgs(self):
+        class pkg(object):
+            def __init__(self, depends=(), rdepends=(), post_rdepends=()):
+                self.depends = map(atom.atom, depends)
+                self.rdepends = map(atom.atom, rdepends)
+                self.post_rdepends = map(atom.atom, post_rdepends)
+        target = atom.atom('=spork/foon-1')
+        restrict = restricts.revdep_pkgs([target])
+        dep = ['spork/foon']
+        self.assertTrue(restrict.match(pkg(dep, dep, dep)))
+        # every dependency attr has to match, unlike with --revdep.
+        self.assertFalse(restrict.match(pkg(dep, dep)))
+        self.assertTrue(restricts.revdep(target).match(pkg(dep)))
+        self.assertFalse(restrict.match(pkg(dep, dep, ['>spork/foon-1'])))
+
     def test_no_contents(self):
         self.assertOut([], '--contents', '--all', test_domain=domain_config)
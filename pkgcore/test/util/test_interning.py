@@ -0,0 +1,82 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+from pkgcore.test import TestCase
+from pkgcore.util.interning import InternCache, InterningMeta
+
+
+class TestInternCache(TestCase):
+
+    def test_lru(self):
+        cache = InternCache(3)
+        for x in 'abc':
+            cache[x] = x.upper()
+        self.assertEqual(cache['a'], 'A')
+        cache['d'] = 'D'
+        # b was the least recently used.
+        self.assertNotIn('b', cache)
+        self.assertEqual([x for x in 'abcd' if x in cache], ['a', 'c', 'd'])
+        cache['e'] = 'E'
+        self.assertNotIn('c', cache)
+        self.assertEqual(len(cache), 3)
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_overwrite(self):
+        cache = InternCache(2)
+        cache['a'] = 1
+        cache['a'] = 2
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache['a'], 2)
+
+    def test_resize_and_clear(self):
+        self.assertRaises(ValueError, InternCache, -1)
+        cache = InternCache(0)
+        cache['a'] = 1
+        self.assertEqual(len(cache), 0)
+        cache.resize(2)
+        cache['a'] = cache['b'] = 1
+        cache.resize(4)
+        self.assertEqual(len(cache), 2)
+        cache.resize(1)
+        self.assertEqual(len(cache), 0)
+        cache['a'] = 1
+        cache.clear()
+        self.assertNotIn('a', cache)
+        self.assertRaises(ValueError, cache.resize, -1)
+
+    def test_interning(self):
+        cache = InternCache(10)
+        calls = []
+        def f(*args, **kwds):
+            calls.append(args)
+            return [args, kwds]
+        f = cache.interning(f)
+        self.assertIdentical(f(1, x=2), f(1, x=2))
+        self.assertNotIdentical(f(1), f(1, x=2))
+        self.assertEqual(len(calls), 2)
+        # unhashable args are passed through.
+        self.assertEqual(f([1]), [([1],), {}])
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+
+class TestInterningMeta(TestCase):
+
+    def test_opt_in(self):
+        cache = InternCache(10)
+
+        class kls(object):
+            __metaclass__ = InterningMeta
+            __intern_cache__ = cache
+
+            def __init__(self, *args, **kwds):
+                self.args, self.kwds = args, kwds
+
+        class subkls(kls):
+            pass
+
+        self.assertIdentical(kls(1, a=2), kls(1, a=2))
+        self.assertNotIdentical(kls(1), kls(1, a=2))
+        self.assertNotIdentical(kls([1]), kls([1]))
+        self.assertNotIdentical(subkls(1), subkls(1))
+        self.assertEqual(len(cache), 2)
@@ -0,0 +1,95 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+from snakeoil.osutils import pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.fs import fs
+from pkgcore.fs.contents import contentsSet
+from pkgcore.vdb.contents import ContentsFile, PackedContents, iter_contents_paths
+
+
+contents = """\
+dir /usr
+dir /usr/bin
+obj /usr/bin/foo d41d8cd98f00b204e9800998ecf8427e 100
+obj /usr/bin/foo bar 0041d8cd98f00b204e9800998ecf8427 101
+sym /usr/bin/baz -> foo bar 102
+fif /usr/fifo
+"""
+
+
+class TestContentsFile(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.path = pjoin(self.dir, 'CONTENTS')
+        with open(self.path, 'w') as f:
+            f.write(contents)
+
+    def test_load(self):
+        cset = ContentsFile(self.path)
+        self.assertIsInstance(cset._dict, PackedContents)
+        self.assertLen(cset, 6)
+        foo = cset['/usr/bin/foo']
+        self.assertTrue(foo.is_reg)
+        self.assertEqual(foo.chksums, {'md5': 0xd41d8cd98f00b204e9800998ecf8427e})
+        self.assertEqual(foo.mtime, 100)
+        self.assertEqual(cset['/usr/bin/foo bar'].chksums,
+                         {'md5': 0x41d8cd98f00b204e9800998ecf8427})
+        baz = cset['/usr/bin/baz']
+        self.assertTrue(baz.is_sym)
+        self.assertEqual((baz.target, baz.mtime), ('foo bar', 102))
+        self.assertTrue(cset['/usr/'].is_dir)
+        self.assertTrue(cset['/usr/fifo'].is_fifo)
+        self.assertEqual(sorted(x.location for x in cset.iterdirs()),
+                         ['/usr', '/usr/bin'])
+        self.assertEqual(list(iter_contents_paths(self.path)), [
+            '/usr', '/usr/bin', '/usr/bin/foo', '/usr/bin/foo bar', '/usr/bin/baz',
+            '/usr/fifo'])
+
+    def test_set_operations(self):
+        cset = ContentsFile(self.path)
+        other = contentsSet([
+            fs.fsDir('/usr', strict=False), fs.fsFile('/usr/bin/foo', strict=False),
+            fs.fsFile('/usr/lib/libfoo.so', strict=False)])
+        self.assertEqual(sorted(x.location for x in cset.intersection(other)),
+                         ['/usr', '/usr/bin/foo'])
+        self.assertEqual(sorted(x.location for x in other.difference(cset)),
+                         ['/usr/lib/libfoo.so'])
+        self.assertFalse(cset.isdisjoint(other))
+        self.assertEqual(cset, ContentsFile(self.path))
+        self.assertEqual(cset, contentsSet(cset))
+        self.assertNotEqual(cset, other)
+
+        cset = ContentsFile(self.path, mutable=True)
+        cset.difference_update(other)
+        self.assertLen(cset, 4)
+        self.assertNotIn('/usr/bin/foo', cset)
+        cset.discard('/usr/bin/foo')
+        cset.discard('/usr/bin/baz')
+        self.assertNotIn('/usr/bin/baz', cset)
+        new = fs.fsFile('/usr/bin/foo bar', chksums={'md5': 1}, mtime=1, strict=False)
+        cset.add(new)
+        self.assertIdentical(cset['/usr/bin/foo bar'], new)
+        self.assertLen(cset, 3)
+        cset.clear()
+        self.assertFalse(cset)
+
+    def test_flush(self):
+        cset = ContentsFile(self.path, mutable=True)
+        cset.flush()
+        with open(self.path) as f:
+            self.assertEqual(sorted(f.read().splitlines()),
+                             sorted(contents.splitlines()))
+        cset.remove('/usr/fifo')
+        cset.add(fs.fsFile('/usr/bin/new', chksums={'md5': 1}, mtime=5, strict=False))
+        cset.flush()
+        self.assertEqual(sorted(x.location for x in ContentsFile(self.path)),
+                         ['/usr', '/usr/bin', '/usr/bin/baz', '/usr/bin/foo',
+                          '/usr/bin/foo bar', '/usr/bin/new'])
+
+    def test_corrupt(self):
+        with open(self.path, 'w') as f:
+            f.write('obj /usr/bin/foo nothex 100\n')
+        self.assertRaises(ValueError, ContentsFile, self.path)
@@ -0,0 +1,294 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+import logging
+import os
+import shutil
+
+from snakeoil.osutils import ensure_dirs, pjoin
+from snakeoil.test.mixins import TempDirMixin
+
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.triggers import ProtectOwned
+from pkgcore.fs import fs
+from pkgcore.fs.contents import contentsSet
+from pkgcore.merge.errors import BlockModification
+from pkgcore.restrictions import packages, values
+from pkgcore.test import silence_logging
+from pkgcore.vdb import ondisk, repo_ops
+from pkgcore.vdb.metadata_cache import MetadataCache
+from pkgcore.vdb.owners import OwnersIndex
+
+
+class TestMetadataCache(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        self.cache_dir = pjoin(self.dir, 'cache')
+        self.add_pkg('dev-util/foo-1', SLOT='0', KEYWORDS='x86 amd64',
+                     DESCRIPTION='tab\tand\nnewline')
+        self.add_pkg('dev-lib/bar-2', SLOT='1')
+        self.reads = []
+
+    def add_pkg(self, cpvstr, **metadata):
+        path = pjoin(self.vdb, cpvstr)
+        ensure_dirs(path)
+        for key, value in metadata.iteritems():
+            with open(pjoin(path, key), 'w') as f:
+                f.write(value)
+        os.utime(path, (100, 100))
+
+    def mk_repo(self, **kwds):
+        repo = ondisk.tree(self.vdb, cache_location=self.cache_dir, **kwds)
+        orig = repo._internal_load_key
+        def load(path, key):
+            self.reads.append((os.path.basename(path), key))
+            return orig(path, key)
+        repo._internal_load_key = load
+        return repo
+
+    def get(self, repo, cpvstr, key):
+        pkg = repo.match(atom("=" + cpvstr))[0]
+        return pkg.data.get(key)
+
+    def test_roundtrip(self):
+        repo = self.mk_repo()
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'SLOT'), '0')
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'DESCRIPTION'),
+                         'tab\tand\nnewline')
+        self.assertIdentical(self.get(repo, 'dev-lib/bar-2', 'KEYWORDS'), None)
+        self.assertIn(('foo-1', 'DESCRIPTION'), self.reads)
+        repo.operations.flush_cache()
+
+        # a fresh repo is served from the cache.
+        del self.reads[:]
+        repo = self.mk_repo()
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'SLOT'), '0')
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'DESCRIPTION'),
+                         'tab\tand\nnewline')
+        self.assertIdentical(self.get(repo, 'dev-lib/bar-2', 'KEYWORDS'), None)
+        self.assertEqual(self.reads, [])
+        # keys not cached yet are still read.
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'KEYWORDS'), 'x86 amd64')
+        self.assertEqual(self.reads, [('foo-1', 'KEYWORDS')])
+
+    def test_invalidation(self):
+        repo = self.mk_repo()
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'SLOT'), '0')
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'KEYWORDS'), 'x86 amd64')
+        self.get(repo, 'dev-util/foo-1', 'DESCRIPTION')
+        repo.operations.flush_cache()
+        # rewriting a file in place leaves the directory mtime alone.
+        self.add_pkg('dev-util/foo-1', SLOT='2')
+        os.utime(pjoin(self.vdb, 'dev-util/foo-1', 'SLOT'), (200, 200))
+        os.remove(pjoin(self.vdb, 'dev-util/foo-1', 'KEYWORDS'))
+        del self.reads[:]
+        repo = self.mk_repo()
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'SLOT'), '2')
+        self.assertIdentical(self.get(repo, 'dev-util/foo-1', 'KEYWORDS'), None)
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'DESCRIPTION'),
+                         'tab\tand\nnewline')
+        self.assertEqual(self.reads, [('foo-1', 'SLOT')])
+
+        repo_ops.write_metadata_cache(repo, 'dev-util/foo-1')
+        self.assertNotIn('dev-util/foo-1', MetadataCache(repo.metadata_cache.path))
+
+    def test_disabled(self):
+        repo = self.mk_repo(disable_cache=True)
+        self.assertIdentical(repo.metadata_cache, None)
+        self.assertEqual(self.get(repo, 'dev-util/foo-1', 'SLOT'), '0')
+        repo.operations.flush_cache()
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_regen(self):
+        repo = self.mk_repo()
+        repo.operations.regen_cache()
+        cache = MetadataCache(repo.metadata_cache.path)
+        self.assertLen(cache, 2)
+        mtime = os.stat(pjoin(self.vdb, 'dev-util/foo-1', 'KEYWORDS')).st_mtime
+        self.assertEqual(cache.get('dev-util/foo-1', 'KEYWORDS', mtime), 'x86 amd64')
+
+    @silence_logging(logging.root)
+    def test_corrupt(self):
+        ensure_dirs(self.cache_dir)
+        path = pjoin(self.cache_dir, 'metadata')
+        with open(path, 'w') as f:
+            f.write(MetadataCache.magic + '\ndev-util/foo-1\tSLOT=0\n')
+        self.assertLen(MetadataCache(path), 0)
+        with open(path, 'w') as f:
+            f.write('garbage\n')
+        self.assertLen(MetadataCache(path), 0)
+
+
+class TestOwnersIndex(TempDirMixin):
+
+    def setUp(self):
+        TempDirMixin.setUp(self)
+        self.vdb = pjoin(self.dir, 'vdb')
+        self.cache_dir = pjoin(self.dir, 'cache')
+        self.add_pkg('dev-util/foo-1', 'dir /usr', 'dir /usr/bin',
+                     'obj /usr/bin/foo d41d8cd98f00b204e9800998ecf8427e 100',
+                     'sym /usr/bin/foo bar -> foo 100')
+        self.add_pkg('dev-lib/bar-2', 'dir /usr', 'dir /usr/lib',
+                     'obj /usr/lib/libbar.so d41d8cd98f00b204e9800998ecf8427e 100')
+        self.loads = []
+
+    def add_pkg(self, cpvstr, *contents):
+        path = pjoin(self.vdb, cpvstr)
+        ensure_dirs(path)
+        for key, value in (('SLOT', '0'), ('EAPI', '5')):
+            with open(pjoin(path, key), 'w') as f:
+                f.write(value)
+        with open(pjoin(path, 'CONTENTS'), 'w') as f:
+            f.write(''.join(x + '\n' for x in contents))
+        self.bump(pjoin(path, 'CONTENTS'))
+
+    def bump(self, *paths):
+        # CONTENTS mtimes are what the index relies on, the vdb dir is
+        # bumped along as merges do.
+        self.bumps = getattr(self, 'bumps', 100) + 1
+        for x in paths + (self.vdb,):
+            os.utime(x, (self.bumps, self.bumps))
+
+    def mk_repo(self, **kwds):
+        repo = ondisk.tree(self.vdb, cache_location=self.cache_dir, **kwds)
+        orig = repo._internal_load_key
+        def load(path, key):
+            if key == 'contents':
+                self.loads.append(os.path.basename(path))
+            return orig(path, key)
+        repo._internal_load_key = load
+        return repo
+
+    def owns_restrict(self, *paths):
+        return packages.PackageRestriction('contents', values.ContainmentMatch2(
+            contentsSet(fs.fsBase(x, strict=False) for x in paths)))
+
+    def owns(self, repo, *paths):
+        return sorted(pkg.cpvstr for pkg in repo.itermatch(self.owns_restrict(*paths)))
+
+    def test_owners(self):
+        repo = self.mk_repo()
+        index = repo.get_owners_index()
+        self.assertLen(index, 2)
+        self.assertEqual(index.owners('/usr/bin/foo bar'), frozenset(['dev-util/foo-1']))
+        self.assertEqual(index.owners('/usr', '/nonexistent'),
+                         frozenset(['dev-util/foo-1', 'dev-lib/bar-2']))
+        self.assertEqual(index.owners('/nonexistent'), frozenset())
+
+        # a fresh repo is answered from the written out index.
+        repo = self.mk_repo()
+        self.assertEqual(self.owns(repo, '/usr/lib/libbar.so'), ['dev-lib/bar-2'])
+        self.assertEqual(self.owns(repo, '/usr/bin/'), ['dev-util/foo-1'])
+        self.assertEqual(self.loads, ['bar-2', 'foo-1'])
+
+        del self.loads[:]
+        restrict = packages.PackageRestriction('contents', values.AnyMatch(
+            values.GetAttrRestriction('location', values.StrRegex('lib.*\.so$'))))
+        self.assertEqual([pkg.cpvstr for pkg in repo.itermatch(restrict)],
+                         ['dev-lib/bar-2'])
+        self.assertEqual(self.loads, ['bar-2'])
+
+    def test_invalidation(self):
+        repo = self.mk_repo()
+        self.assertEqual(self.owns(repo, '/usr/bin/foo'), ['dev-util/foo-1'])
+        self.add_pkg('dev-util/foo-2', 'obj /usr/bin/foo d41d8cd98f00b204e9800998ecf8427e 100')
+        with open(pjoin(self.vdb, 'dev-lib/bar-2', 'CONTENTS'), 'w') as f:
+            f.write('obj /usr/bin/foo d41d8cd98f00b204e9800998ecf8427e 100\n')
+        self.bump(pjoin(self.vdb, 'dev-lib/bar-2', 'CONTENTS'))
+        repo = self.mk_repo()
+        self.assertEqual(self.owns(repo, '/usr/bin/foo'),
+                         ['dev-lib/bar-2', 'dev-util/foo-1', 'dev-util/foo-2'])
+        self.assertEqual(self.owns(repo, '/usr/lib/libbar.so'), [])
+
+        shutil.rmtree(pjoin(self.vdb, 'dev-util/foo-1'))
+        self.bump()
+        repo = self.mk_repo()
+        self.assertEqual(repo.get_owners_index().owners('/usr/bin/foo'),
+                         frozenset(['dev-lib/bar-2', 'dev-util/foo-2']))
+        self.assertNotIn('dev-util/foo-1', OwnersIndex(repo.owners_index.path))
+
+    def test_disabled(self):
+        repo = self.mk_repo(disable_cache=True)
+        self.assertIdentical(repo.get_owners_index(), None)
+        self.assertEqual(self.owns(repo, '/usr/bin/foo'), ['dev-util/foo-1'])
+        self.assertEqual(sorted(self.loads), ['bar-2', 'foo-1'])
+
+    @silence_logging(logging.root)
+    def test_corrupt_contents(self):
+        # packages with corrupt CONTENTS are candidates for every query,
+        # rather than leaving the index unusable.
+        self.add_pkg('dev-util/foo-2', 'garbage')
+        repo = self.mk_repo()
+        index = repo.get_owners_index()
+        self.assertEqual(index.candidates(self.owns_restrict('/usr/lib/libbar.so')),
+                         frozenset(['dev-lib/bar-2', 'dev-util/foo-2']))
+        index = OwnersIndex(index.path)
+        self.assertTrue(index.built)
+        self.assertIn('dev-util/foo-2', index)
+        self.assertEqual(index.owners('/usr/bin/foo'), frozenset(['dev-util/foo-1']))
+        self.assertEqual(index.mtime('dev-util/foo-2'), self.bumps)
+
+        # fixing it is picked up once its CONTENTS changes.
+        self.add_pkg('dev-util/foo-2')
+        index = self.mk_repo().get_owners_index()
+        self.assertEqual(index.candidates(self.owns_restrict('/usr/lib/libbar.so')),
+                         frozenset(['dev-lib/bar-2']))
+
+    def test_merges(self):
+        repo = self.mk_repo()
+        repo_ops.update_owners_index(
+            repo, 'dev-util/foo-1', pjoin(self.vdb, 'dev-util/foo-1'))
+        # indexes nobody built yet are left alone.
+        self.assertFalse(os.path.exists(repo.owners_index.path))
+
+        index = repo.get_owners_index()
+        repo.get_owners_index = None
+        repo._sync_owners_index = None
+        self.add_pkg('dev-util/foo-2', 'obj /usr/bin/foo2 d41d8cd98f00b204e9800998ecf8427e 100')
+        repo_ops.update_owners_index(
+            repo, 'dev-util/foo-2', pjoin(self.vdb, 'dev-util/foo-2'))
+        shutil.rmtree(pjoin(self.vdb, 'dev-util/foo-1'))
+        repo_ops.update_owners_index(repo, 'dev-util/foo-1')
+        for index in (index, OwnersIndex(index.path)):
+            self.assertEqual(sorted(index), ['dev-lib/bar-2', 'dev-util/foo-2'])
+            self.assertEqual(index.owners('/usr/bin/foo2'), frozenset(['dev-util/foo-2']))
+            self.assertEqual(index.mtime('dev-util/foo-2'), self.bumps)
+
+    def test_inplace_rewrite(self):
+        # rewriting CONTENTS in place touches neither the package's vdb
+        # directory nor the vdb itself.
+        repo = self.mk_repo()
+        self.assertEqual(self.owns(repo, '/usr/bin/baz'), [])
+        bar = pjoin(self.vdb, 'dev-lib/bar-2')
+        stamps = [(x, os.stat(x).st_mtime) for x in (self.vdb, bar)]
+        with open(pjoin(bar, 'CONTENTS'), 'a') as f:
+            f.write('obj /usr/bin/baz d41d8cd98f00b204e9800998ecf8427e 100\n')
+        os.utime(pjoin(bar, 'CONTENTS'), (self.bumps + 1, self.bumps + 1))
+        for path, mtime in stamps:
+            os.utime(path, (mtime, mtime))
+
+        repo = self.mk_repo()
+        try:
+            ProtectOwned([repo]).collision(
+                contentsSet([fs.fsFile('/usr/bin/baz', strict=False)]))
+        except BlockModification as e:
+            self.assertIn("( file:/usr/bin/baz ) owned by 'dev-lib/bar-2'", str(e))
+        else:
+            self.fail("collision wasn't detected")
+        self.assertEqual(self.owns(repo, '/usr/bin/baz'), ['dev-lib/bar-2'])
+
+    def test_protect_owned(self):
+        repo = self.mk_repo()
+        trigger = ProtectOwned([repo])
+        trigger.collision(contentsSet([fs.fsFile('/usr/bin/baz', strict=False)]))
+        try:
+            trigger.collision(contentsSet([
+                fs.fsFile('/usr/bin/foo', strict=False),
+                fs.fsFile('/usr/lib/libfoo.so', strict=False)]))
+        except BlockModification as e:
+            self.assertIn("( file:/usr/bin/foo ) owned by 'dev-util/foo-1'", str(e))
+        else:
+            self.fail("collision wasn't detected")
+        self.assertEqual(self.loads, ['foo-1'])
@@ -0,0 +1,152 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+size bounded interning of immutable instances, such as parsed atoms and cpvs
+
+:obj:`snakeoil.caching.WeakInstMeta` only reuses instances something else
+still references, so values like a common dependency atom get reparsed each
+time the last package referencing them is released.  An :obj:`InternCache`
+keeps the most recently used instances alive instead, either for a class via
+:obj:`InterningMeta` or for a factory via :meth:`InternCache.interning`.
+"""
+
+__all__ = ("InternCache", "InterningMeta")
+
+import threading
+
+
+class InternCache(object):
+
+    """
+    mapping keeping the most recently used entries, up to maxsize of them
+
+    Lookups count as uses; the :attr:`hits` and :attr:`misses` counters track
+    how lookups fared.  Safe for use from multiple threads.
+    """
+
+    def __init__(self, maxsize):
+        """
+        :param maxsize: number of entries to keep; 0 disables the cache
+        """
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0, got %r" % (maxsize,))
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # entries are [prev, next, key, value] links of a circular list
+        # ordered by recency; root's next is the least recently used.
+        self._entries = {}
+        root = self._root = []
+        root[:] = [root, root, None, None]
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                raise KeyError(key)
+            self.hits += 1
+            # unlink, then relink as the most recently used.
+            prev, next = entry[0], entry[1]
+            prev[1], next[0] = next, prev
+            root = self._root
+            last = root[0]
+            entry[0], entry[1] = last, root
+            last[1] = root[0] = entry
+            return entry[3]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            if not self.maxsize:
+                return
+            entries = self._entries
+            entry = entries.get(key)
+            if entry is not None:
+                entry[3] = value
+                return
+            root = self._root
+            if len(entries) >= self.maxsize:
+                # evict the least recently used entry.
+                entry = root[1]
+                del entries[entry[2]]
+                root[1] = entry[1]
+                entry[1][0] = root
+            last = root[0]
+            entry = [last, root, key, value]
+            last[1] = root[0] = entries[key] = entry
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def resize(self, maxsize):
+        """Change maxsize, dropping all entries if it shrinks."""
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0, got %r" % (maxsize,))
+        with self._lock:
+            if maxsize < len(self._entries):
+                self._reset()
+            self.maxsize = maxsize
+
+    def clear(self):
+        """Drop all entries, leaving the counters alone."""
+        with self._lock:
+            self._reset()
+
+    def interning(self, functor):
+        """Wrap functor so its results are reused for the same arguments."""
+        def f(*args, **kwds):
+            if kwds:
+                key = (functor, args, tuple(sorted(kwds.iteritems())))
+            else:
+                key = (functor, args)
+            try:
+                return self[key]
+            except KeyError:
+                pass
+            except TypeError:
+                # unhashable args; nothing to share.
+                return functor(*args, **kwds)
+            inst = self[key] = functor(*args, **kwds)
+            return inst
+        return f
+
+
+class InterningMeta(type):
+
+    """
+    metaclass reusing instances held in an :obj:`InternCache`
+
+    Classes opt in by setting ``__intern_cache__`` in their body; it's not
+    inherited, so derivatives with state of their own aren't shared by
+    accident.  Instances are keyed by class and constructor arguments, and
+    must be immutable.
+    """
+
+    def __new__(cls, name, bases, scope):
+        scope.setdefault('__intern_cache__', None)
+        return type.__new__(cls, name, bases, scope)
+
+    def __call__(cls, *a, **kw):
+        cache = cls.__intern_cache__
+        if cache is None:
+            return type.__call__(cls, *a, **kw)
+        if kw:
+            key = (cls, a, tuple(sorted(kw.iteritems())))
+        else:
+            key = (cls, a)
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable args; nothing to share.
+            return type.__call__(cls, *a, **kw)
+        inst = cache[key] = type.__call__(cls, *a, **kw)
+        return inst
@@ -1,11 +1,16 @@
 # Copyright: 2005-2010 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
-__all__ = ("LookupFsDev", "ContentsFile")
+__all__ = ("LookupFsDev", "PackedContents", "ContentsFile", "iter_contents_paths")
+
+from array import array
+from binascii import a2b_hex, b2a_hex
+from itertools import chain
 
 from snakeoil import data_source
 from snakeoil.demandload import demandload
 from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.mappings import DictMixin
 
 from pkgcore.fs import fs
 from pkgcore.fs.contents import contentsSet
@@ -16,6 +21,7 @@ demandload(
     'stat',
     'snakeoil.chksum:get_handler',
     'snakeoil.fileutils:readlines_ascii',
+    'snakeoil.osutils:normpath',
     'pkgcore:os_data',
 )
 
@@ -43,9 +49,146 @@ class LookupFsDev(fs.fsDev):
         fs.fsDev.__init__(self, path, **kwds)
 
 
+class PackedContents(DictMixin):
+
+    """
+    location to fs object mapping storing CONTENTS entries packed
+
+    Entries added via :obj:`add_entry` are kept as columns (kind, md5 and
+    mtime arrays, symlink targets) and only turned into fs objects when
+    accessed; those objects aren't kept around.  fs objects set directly
+    are stored as is.
+    """
+
+    __slots__ = ('_rows', '_kinds', '_md5s', '_mtimes', '_targets', '_objs')
+
+    _null_md5 = '\0' * 16
+    _kinds_map = {"obj": "o", "sym": "s", "dir": "d", "dev": "v", "fif": "f"}
+
+    def __init__(self, iterable=None):
+        self._rows = {}
+        self._kinds = array('c')
+        self._md5s = bytearray()
+        self._mtimes = array('l')
+        self._targets = {}
+        self._objs = {}
+        DictMixin.__init__(self, iterable)
+
+    def add_entry(self, kind, location, md5=None, mtime=0, target=None):
+        """Add a CONTENTS entry.
+
+        :param kind: entry type as CONTENTS names it; obj, sym, dir, dev or fif
+        :param location: normalized path of the entry
+        :param md5: hex md5 of obj entries
+        :param mtime: mtime of obj and sym entries
+        :param target: target of sym entries
+        """
+        code = self._kinds_map[kind]
+        if md5 is None:
+            packed_md5 = self._null_md5
+        else:
+            try:
+                packed_md5 = a2b_hex(md5.rjust(32, '0'))
+            except TypeError:
+                packed_md5 = None
+            if packed_md5 is None or len(packed_md5) != 16:
+                raise ValueError("invalid md5 %r" % (md5,))
+        row = len(self._kinds)
+        self._mtimes.append(mtime)
+        self._kinds.append(code)
+        self._md5s.extend(packed_md5)
+        if target is not None:
+            self._targets[row] = target
+        self._objs.pop(location, None)
+        self._rows[location] = row
+
+    def __getitem__(self, location):
+        row = self._rows.get(location)
+        if row is None:
+            return self._objs[location]
+        kind = self._kinds[row]
+        if kind == 'o':
+            md5 = long(b2a_hex(self._md5s[row * 16:(row + 1) * 16]), 16)
+            return fs.fsFile(location, chksums={"md5": md5},
+                             mtime=long(self._mtimes[row]), strict=False)
+        elif kind == 's':
+            return fs.fsLink(location, self._targets[row],
+                             mtime=long(self._mtimes[row]), strict=False)
+        elif kind == 'd':
+            return fs.fsDir(location, strict=False)
+        elif kind == 'f':
+            return fs.fsFifo(location, strict=False)
+        return LookupFsDev(location, strict=False)
+
+    def __setitem__(self, location, obj):
+        self._drop_row(location)
+        self._objs[location] = obj
+
+    def __delitem__(self, location):
+        if not self._drop_row(location):
+            del self._objs[location]
+
+    def _drop_row(self, location):
+        # the columns keep the row's data; it's dropped on clear.
+        row = self._rows.pop(location, None)
+        if row is None:
+            return False
+        self._targets.pop(row, None)
+        return True
+
+    def pop(self, location, *default):
+        try:
+            obj = self[location]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[location]
+        return obj
+
+    def clear(self):
+        self.__init__()
+
+    def __contains__(self, location):
+        return location in self._rows or location in self._objs
+
+    def iterkeys(self):
+        return chain(self._rows, self._objs)
+
+    def itervalues(self):
+        return (self[x] for x in self.iterkeys())
+
+    def __len__(self):
+        return len(self._rows) + len(self._objs)
+
+    def __nonzero__(self):
+        return bool(self._rows or self._objs)
+
+
+def iter_contents_paths(path):
+    """Yield the paths listed by a CONTENTS file, skipping the fs objects.
+
+    A missing file lists nothing; corrupt entries raise ValueError.
+    """
+    for line in readlines_ascii(path, True, True):
+        if not line:
+            continue
+        s = line.split(" ")
+        if s[0] in ("dir", "dev", "fif"):
+            yield normpath(' '.join(s[1:]))
+        elif s[0] == "obj":
+            yield normpath(' '.join(s[1:-2]))
+        elif s[0] == "sym":
+            yield normpath(' '.join(s[1:s.index("->")]))
+        else:
+            raise ValueError("unknown entry type %r" % (line,))
+
+
 class ContentsFile(contentsSet):
     """class wrapping a contents file"""
 
+    __dict_kls__ = PackedContents
+
     def __init__(self, source, mutable=False, create=False):
 
         if not isinstance(source, (data_source.base, basestring)):
@@ -54,7 +197,7 @@ class ContentsFile(contentsSet):
         self._source = source
 
         if not create:
-            self.update(self._iter_contents())
+            self._load()
 
         self.mutable = mutable
 
@@ -88,30 +231,23 @@ class ContentsFile(contentsSet):
     def flush(self):
         return self._write()
 
-    def _iter_contents(self):
+    def _load(self):
         self.clear()
+        add_entry = self._dict.add_entry
         for line in self._get_fd():
             if not line:
                 continue
             s = line.split(" ")
             if s[0] in ("dir", "dev", "fif"):
-                path = ' '.join(s[1:])
-                if s[0] == 'dir':
-                    obj = fs.fsDir(path, strict=False)
-                elif s[0] == 'dev':
-                    obj = LookupFsDev(path, strict=False)
-                else:
-                    obj = fs.fsFifo(path, strict=False)
+                add_entry(s[0], normpath(' '.join(s[1:])))
             elif s[0] == "obj":
-                path = ' '.join(s[1:-2])
-                obj = fs.fsFile(
-                    path, chksums={"md5":long(s[-2], 16)},
-                        mtime=long(s[-1]), strict=False)
+                add_entry("obj", normpath(' '.join(s[1:-2])),
+                          md5=s[-2], mtime=long(s[-1]))
             elif s[0] == "sym":
                 try:
                     p = s.index("->")
-                    obj = fs.fsLink(' '.join(s[1:p]), ' '.join(s[p+1:-1]),
-                        mtime=long(s[-1]), strict=False)
+                    add_entry("sym", normpath(' '.join(s[1:p])),
+                              mtime=long(s[-1]), target=' '.join(s[p+1:-1]))
 
                 except ValueError:
                     # XXX throw a corruption error
@@ -120,15 +256,15 @@ class ContentsFile(contentsSet):
                 raise Exception(
                     "unknown entry type %r" % (line,))
 
-            yield obj
-
     def _write(self):
         md5_handler = get_handler('md5')
         outfile = None
         try:
             outfile = self._get_fd(True)
 
-            for obj in sorted(self):
+            # objects are pulled one at a time rather than all at once.
+            for location in sorted(self._dict):
+                obj = self._dict[location]
 
                 if obj.is_reg:
                     s = " ".join(("obj", obj.location,
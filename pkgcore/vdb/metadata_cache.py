@@ -0,0 +1,132 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+consolidated metadata cache for the installed package database
+
+Each vdb metadata key (SLOT, USE, DEPEND, ...) lives in a file of its own,
+so loading the installed packages costs a read per key per package.  The
+cache keeps the keys read so far for every package in a single file, each
+value stored alongside the mtime of the file it was read from; a stat of
+that file validates it.  The mtime of the vdb directory isn't enough, since
+rewriting a file in place leaves it untouched.
+"""
+
+__all__ = ("MetadataCache",)
+
+import errno
+import os
+
+from snakeoil.osutils import ensure_dirs
+
+from pkgcore.log import logger
+
+
+class MetadataCache(object):
+
+    """
+    mapping of cpv to the metadata read from its vdb directory
+
+    Entries map metadata keys to the mtime of their file and their value;
+    keys not read yet are absent.
+    """
+
+    magic = 'pkgcore-vdb-metadata 2'
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = entries = {}
+        try:
+            with open(self.path) as f:
+                if f.readline().rstrip('\n') != self.magic:
+                    logger.warning(
+                        "ignoring vdb metadata cache %r: unknown format", self.path)
+                    return
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    metadata = {}
+                    for field in fields[1:]:
+                        key, value = field.split('=', 1)
+                        key, mtime = key.split('@')
+                        metadata[key] = (float(mtime), value.decode('string_escape'))
+                    entries[fields[0]] = metadata
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except (ValueError, IndexError) as e:
+            logger.warning("ignoring corrupt vdb metadata cache %r: %s", self.path, e)
+            entries.clear()
+
+    def get(self, cpv, key, mtime):
+        """Return the value of key cached for cpv, None if absent or stale.
+
+        :param mtime: current mtime of the file key is read from
+        """
+        self._load()
+        metadata = self._entries.get(cpv)
+        if metadata is None:
+            return None
+        entry = metadata.get(key)
+        if entry is None:
+            return None
+        if entry[0] != mtime:
+            del metadata[key]
+            self._dirty = True
+            return None
+        return entry[1]
+
+    def update(self, cpv, key, mtime, value):
+        """Record the value of key read for cpv.
+
+        :param mtime: mtime of the file key was read from, as of before the
+            read
+        """
+        self._load()
+        self._entries.setdefault(cpv, {})[key] = (mtime, value)
+        self._dirty = True
+
+    def discard(self, cpv):
+        """Drop the entry of cpv, if any."""
+        self._load()
+        if self._entries.pop(cpv, None) is not None:
+            self._dirty = True
+
+    def __contains__(self, cpv):
+        self._load()
+        return cpv in self._entries
+
+    def __len__(self):
+        self._load()
+        return len(self._entries)
+
+    def write(self):
+        """Atomically replace the on disk cache, if anything changed."""
+        if not self._dirty:
+            return
+        tmp_path = "%s.update.%i" % (self.path, os.getpid())
+        ensure_dirs(os.path.dirname(self.path))
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(self.magic + '\n')
+                for cpv, metadata in sorted(self._entries.iteritems()):
+                    if not metadata:
+                        continue
+                    fields = [cpv]
+                    for key, (mtime, value) in sorted(metadata.iteritems()):
+                        fields.append('%s@%r=%s' % (
+                            key, mtime, value.encode('string_escape')))
+                    f.write('\t'.join(fields) + '\n')
+            os.rename(tmp_path, self.path)
+        except EnvironmentError:
+            try:
+                os.remove(tmp_path)
+            except EnvironmentError:
+                pass
+            raise
+        self._dirty = False
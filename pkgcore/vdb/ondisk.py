@@ -16,14 +16,18 @@ from snakeoil.osutils import listdir_dirs, pjoin
 
 from pkgcore.config import ConfigHint
 from pkgcore.ebuild import ebuild_built
+from pkgcore.ebuild.atom import atom
 from pkgcore.ebuild.cpv import versioned_CPV
 from pkgcore.ebuild.errors import InvalidCPV
 from pkgcore.repository import errors, multiplex, prototype
+from pkgcore.restrictions.util import collect_package_restrictions
 
 demandload(
     'pkgcore.log:logger',
     'pkgcore.vdb:repo_ops',
     'pkgcore.vdb.contents:ContentsFile',
+    'pkgcore.vdb.metadata_cache:MetadataCache',
+    'pkgcore.vdb.owners:OwnersIndex',
 )
 
 
@@ -145,11 +149,107 @@ class tree(prototype.tree):
         "source_repository": "repository", "fullslot": "SLOT"
     }
 
+    @klass.jit_attr
+    def metadata_cache(self):
+        """:obj:`pkgcore.vdb.metadata_cache.MetadataCache` in our cache_location
+
+        None if caching is disabled.  The cache is written out after
+        installs and uninstalls, and when the cache is flushed.
+        """
+        if self.cache_location is None:
+            return None
+        return MetadataCache(pjoin(self.cache_location, 'metadata'))
+
+    @klass.jit_attr
+    def owners_index(self):
+        """:obj:`pkgcore.vdb.owners.OwnersIndex` in our cache_location
+
+        None if caching is disabled.  Use :obj:`get_owners_index` to get it
+        brought up to date with the vdb first.
+        """
+        if self.cache_location is None:
+            return None
+        return OwnersIndex(pjoin(self.cache_location, 'owners'))
+
+    def get_owners_index(self, rebuild=False):
+        """Return :obj:`owners_index` once it covers the vdb as is.
+
+        Every package's CONTENTS is stat'd, those whose mtime changed since
+        the index last saw them are reparsed, and the index is written out.
+        Packages whose CONTENTS fail to parse are logged, and recorded as
+        unknown.
+
+        :param rebuild: reparse the CONTENTS of every package
+        :return: the index, or None if caching is disabled or the vdb is
+            inaccessible
+        """
+        index = self.owners_index
+        if index is None:
+            return None
+        if not os.path.isdir(self.location):
+            return None
+        if rebuild:
+            index.clear()
+        self._sync_owners_index(index)
+        try:
+            index.write()
+        except EnvironmentError as e:
+            logger.warning("failed writing vdb owners index %r: %s", index.path, e)
+        return index
+
+    def _sync_owners_index(self, index):
+        seen = set()
+        for category in self._get_categories():
+            try:
+                dirs = listdir_dirs(pjoin(self.location, category))
+            except EnvironmentError:
+                continue
+            for x in dirs:
+                if x.startswith(".tmp.") or x.endswith(".lockfile") \
+                        or x.startswith("-MERGING-"):
+                    continue
+                cpv = "%s/%s" % (category, x)
+                seen.add(cpv)
+                index.update(cpv, pjoin(self.location, category, x))
+        for cpv in [x for x in index if x not in seen]:
+            index.discard(cpv)
+
+    def _get_prefilter(self, restrict):
+        if self.cache_location is None or isinstance(restrict, atom) or \
+                next(collect_package_restrictions(restrict, ("contents",)), None) is None:
+            return None
+        index = self.get_owners_index()
+        if index is None:
+            return None
+        cpvs = index.candidates(restrict)
+        if cpvs is None:
+            return None
+        return lambda pkg: pkg.cpvstr in cpvs
+
     def _get_metadata(self, pkg):
-        return IndeterminantDict(
-            partial(self._internal_load_key, pjoin(
-                self.location, pkg.category,
-                "%s-%s" % (pkg.package, pkg.fullver))))
+        path = pjoin(self.location, pkg.category,
+                     "%s-%s" % (pkg.package, pkg.fullver))
+        return IndeterminantDict(partial(self._load_key, path, pkg.cpvstr))
+
+    def _load_key(self, path, cpv, key):
+        cache = self.metadata_cache
+        name = self._metadata_rewrites.get(key, key)
+        if cache is None or name in self._uncached_keys:
+            return self._internal_load_key(path, key)
+        try:
+            mtime = os.stat(pjoin(path, name)).st_mtime
+        except EnvironmentError as e:
+            if e.errno == errno.ENOENT:
+                raise KeyError((path, key))
+            return self._internal_load_key(path, key)
+        data = cache.get(cpv, name, mtime)
+        if data is None:
+            data = self._internal_load_key(path, key)
+            cache.update(cpv, name, mtime, data)
+        return data
+
+    # keys not read from a single file named after them.
+    _uncached_keys = frozenset(["contents", "environment", "ebuild", "repo"])
 
     def _internal_load_key(self, path, key):
         key = self._metadata_rewrites.get(key, key)
@@ -180,6 +280,19 @@ class tree(prototype.tree):
                 raise KeyError((path, key))
         return data
 
+    # metadata loaded when regenerating the metadata cache; what resolving
+    # against the installed packages typically pulls.
+    _regen_keys = (
+        "EAPI", "SLOT", "KEYWORDS", "IUSE", "USE", "DEPEND", "RDEPEND", "PDEPEND",
+        "LICENSE", "RESTRICT", "PROPERTIES", "REQUIRED_USE", "INHERITED",
+        "DEFINED_PHASES", "repository", "CHOST", "CBUILD", "CTARGET")
+
+    def _regen_operation_helper(self, **kwds):
+        def regen(pkg):
+            for key in self._regen_keys:
+                pkg.data.get(key)
+        return regen
+
     def notify_remove_package(self, pkg):
         remove_it = len(self.packages[pkg.category]) == 1
         prototype.tree.notify_remove_package(self, pkg)
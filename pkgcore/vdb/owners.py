@@ -0,0 +1,275 @@
+# Copyright: 2015 Brian Harring <ferringb@gmail.com>
+# License: GPL2/BSD
+
+"""
+file ownership index for the installed package database
+
+Finding the packages owning a path otherwise means parsing the CONTENTS
+file of every installed package.  The index records the paths each package
+owns alongside the mtime of its CONTENTS file, so a stat per package tells
+which ones need reparsing (see :obj:`pkgcore.vdb.ondisk.tree.get_owners_index`);
+the vdb directory mtimes aren't enough, rewriting CONTENTS in place leaves
+them untouched.  Packages whose CONTENTS couldn't be parsed are recorded as
+such, and considered a potential owner of everything.
+"""
+
+__all__ = ("OwnersIndex",)
+
+import errno
+from itertools import chain
+import os
+
+from snakeoil.osutils import ensure_dirs
+
+from pkgcore.log import logger
+from pkgcore.restrictions import boolean, packages, restriction, values
+from pkgcore.vdb.contents import iter_contents_paths
+
+
+class OwnersIndex(object):
+
+    """
+    mapping of cpv to the paths it owns, and of paths to their owners
+    """
+
+    magic = 'pkgcore-vdb-owners 2'
+
+    def __init__(self, path):
+        self.path = path
+        self._records = None
+        self._unknown = None
+        self._owners = None
+        self._built = False
+        self._dirty = False
+
+    def _load(self):
+        if self._records is not None:
+            return
+        self._records = records = {}
+        self._unknown = unknown = {}
+        try:
+            with open(self.path) as f:
+                if f.readline().rstrip('\n') != self.magic:
+                    logger.warning(
+                        "ignoring vdb owners index %r: unknown format", self.path)
+                    return
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if fields[0].startswith('?'):
+                        unknown[fields[0][1:]] = \
+                            float(fields[1]) if len(fields) > 1 else None
+                        continue
+                    records[fields[0]] = (
+                        float(fields[1]),
+                        tuple(x.decode('string_escape') for x in fields[2:]))
+                self._built = True
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except (ValueError, IndexError) as e:
+            logger.warning("ignoring corrupt vdb owners index %r: %s", self.path, e)
+            records.clear()
+            unknown.clear()
+
+    def _get_owners(self):
+        if self._owners is None:
+            self._load()
+            self._owners = owners = {}
+            for cpv, (mtime, paths) in self._records.iteritems():
+                for path in paths:
+                    owners.setdefault(path, []).append(cpv)
+        return self._owners
+
+    @property
+    def built(self):
+        """Has the index been written out before?"""
+        self._load()
+        return self._built
+
+    def mtime(self, cpv):
+        """Return the CONTENTS mtime recorded for cpv, None if unknown."""
+        self._load()
+        record = self._records.get(cpv)
+        if record is None:
+            return self._unknown.get(cpv)
+        return record[0]
+
+    def add(self, cpv, mtime, paths):
+        """Record the paths owned by cpv, replacing any previous record.
+
+        :param mtime: current mtime of the package's CONTENTS file, -1 if
+            it has none
+        """
+        self.discard(cpv)
+        paths = tuple(paths)
+        self._records[cpv] = (mtime, paths)
+        if self._owners is not None:
+            for path in paths:
+                self._owners.setdefault(path, []).append(cpv)
+        self._dirty = True
+
+    def update(self, cpv, path):
+        """Bring the record of cpv up to date with its vdb directory.
+
+        CONTENTS is only reparsed if its mtime differs from the recorded
+        one; if that fails, it's logged and cpv is recorded as unknown.
+        """
+        contents = os.path.join(path, 'CONTENTS')
+        mtime = None
+        try:
+            try:
+                mtime = os.stat(contents).st_mtime
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                mtime = -1.0
+            if self.mtime(cpv) != mtime:
+                self.add(cpv, mtime, iter_contents_paths(contents))
+        except (EnvironmentError, ValueError) as e:
+            logger.warning("failed indexing the CONTENTS of %s: %s", cpv, e)
+            self.add_unknown(cpv, mtime)
+
+    def add_unknown(self, cpv, mtime=None):
+        """Record that the paths owned by cpv couldn't be determined.
+
+        Until it's added again, cpv is a candidate for every query.
+
+        :param mtime: mtime of the CONTENTS file that failed to parse, so it
+            isn't retried until it changes; None to retry on every update
+        """
+        self.discard(cpv)
+        self._unknown[cpv] = mtime
+        self._dirty = True
+
+    def discard(self, cpv):
+        """Drop the record of cpv, if any."""
+        self._load()
+        if cpv in self._unknown:
+            del self._unknown[cpv]
+            self._dirty = True
+        record = self._records.pop(cpv, None)
+        if record is None:
+            return
+        if self._owners is not None:
+            for path in record[1]:
+                l = self._owners[path]
+                l.remove(cpv)
+                if not l:
+                    del self._owners[path]
+        self._dirty = True
+
+    def clear(self):
+        """Drop all records, forcing the index to be rebuilt."""
+        self._load()
+        self._records.clear()
+        self._unknown.clear()
+        self._owners = None
+        self._dirty = True
+
+    def owners(self, *paths):
+        """Return the cpvs owning any of the given (normalized) paths."""
+        owners = self._get_owners()
+        result = set()
+        for path in paths:
+            result.update(owners.get(path, ()))
+        return frozenset(result)
+
+    def iter_owners(self, match):
+        """Yield (path, cpvs) pairs for every owned path match accepts."""
+        for path, cpvs in self._get_owners().iteritems():
+            if match(path):
+                yield path, frozenset(cpvs)
+
+    def candidates(self, restrict):
+        """Return the cpvs that may match restrict, or None if unanswerable.
+
+        Restrictions on contents checking for given paths or for paths
+        matching a value restriction (what pquery's --owns and --owns-re
+        generate) are answerable, as are and/or combinations of them.
+        Packages recorded via :meth:`add_unknown` are always included.
+        """
+        result = self._candidates(restrict)
+        if result is None or not self._unknown:
+            return result
+        return result.union(self._unknown)
+
+    def _candidates(self, restrict):
+        if restrict.negate:
+            return None
+        if isinstance(restrict, packages.PackageRestriction):
+            if restrict.conditional or restrict.attr != 'contents':
+                return None
+            return self._contents_candidates(restrict.restriction)
+        if type(restrict) not in (boolean.AndRestriction, boolean.OrRestriction) \
+                or restrict.type != packages.package_type:
+            return None
+        results = [self._candidates(x) for x in restrict.restrictions]
+        if isinstance(restrict, boolean.AndRestriction):
+            results = [x for x in results if x is not None]
+            if not results:
+                return None
+            return frozenset.intersection(*results)
+        if not results or None in results:
+            return None
+        return frozenset.union(*results)
+
+    def _contents_candidates(self, restrict):
+        if restrict.negate:
+            return None
+        if isinstance(restrict, values.ContainmentMatch2):
+            paths = [getattr(x, 'location', x) for x in restrict.vals]
+            if restrict.all:
+                if not paths:
+                    return None
+                return frozenset.intersection(*[self.owners(x) for x in paths])
+            return self.owners(*paths)
+        if isinstance(restrict, restriction.AnyMatch):
+            child = restrict.restriction
+            if not isinstance(child, values.GetAttrRestriction) or \
+                    child.attr != 'location' or child.negate:
+                return None
+            result = set()
+            for path, cpvs in self.iter_owners(child.restriction.match):
+                result.update(cpvs)
+            return frozenset(result)
+        return None
+
+    def __contains__(self, cpv):
+        self._load()
+        return cpv in self._records or cpv in self._unknown
+
+    def __iter__(self):
+        self._load()
+        return chain(self._records, self._unknown)
+
+    def __len__(self):
+        self._load()
+        return len(self._records) + len(self._unknown)
+
+    def write(self):
+        """Atomically replace the on disk index, if anything changed."""
+        if not self._dirty:
+            return
+        tmp_path = "%s.update.%i" % (self.path, os.getpid())
+        ensure_dirs(os.path.dirname(self.path))
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(self.magic + '\n')
+                for cpv, (mtime, paths) in sorted(self._records.iteritems()):
+                    fields = [cpv, repr(mtime)]
+                    fields.extend(x.encode('string_escape') for x in paths)
+                    f.write('\t'.join(fields) + '\n')
+                for cpv, mtime in sorted(self._unknown.iteritems()):
+                    if mtime is None:
+                        f.write('?%s\n' % (cpv,))
+                    else:
+                        f.write('?%s\t%r\n' % (cpv, mtime))
+            os.rename(tmp_path, self.path)
+        except EnvironmentError:
+            try:
+                os.remove(tmp_path)
+            except EnvironmentError:
+                pass
+            raise
+        self._built = True
+        self._dirty = False
@@ -1,7 +1,10 @@
 # Copyright: 2005-2011 Brian Harring <ferringb@gmail.com>
 # License: GPL2/BSD
 
-__all__ = ("install", "uninstall", "replace", "operations")
+__all__ = (
+    "install", "uninstall", "replace", "operations", "write_metadata_cache",
+    "update_owners_index",
+)
 
 import os
 import shutil
@@ -11,6 +14,7 @@ from snakeoil.demandload import demandload
 from snakeoil.osutils import ensure_dirs, pjoin, normpath
 
 from pkgcore.const import VERSION
+from pkgcore.operations import is_standalone
 from pkgcore.operations import repo as repo_ops
 
 demandload(
@@ -32,6 +36,41 @@ def update_mtime(path, timestamp=None):
         logger.error("failed updated vdb timestamp for %r: %s", path, e)
 
 
+def write_metadata_cache(repo, *discard):
+    """Write out the metadata cache of repo, dropping the given cpvs first."""
+    cache = getattr(repo, 'metadata_cache', None)
+    if cache is None:
+        return
+    for cpv in discard:
+        cache.discard(cpv)
+    try:
+        cache.write()
+    except EnvironmentError as e:
+        logger.warning("failed writing vdb metadata cache %r: %s", cache.path, e)
+
+
+def update_owners_index(repo, cpv, path=None):
+    """Apply a merge or unmerge to the file ownership index of repo.
+
+    Indexes that were never built are left for
+    :obj:`pkgcore.vdb.ondisk.tree.get_owners_index` to build on demand.
+
+    :param cpv: cpv merged or unmerged
+    :param path: vdb directory of cpv if it was merged, None if unmerged
+    """
+    index = getattr(repo, 'owners_index', None)
+    if index is None or not index.built:
+        return
+    if path is None:
+        index.discard(cpv)
+    else:
+        index.update(cpv, path)
+    try:
+        index.write()
+    except EnvironmentError as e:
+        logger.warning("failed writing vdb owners index %r: %s", index.path, e)
+
+
 class install(repo_ops.install):
 
     def __init__(self, repo, newpkg, observer):
@@ -121,6 +160,8 @@ class install(repo_ops.install):
     def finalize_data(self):
         os.rename(self.tmp_write_path, self.install_path)
         update_mtime(self.repo.location)
+        write_metadata_cache(self.repo, self.new_pkg.cpvstr)
+        update_owners_index(self.repo, self.new_pkg.cpvstr, self.install_path)
         return True
 
 
@@ -138,6 +179,8 @@ class uninstall(repo_ops.uninstall):
         update_mtime(self.repo.location)
         shutil.rmtree(self.remove_path)
         update_mtime(self.repo.location)
+        write_metadata_cache(self.repo, self.old_pkg.cpvstr)
+        update_owners_index(self.repo, self.old_pkg.cpvstr)
         return True
 
 
@@ -168,6 +211,14 @@ class operations(repo_ops.operations):
 
     _regen_disable_threads = True
 
+    @is_standalone
+    def _cmd_api_flush_cache(self, observer=None):
+        repo_ops.operations._cmd_api_flush_cache(self, observer=observer)
+        write_metadata_cache(self.repo)
+        get_index = getattr(self.repo, 'get_owners_index', None)
+        if get_index is not None:
+            get_index()
+
     def _cmd_implementation_install(self, pkg, observer):
         return install(self.repo, pkg, observer)
 